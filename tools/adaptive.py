@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+
+import crunch_utils
+
+from manifest import RunManifest
+from plot import load_metrics_files
+
+# Adaptive run counts: rather than always doing the same number of runs at
+# every RPS, keep going at an RPS until we know the numbers we care about
+# well enough. After each run, we take each run's steady-state mean of every
+# key field (filtered exactly the way CorrelatedMetrics filters it for
+# plotting) and work out a 95% confidence interval for the mean across runs.
+# Once every key field's CI half-width is within target (as a fraction of
+# its mean), we're done with that RPS.
+
+key_fields = [ "data-plane CPU", "data-plane mem", "RPS" ]
+
+
+def run_means(outdir, rps, seq):
+    """
+    Return a dictionary of the steady-state mean of each key field for one
+    run, given where its files are. "RPS" is the achieved RPS across all the
+    load generator pods. Fields the run didn't have are left out.
+    """
+    paths = [ os.path.join(outdir, name) for name in RunManifest.run_files(outdir, rps, seq) ]
+    means = {}
+    achieved = None
+
+    for metrics_file in load_metrics_files(paths, fields=key_fields):
+        if metrics_file.kind == "Latency":
+            achieved = (achieved or 0) + metrics_file.rps
+            continue
+
+        for fieldname in key_fields:
+            if metrics_file.data.get(fieldname):
+                steady = crunch_utils.steady_state(np.array(metrics_file.data[fieldname]), "Usage")
+                means[fieldname] = float(np.mean(steady["filtered"]))
+
+    if achieved is not None:
+        means["RPS"] = achieved
+
+    return means
+
+
+class AdaptiveRuns:
+    """
+    AdaptiveRuns decides when we've done enough runs at each RPS. Call
+    add() after each run, then done() to find out whether to stop.
+    """
+
+    def __init__(self, target=0.05, min_runs=2, max_runs=10):
+        self.target = target
+        self.min_runs = min_runs
+        self.max_runs = max_runs
+
+        # Per (outdir, RPS), the list of per-run means from run_means().
+        self.history = {}
+
+    def add(self, outdir, rps, seq):
+        self.history.setdefault((outdir, rps), []).append(run_means(outdir, rps, seq))
+
+    def intervals(self, outdir, rps):
+        """
+        Return a dictionary mapping each key field to (mean, CI half-width)
+        across the runs so far at this RPS.
+        """
+        runs = self.history.get((outdir, rps), [])
+        intervals = {}
+
+        for fieldname in key_fields:
+            values = [ means[fieldname] for means in runs if fieldname in means ]
+
+            if values:
+                intervals[fieldname] = crunch_utils.confidence_interval(values)
+
+        return intervals
+
+    def done(self, outdir, rps):
+        """
+        Return whether we're done at this RPS, and a one-line summary of
+        why.
+        """
+        count = len(self.history.get((outdir, rps), []))
+        runs = f"{count} run{'' if count == 1 else 's'}"
+        intervals = self.intervals(outdir, rps)
+
+        summary = ", ".join(f"{fieldname} {mean:.1f} ±{half_width:.1f}"
+                            for fieldname, (mean, half_width) in intervals.items())
+
+        if count >= self.max_runs:
+            return True, f"{runs}, the maximum ({summary})"
+
+        if count < self.min_runs:
+            return False, f"{runs}, below the minimum of {self.min_runs} ({summary})"
+
+        # A mean of zero (e.g. data-plane usage with no mesh) is as settled
+        # as it gets.
+        wide = [ fieldname for fieldname, (mean, half_width) in intervals.items()
+                 if mean != 0 and half_width > abs(mean) * self.target ]
+
+        if wide:
+            return False, f"{runs}, CI still too wide for {', '.join(wide)} ({summary})"
+
+        return True, f"{runs}, all CIs within {self.target:.0%} ({summary})"
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+import csv
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from kubernetes import client
+
+import fake_cluster
+
+from metrics import AggregateUsage, collector_names
+
+# Drive AggregateUsage against a series of ever-larger fake clusters (see
+# fake_cluster.py) and report how long each sample takes, how much it
+# allocates, and how big the process gets. The fake API server runs in its
+# own process, so the time it spends building responses shows up as request
+# latency (like a real API server would) rather than as collector CPU.
+
+
+def parse_size(size):
+    """
+    Parse a cluster size: NODESxPODS, where PODS is application pods per
+    node.
+    """
+    try:
+        nodes, pods = size.lower().split("x")
+        return int(nodes), int(pods)
+    except ValueError:
+        raise ValueError(f"invalid cluster size: {size} (expected NODESxPODS, e.g. 200x100)")
+
+
+def current_rss():
+    """
+    Current resident set size in bytes, or None if we can't tell.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss():
+    """
+    Peak resident set size in bytes, over the life of the process.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports KiB, macOS reports bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class TimedCollector:
+    """
+    Wrap a collector to keep track of how long each fetch() takes, so that we
+    can split a sample into fetching and aggregation.
+    """
+
+    def __init__(self, collector):
+        self.collector = collector
+        self.times = []
+        self.containers = 0
+
+    def fetch(self):
+        start = time.perf_counter()
+        metrics, timing = self.collector.fetch()
+        self.times.append(time.perf_counter() - start)
+        self.containers = len(metrics)
+        return metrics, timing
+
+
+def bench(nodes, pods_per_node, containers, mesh, collector, samples, workers, outdir):
+    ctx = multiprocessing.get_context("spawn")
+    ready = ctx.Queue()
+
+    options = {
+        "nodes": nodes,
+        "pods_per_node": pods_per_node,
+        "containers": containers,
+        "mesh": mesh,
+        # Every request gets a fresh scrape, so no sample is stale.
+        "scrape_interval": 0,
+    }
+
+    server = ctx.Process(target=fake_cluster.serve, args=(options, ready), daemon=True)
+    server.start()
+
+    try:
+        configuration = client.Configuration()
+        configuration.host = ready.get(timeout=300)
+        client.Configuration.set_default(configuration)
+
+        csv_path = os.path.join(outdir, f"{nodes}x{pods_per_node}-metrics.csv")
+
+        start = time.perf_counter()
+        agg = AggregateUsage(client, csv_path, workers=workers, collector=collector)
+        setup_time = time.perf_counter() - start
+
+        timed = TimedCollector(agg.collector)
+        agg.collector = timed
+
+        # We want to time the whole sample, CSV writing included, so don't
+        # wait for the fake Faces to go idle.
+        if not agg.is_collecting():
+            agg.start_collecting()
+
+        # The first sample classifies every container and builds all the
+        # routes, so it gets reported on its own.
+        start = time.perf_counter()
+        agg.sample()
+        first_time = time.perf_counter() - start
+
+        sample_times = []
+
+        for _ in range(samples):
+            start = time.perf_counter()
+            agg.sample()
+            sample_times.append(time.perf_counter() - start)
+
+        fetch_times = timed.times[1:]
+
+        # Allocations get measured on a separate sample, since tracemalloc
+        # slows everything down.
+        tracemalloc.start()
+        agg.sample()
+        retained, allocated = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        agg.close()
+    finally:
+        server.terminate()
+        server.join()
+
+    sample_median = statistics.median(sample_times)
+    fetch_median = statistics.median(fetch_times)
+
+    return {
+        "nodes": nodes,
+        "pods": nodes * pods_per_node,
+        "containers": timed.containers,
+        "setup ms": setup_time * 1000,
+        "first sample ms": first_time * 1000,
+        "sample ms": sample_median * 1000,
+        "max sample ms": max(sample_times) * 1000,
+        "fetch ms": fetch_median * 1000,
+        "aggregate ms": (sample_median - fetch_median) * 1000,
+        "peak alloc MiB": allocated / 1048576,
+        "retained alloc MiB": retained / 1048576,
+        "rss MiB": (current_rss() or 0) / 1048576,
+        "peak rss MiB": peak_rss() / 1048576,
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the collector against fake clusters of increasing size.")
+    parser.add_argument("--sizes", type=str, default="3x10,10x50,50x100,200x100", help="Comma-separated cluster sizes, as NODESxPODS-PER-NODE (default: 3x10,10x50,50x100,200x100)")
+    parser.add_argument("--containers", type=int, default=1, help="Application containers per pod, not counting sidecars (default: 1)")
+    parser.add_argument("--mesh", type=str, choices=fake_cluster.mesh_layouts, default="sidecar", help="Mesh layout (default: sidecar)")
+    parser.add_argument("--collector", type=str, choices=collector_names, default="metrics-server", help="Collector to benchmark (default: metrics-server)")
+    parser.add_argument("--samples", type=int, default=5, help="Samples to time at each size (default: 5)")
+    parser.add_argument("--workers", type=int, default=8, help="Collector worker threads (default: 8)")
+    parser.add_argument("--output", type=str, help="Also write the results to this CSV file")
+
+    args = parser.parse_args()
+
+    try:
+        sizes = [ parse_size(size) for size in args.sizes.split(",") ]
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    results = []
+
+    # Sizes run smallest first, since peak RSS only ever goes up.
+    sizes.sort(key=lambda size: size[0] * size[1])
+
+    with tempfile.TemporaryDirectory() as outdir:
+        for nodes, pods_per_node in sizes:
+            print(f"Benchmarking {nodes} nodes x {pods_per_node} pods...", flush=True)
+
+            results.append(bench(nodes, pods_per_node, args.containers, args.mesh,
+                                 args.collector, args.samples, args.workers, outdir))
+
+    columns = list(results[0].keys())
+
+    print("")
+    print(" ".join(f"{column:>12s}" if len(column) <= 12 else f"{column:>{len(column)}s}" for column in columns))
+
+    for result in results:
+        print(" ".join(f"{result[column]:>{max(12, len(column))}.1f}" if isinstance(result[column], float)
+                       else f"{result[column]:>{max(12, len(column))}d}"
+                       for column in columns))
+
+    if args.output:
+        with open(args.output, "w", newline="") as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=columns)
+            writer.writeheader()
+
+            for result in results:
+                writer.writerow({ k: (f"{v:.3f}" if isinstance(v, float) else v) for k, v in result.items() })
+
+
+if __name__ == "__main__":
+    main()
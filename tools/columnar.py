@@ -0,0 +1,127 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+# A columnar metrics file is a small header followed by raw float64 rows:
+#
+#   magic (8 bytes) | header length (4 bytes, little-endian) | JSON header
+#   | padding to a multiple of 64 bytes | row | row | ...
+#
+# The JSON header is the schema: {"fields": [...], "dtype": "<f8"}. Rows are
+# written as they're sampled, so a run that dies partway through still has
+# everything up to that point, and the whole thing can be memory-mapped for
+# reading. Missing cells are NaN, and the timestamp is seconds since the
+# epoch.
+#
+# Once a run is done, compact() rewrites the file as a compressed NPZ with one
+# array per column, dropping the columns that never had any data. That's the
+# format to keep around: it's much smaller on disk, and np.load only
+# decompresses the columns you actually ask for.
+
+MAGIC = b"GSDCOL1\n"
+ALIGNMENT = 64
+
+extensions = ( ".col", ".npz" )
+
+
+def is_columnar(path):
+    return path.endswith(extensions)
+
+
+class ColumnarWriter:
+    def __init__(self, path, field_names):
+        self.path = path
+        self.field_names = list(field_names)
+        self.output = open(path, "wb")
+
+        header = json.dumps({ "fields": self.field_names, "dtype": "<f8" }).encode("utf-8")
+        used = len(MAGIC) + 4 + len(header)
+        padding = (-used) % ALIGNMENT
+
+        self.output.write(MAGIC)
+        self.output.write(struct.pack("<I", len(header) + padding))
+        self.output.write(header + b" " * padding)
+        self.output.flush()
+
+    def append(self, row):
+        """
+        Append a single row, which must have exactly one value per field.
+        """
+        row = np.asarray(row, dtype="<f8")
+
+        if row.shape != (len(self.field_names),):
+            raise ValueError(f"row has {row.shape} values, expected {len(self.field_names)}")
+
+        self.output.write(row.tobytes())
+        self.output.flush()
+
+    def close(self):
+        if self.output:
+            self.output.close()
+            self.output = None
+
+
+def read_header(infile):
+    if infile.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{getattr(infile, 'name', infile)} is not a columnar metrics file")
+
+    header_length = struct.unpack("<I", infile.read(4))[0]
+    header = json.loads(infile.read(header_length).decode("utf-8"))
+
+    return header, len(MAGIC) + 4 + header_length
+
+
+def load(infile):
+    """
+    Load a columnar metrics file (either the raw appendable format or the
+    compacted NPZ) and return a dict of field name to NumPy array. Raw files
+    are memory-mapped; NPZ columns are only decompressed when they're
+    accessed.
+    """
+    start = infile.tell()
+    magic = infile.read(len(MAGIC))
+    infile.seek(start)
+
+    if magic != MAGIC:
+        return np.load(infile)
+
+    header, offset = read_header(infile)
+    fields = header["fields"]
+    dtype = np.dtype(header["dtype"])
+
+    size = os.fstat(infile.fileno()).st_size
+    rows = (size - offset) // (dtype.itemsize * len(fields))
+
+    if rows == 0:
+        return { field: np.zeros(0, dtype=dtype) for field in fields }
+
+    # A run that died partway through a write might leave a partial row at
+    # the end; the shape here just leaves it out.
+    data = np.memmap(infile, dtype=dtype, mode="r", offset=offset, shape=(rows, len(fields)))
+
+    return { field: data[:, i] for i, field in enumerate(fields) }
+
+
+def compact(path, remove=True):
+    """
+    Rewrite a raw columnar file as a compressed NPZ next to it, dropping
+    columns that are entirely empty, and return the new path.
+    """
+    with open(path, "rb") as infile:
+        columns = load(infile)
+
+        kept = {
+            field: np.array(values)
+            for field, values in columns.items()
+            if not np.all(np.isnan(values))
+        }
+
+    npz_path = os.path.splitext(path)[0] + ".npz"
+    np.savez_compressed(npz_path, **kept)
+
+    if remove:
+        os.remove(path)
+
+    return npz_path
@@ -1,6 +1,13 @@
 import os
 import re
 
+import numpy as np
+
+# In ramp mode, the load generator prints one of these before each step's
+# output, with the step number (from 0) and the step's total target RPS.
+ramp_marker = "=== ramp step {step}: {rps} RPS ==="
+ramp_marker_re = re.compile(r"^=== ramp step (\d+): (\d+) RPS ===$", re.MULTILINE)
+
 def parse_filename(filename, suffix):
     dir, file = os.path.split(filename)
 
@@ -27,3 +34,69 @@ def parse_filename(filename, suffix):
         raise Exception("Unrecognized file name %s" % file)
 
     return (mesh, rps, seq)
+
+
+def steady_state(dataset, kind):
+    """
+    Filter a NumPy array of samples of one field from one run down to its
+    steady state. Returns a dictionary with the mean and standard deviation
+    of the slope-filtered data, the slope-filtered data itself ("data"), and
+    that with outliers removed too ("filtered").
+    """
+    if kind == "Usage":
+        # The way our usage data are structured, we'll always see resource
+        # consumption climbing from close to zero at the start, then dropping
+        # off to something probably close to zero at the end. This means that
+        # the mean will always be _below_ the steady state value, so we can
+        # filter out the rising and falling slopes of the data by tossing
+        # samples that are less than the mean.
+        d2 = dataset[(dataset - np.mean(dataset)) > 0]
+
+        # As a safety, if that got rid of more than half our samples, just
+        # use the original dataset.
+        if len(d2) >= (len(dataset) / 2):
+            dataset = d2
+
+    # Next, calculate mean and standard deviation for this data set...
+    mean = np.mean(dataset)
+    stddev = np.std(dataset)
+
+    # ...and filter out outliers.
+    filtered_dataset = dataset[np.abs(dataset - mean) <= 1 * stddev]
+
+    return {
+        "mean": mean,
+        "stddev": stddev,
+        "data": dataset,
+        "filtered": filtered_dataset,
+    }
+
+
+# Two-sided 95% critical values of Student's t distribution, by degrees of
+# freedom. Past 30, the normal distribution's 1.96 is close enough.
+t_95 = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571,
+    6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+    11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131,
+    16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093, 20: 2.086,
+    21: 2.080, 22: 2.074, 23: 2.069, 24: 2.064, 25: 2.060,
+    26: 2.056, 27: 2.052, 28: 2.048, 29: 2.045, 30: 2.042,
+}
+
+
+def confidence_interval(values):
+    """
+    Return the mean of values and the half-width of its 95% confidence
+    interval, treating values as independent samples (e.g. one per run).
+    The half-width is infinite if there are fewer than two values.
+    """
+    values = np.asarray(values, dtype=float)
+    mean = float(np.mean(values)) if len(values) else float("nan")
+
+    if len(values) < 2:
+        return mean, float("inf")
+
+    t = t_95.get(len(values) - 1, 1.960)
+    half_width = t * float(np.std(values, ddof=1)) / np.sqrt(len(values))
+
+    return mean, half_width
@@ -0,0 +1,453 @@
+#!/usr/bin/env python
+
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+# FakeCluster is a synthetic stand-in for the parts of the Kubernetes API that
+# the collector talks to, so that we can see how the collector holds up with
+# hundreds of nodes and tens of thousands of containers without having to
+# actually build that cluster. It serves:
+#
+# - /api/v1/nodes
+# - /api/v1/pods (including ?watch=true, which just holds the connection open
+#   until its timeout, since the fake cluster never changes)
+# - /api/v1/namespaces/NAMESPACE/pods/NAME
+#
+# (pods come back as a Table if the Accept header asks for one, just like a
+# real API server)
+#
+# - /apis/metrics.k8s.io/v1beta1/pods
+# - /api/v1/nodes/NODE/proxy/stats/summary
+#
+# The cluster looks roughly like the one we actually benchmark: a kube-proxy
+# on every node and some CoreDNS replicas in kube-system, plus a bunch of
+# application Deployments in the faces namespace, spread evenly across the
+# nodes. The mesh layout adds the mesh on top:
+#
+# - "none": no mesh at all
+# - "sidecar": a linkerd-proxy container in every application pod, plus the
+#   Linkerd control plane in the linkerd namespace
+# - "ambient": a ztunnel on every node and istiod in istio-system, plus
+#   waypoints in the faces namespace
+#
+# Usage numbers are random but repeatable (they come from a seeded RNG), and
+# wobble a little from one scrape to the next.
+
+mesh_layouts = [ "none", "sidecar", "ambient" ]
+
+
+def rfc3339(when):
+    # Whole seconds unless we need more, like the real API server.
+    stamp = datetime.fromtimestamp(when, timezone.utc)
+
+    if stamp.microsecond:
+        return stamp.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+    return stamp.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def template_hash(name):
+    return hashlib.sha1(name.encode("utf-8")).hexdigest()[:10]
+
+
+class FakeCluster:
+    def __init__(self, nodes=3, pods_per_node=10, containers=1, mesh="sidecar",
+                 deployments=10, scrape_interval=15.0, seed=1):
+        if mesh not in mesh_layouts:
+            raise ValueError(f"Unknown mesh layout: {mesh}")
+
+        self.mesh = mesh
+        self.scrape_interval = scrape_interval
+        self.started = time.time()
+        self.rng = random.Random(seed)
+
+        self.node_names = [ f"fake-node-{i:04d}" for i in range(nodes) ]
+        self.nodes = [ self.make_node(name) for name in self.node_names ]
+
+        self.pods = []
+
+        # One kube-proxy per node, plus CoreDNS.
+        for node in self.node_names:
+            self.add_pod("kube-system", f"kube-proxy-{node}", node, { "component": "kube-proxy" },
+                         [ "kube-proxy" ])
+
+        self.add_deployment("kube-system", "coredns", 2, [ "coredns" ])
+
+        # The application pods, spread evenly across the deployments.
+        app_pods = nodes * pods_per_node
+        app_containers = [ "app" ] + [ f"helper-{i}" for i in range(1, containers) ]
+
+        if mesh == "sidecar":
+            app_containers.append("linkerd-proxy")
+
+        for i in range(deployments):
+            count = app_pods // deployments + (1 if i < app_pods % deployments else 0)
+
+            if count:
+                self.add_deployment("faces", f"app-{i}", count, app_containers)
+
+        if mesh == "sidecar":
+            for name in [ "linkerd-destination", "linkerd-identity", "linkerd-proxy-injector" ]:
+                self.add_deployment("linkerd", name, 3, [ name.split("-", 1)[1], "linkerd-proxy" ])
+        elif mesh == "ambient":
+            for node in self.node_names:
+                self.add_pod("istio-system", f"ztunnel-{template_hash(node)[:5]}", node,
+                             { "app": "ztunnel" }, [ "istio-proxy" ])
+
+            self.add_deployment("istio-system", "istiod", 3, [ "discovery" ])
+            self.add_deployment("faces", "waypoint", max(1, nodes // 10), [ "istio-proxy" ])
+
+        self.by_name = { (pod["metadata"]["namespace"], pod["metadata"]["name"]): pod
+                         for pod in self.pods }
+
+        self.by_node = { name: [] for name in self.node_names }
+
+        for pod in self.pods:
+            self.by_node[pod["spec"]["nodeName"]].append(pod)
+
+        # Usage for every container: a base CPU rate (nanocores) and memory
+        # (bytes) that each scrape wobbles around, plus where in the wobble
+        # it starts.
+        self.usage = {}
+
+        for pod in self.pods:
+            for container in pod["spec"]["containers"]:
+                key = (pod["metadata"]["namespace"], pod["metadata"]["name"], container["name"])
+                self.usage[key] = (self.rng.randint(1_000_000, 200_000_000),
+                                   self.rng.randint(8, 256) * 1048576,
+                                   self.rng.uniform(0, 2 * math.pi))
+
+        self.containers = len(self.usage)
+
+        # Lists don't change, so we serialize them once up front.
+        self.node_list = self.encode({
+            "kind": "NodeList",
+            "apiVersion": "v1",
+            "metadata": { "resourceVersion": "1" },
+            "items": self.nodes,
+        })
+
+        self.pod_list = self.encode({
+            "kind": "PodList",
+            "apiVersion": "v1",
+            "metadata": { "resourceVersion": "1" },
+            "items": self.pods,
+        })
+
+        self.pod_table = self.encode(self.table(self.pods))
+
+    def encode(self, obj):
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    def table(self, pods):
+        """
+        Return pods as a Table, the way the API server does for kubectl: the
+        columns kubectl shows, plus each pod's metadata.
+        """
+        columns = [ "Name", "Ready", "Status", "Restarts", "Age", "IP", "Node",
+                    "Nominated Node", "Readiness Gates" ]
+
+        rows = []
+
+        for pod in pods:
+            containers = len(pod["spec"]["containers"])
+
+            rows.append({
+                "cells": [ pod["metadata"]["name"], f"{containers}/{containers}", "Running", 0,
+                           "1h", "10.0.0.1", pod["spec"]["nodeName"], "<none>", "<none>" ],
+                "object": {
+                    "kind": "PartialObjectMetadata",
+                    "apiVersion": "meta.k8s.io/v1",
+                    "metadata": pod["metadata"],
+                },
+            })
+
+        return {
+            "kind": "Table",
+            "apiVersion": "meta.k8s.io/v1",
+            "metadata": { "resourceVersion": "1" },
+            "columnDefinitions": [ { "name": name, "type": "string" } for name in columns ],
+            "rows": rows,
+        }
+
+    def make_node(self, name):
+        return {
+            "metadata": {
+                "name": name,
+                "labels": { "kubernetes.io/hostname": name },
+                "resourceVersion": "1",
+            },
+            "status": {
+                "allocatable": { "cpu": "8", "memory": "32Gi" },
+                "capacity": { "cpu": "8", "memory": "32Gi" },
+            },
+        }
+
+    def add_deployment(self, namespace, name, replicas, containers):
+        pthash = template_hash(f"{namespace}/{name}")
+
+        for i in range(replicas):
+            node = self.node_names[len(self.pods) % len(self.node_names)]
+            suffix = template_hash(f"{namespace}/{name}/{i}")[:5]
+
+            self.add_pod(namespace, f"{name}-{pthash}-{suffix}", node,
+                         { "app": name, "pod-template-hash": pthash }, containers)
+
+    def add_pod(self, namespace, name, node, labels, containers):
+        self.pods.append({
+            "metadata": {
+                "name": name,
+                "namespace": namespace,
+                "labels": labels,
+                "resourceVersion": "1",
+                "creationTimestamp": rfc3339(self.started),
+            },
+            "spec": {
+                "nodeName": node,
+                "containers": [ { "name": container } for container in containers ],
+            },
+            "status": { "phase": "Running" },
+        })
+
+    def scrape_time(self, now):
+        """
+        Return the time of the most recent scrape. With a scrape interval of
+        zero, every request gets a brand new scrape.
+        """
+        if not self.scrape_interval:
+            return now
+
+        return self.started + (now - self.started) // self.scrape_interval * self.scrape_interval
+
+    def wobble(self, key, scraped):
+        cpu, memory, phase = self.usage[key]
+
+        # Repeatable for a given container and scrape, and cheap, since we do
+        # this for every container on every request.
+        wave = math.sin(scraped / 60.0 + phase)
+        return int(cpu * (1 + 0.2 * wave)), int(memory * (1 + 0.05 * wave))
+
+    def pod_metrics(self, now):
+        scraped = self.scrape_time(now)
+        timestamp = rfc3339(scraped)
+        window = f"{self.scrape_interval or 15:g}s"
+
+        items = []
+
+        for pod in self.pods:
+            metadata = pod["metadata"]
+            containers = []
+
+            for container in pod["spec"]["containers"]:
+                cpu, memory = self.wobble((metadata["namespace"], metadata["name"], container["name"]), scraped)
+
+                containers.append({
+                    "name": container["name"],
+                    "usage": { "cpu": f"{cpu}n", "memory": f"{memory // 1024}Ki" },
+                })
+
+            items.append({
+                "metadata": {
+                    "name": metadata["name"],
+                    "namespace": metadata["namespace"],
+                    "labels": metadata["labels"],
+                    "creationTimestamp": metadata["creationTimestamp"],
+                },
+                "timestamp": timestamp,
+                "window": window,
+                "containers": containers,
+            })
+
+        return self.encode({
+            "kind": "PodMetricsList",
+            "apiVersion": "metrics.k8s.io/v1beta1",
+            "metadata": {},
+            "items": items,
+        })
+
+    def summary(self, node, now):
+        scraped = self.scrape_time(now)
+        timestamp = rfc3339(scraped)
+        elapsed = scraped - self.started
+
+        pods = []
+
+        for pod in self.by_node[node]:
+            metadata = pod["metadata"]
+            containers = []
+
+            for container in pod["spec"]["containers"]:
+                key = (metadata["namespace"], metadata["name"], container["name"])
+                cpu, memory = self.wobble(key, scraped)
+
+                containers.append({
+                    "name": container["name"],
+                    "startTime": metadata["creationTimestamp"],
+                    "cpu": {
+                        "time": timestamp,
+                        "usageNanoCores": cpu,
+                        "usageCoreNanoSeconds": int(self.usage[key][0] * elapsed),
+                    },
+                    "memory": { "time": timestamp, "workingSetBytes": memory },
+                })
+
+            pods.append({
+                "podRef": { "name": metadata["name"], "namespace": metadata["namespace"] },
+                "startTime": metadata["creationTimestamp"],
+                "containers": containers,
+            })
+
+        return self.encode({ "node": { "nodeName": node }, "pods": pods })
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    # Set by FakeAPIServer.
+    cluster = None
+    stopping = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, body, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def not_found(self):
+        self.send_json(self.cluster.encode({
+            "kind": "Status",
+            "apiVersion": "v1",
+            "status": "Failure",
+            "reason": "NotFound",
+            "code": 404,
+        }), status=404)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        path = unquote(url.path)
+        parts = path.strip("/").split("/")
+        now = time.time()
+
+        if path == "/api/v1/nodes":
+            self.send_json(self.cluster.node_list)
+        elif path == "/api/v1/pods":
+            if query.get("watch", [ "false" ])[0] in ("true", "1"):
+                self.hold_watch(float(query.get("timeoutSeconds", [ "300" ])[0]))
+            elif self.wants_table():
+                self.send_json(self.cluster.pod_table)
+            else:
+                self.send_json(self.cluster.pod_list)
+        elif path == "/apis/metrics.k8s.io/v1beta1/pods":
+            self.send_json(self.cluster.pod_metrics(now))
+        elif parts[:3] == [ "api", "v1", "namespaces" ] and len(parts) == 6 and parts[4] == "pods":
+            pod = self.cluster.by_name.get((parts[3], parts[5]))
+
+            if pod is None:
+                self.not_found()
+            elif self.wants_table():
+                self.send_json(self.cluster.encode(self.cluster.table([ pod ])))
+            else:
+                self.send_json(self.cluster.encode(pod))
+        elif parts[:3] == [ "api", "v1", "nodes" ] and parts[4:] == [ "proxy", "stats", "summary" ]:
+            if parts[3] not in self.cluster.node_names:
+                self.not_found()
+            else:
+                self.send_json(self.cluster.summary(parts[3], now))
+        else:
+            self.not_found()
+
+    def wants_table(self):
+        return "as=Table" in self.headers.get("Accept", "")
+
+    def hold_watch(self, timeout):
+        # Nothing ever changes in the fake cluster, so a watch just sits there
+        # until it times out (or we shut down). There's no Content-Length, so
+        # the client reads until we close the connection.
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.flush()
+
+        self.stopping.wait(timeout)
+
+
+class FakeAPIServer:
+    """
+    FakeAPIServer serves a FakeCluster over HTTP on localhost, from a
+    background thread. port 0 picks a free port; url is where to point the
+    Kubernetes client once start() returns.
+    """
+
+    def __init__(self, cluster, port=0):
+        self.cluster = cluster
+        self.stopping = threading.Event()
+
+        handler = type("Handler", (FakeAPIHandler,), { "cluster": cluster, "stopping": self.stopping })
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fake-api", daemon=True)
+        self.thread.start()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.stopping.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def serve(options, ready):
+    """
+    Build a FakeCluster from options (a dict of FakeCluster arguments), serve
+    it, and put the server's URL on the ready queue. This is meant to be the
+    target of a separate process, so that serving the fake cluster doesn't
+    get counted against the collector.
+    """
+    server = FakeAPIServer(FakeCluster(**options))
+    ready.put(server.url)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve a synthetic cluster for testing the collector.")
+    parser.add_argument("--nodes", type=int, default=3, help="Number of nodes (default: 3)")
+    parser.add_argument("--pods-per-node", type=int, default=10, help="Application pods per node (default: 10)")
+    parser.add_argument("--containers", type=int, default=1, help="Application containers per pod, not counting sidecars (default: 1)")
+    parser.add_argument("--deployments", type=int, default=10, help="Application Deployments to spread the pods across (default: 10)")
+    parser.add_argument("--mesh", type=str, choices=mesh_layouts, default="sidecar", help="Mesh layout (default: sidecar)")
+    parser.add_argument("--scrape-interval", type=float, default=15.0, help="Seconds between fake scrapes, 0 for a new scrape on every request (default: 15)")
+    parser.add_argument("--port", type=int, default=8001, help="Port to listen on (default: 8001)")
+
+    args = parser.parse_args()
+
+    cluster = FakeCluster(nodes=args.nodes, pods_per_node=args.pods_per_node,
+                          containers=args.containers, mesh=args.mesh,
+                          deployments=args.deployments, scrape_interval=args.scrape_interval)
+
+    server = FakeAPIServer(cluster, port=args.port)
+
+    print(f"Serving {len(cluster.nodes)} nodes, {len(cluster.pods)} pods, {cluster.containers} containers at {server.url}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
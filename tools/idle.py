@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class IdleDetector:
+    """
+    IdleDetector decides whether the cluster has settled down, by looking at
+    the CPU usage of a few groups (Faces, the mesh, and the load generators)
+    over the last window fresh samples. A group has settled if both its
+    spread (standard deviation) and its drift (least-squares slope times the
+    time the window covers) are within tolerance of its mean, or within
+    floor millicores, whichever is bigger. The floor is what lets a group
+    that's idling at a few millicores count as settled despite its noise.
+
+    Settled isn't enough by itself: a cluster with the load generator still
+    running flat out is nice and steady too. So the quiet groups (by default,
+    just the load generators) also have to be down to floor millicores.
+    """
+
+    def __init__(self, window=4, tolerance=0.05, floor=10.0,
+                 groups=("faces", "mesh", "load"), quiet_groups=("load",)):
+        self.window = window
+        self.tolerance = tolerance
+        self.floor = floor
+        self.groups = groups
+        self.quiet_groups = quiet_groups
+
+    def check(self, store):
+        """
+        Look at the samples in store (a SampleStore), and return (idle, why)
+        where why is a short description of what we saw.
+        """
+        # Stale samples are just copies of the one before, so they'd make
+        # the window look steadier than it is. Look back far enough to find
+        # window fresh ones even if every other sample is stale.
+        rows = store.tail(self.window * 4)
+        rows = rows[rows[:, store.columns["fresh pods"]] > 0][-self.window:]
+
+        if len(rows) < self.window:
+            return False, f"{len(rows)} of {self.window} fresh samples"
+
+        times = rows[:, store.columns["timestamp"]]
+        span = times[-1] - times[0]
+
+        for group in self.groups:
+            column = store.columns.get(f"{group} CPU")
+
+            if column is None:
+                continue
+
+            # Nanocores to millicores; a group that's not there at all is
+            # as quiet as it gets.
+            values = np.nan_to_num(rows[:, column]) / 1_000_000
+            mean = np.mean(values)
+            allowance = max(self.floor, self.tolerance * abs(mean))
+
+            if group in self.quiet_groups and mean > self.floor:
+                return False, f"{group} still busy ({mean:.0f} mC)"
+
+            spread = np.std(values)
+
+            if spread > allowance:
+                return False, f"{group} unsteady (±{spread:.0f} mC)"
+
+            drift = abs(np.polyfit(times - times[0], values, 1)[0]) * span if span > 0 else 0.0
+
+            if drift > allowance:
+                return False, f"{group} drifting ({drift:.0f} mC over {span:.0f}s)"
+
+        return True, f"steady for {len(rows)} samples ({span:.0f}s)"
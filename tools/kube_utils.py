@@ -1,3 +1,6 @@
+import datetime
+import re
+
 special_ids = [
     "pdcsi-node",
     "kube-proxy",
@@ -234,4 +237,38 @@ def bytes(memory_usage):
         else:
             return int(memory_usage)
     except ValueError:
-        raise ValueError(f"invalid memory value: {memory_usage}")
\ No newline at end of file
+        raise ValueError(f"invalid memory value: {memory_usage}")
+
+def timestamp(ts):
+    """
+    Convert a Kubernetes RFC 3339 timestamp (e.g. "2025-03-28T00:58:20Z") to
+    seconds since the epoch.
+    """
+    try:
+        when = datetime.datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        raise ValueError(f"invalid timestamp: {ts}")
+
+    return when.timestamp()
+
+duration_units = {
+    "h": 3600.0,
+    "m": 60.0,
+    "s": 1.0,
+    "ms": 0.001,
+    "us": 0.000001,
+    "µs": 0.000001,
+    "ns": 0.000000001,
+}
+
+def seconds(duration):
+    """
+    Convert a Go-style duration (e.g. "15s", "10.5s", or "1m0.5s") to
+    seconds.
+    """
+    parts = re.findall(r'(\d+(?:\.\d+)?)(h|ms|us|µs|ns|m|s)', duration or "")
+
+    if not parts or "".join(n + u for n, u in parts) != duration:
+        raise ValueError(f"invalid duration: {duration}")
+
+    return sum(float(n) * duration_units[u] for n, u in parts)
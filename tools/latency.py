@@ -0,0 +1,251 @@
+import ast
+import json
+import re
+
+import numpy as np
+
+# Load generators report latency percentiles per load generator pod, but
+# percentiles don't add up: the P99 of a run isn't the mean (or the max) of
+# its pods' P99s. What does add up is histograms. A LatencyHistogram is a
+# set of latency values (in ms) with the number of requests recorded at each
+# one, so merging two is just adding up their counts, and the percentiles of
+# a merged histogram are the real percentiles across every request in it.
+#
+# wrk2 gives us its whole HdrHistogram as the "Detailed Percentile
+# spectrum": for each row, a value, the percentile it's at, and the total
+# count of requests at or below it. That tells us how many requests there
+# were between each row's value and the next, but not exactly where in that
+# range they were, so a LatencyHistogram is a set of segments, each a range
+# of latencies (in ms) and the number of requests in it, and we assume the
+# requests in a segment are spread evenly across it when working out
+# percentiles. Segments from different histograms can overlap, so merging is
+# just putting them all together.
+#
+# oha doesn't give us a spectrum, but its --json output has its own
+# percentiles (P10 up to P99.99), the fastest and slowest requests, and how
+# many responses it got, which between them make a histogram of the same
+# kind. Failing that, it has a coarse histogram of its own.
+
+# The percentiles we report, by field name.
+percentiles = {
+    "P50": 50.0,
+    "P75": 75.0,
+    "P90": 90.0,
+    "P95": 95.0,
+    "P99": 99.0,
+    "P99.9": 99.9,
+    "P99.99": 99.99,
+}
+
+# The spectrum is everything from just after its heading (and the blank line
+# after the column titles) up to wrk2's "#[Mean = ..." summary.
+wrk2_spectrum_re = re.compile(r"Detailed Percentile spectrum:\n[^\n]*\n\s*\n(.*?)^#\[",
+                              re.DOTALL | re.MULTILINE)
+
+
+class LatencyHistogram:
+    """
+    A histogram of latencies, as parallel arrays of the low and high ends of
+    each segment (in ms) and how many requests were in it. A segment whose
+    low and high ends are the same is that many requests at exactly that
+    latency.
+    """
+
+    def __init__(self, lows, highs, counts):
+        self.lows = np.asarray(lows, dtype=np.float64)
+        self.highs = np.asarray(highs, dtype=np.float64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+
+    @classmethod
+    def from_cumulative(cls, values, total_counts):
+        """
+        Build a histogram from increasing values and the running total of
+        requests at or below each one, like wrk2's percentile spectrum. The
+        requests counted at the first value are all at exactly that value.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        counts = np.diff(np.asarray(total_counts, dtype=np.int64), prepend=0)
+        lows = np.concatenate((values[:1], values[:-1]))
+
+        keep = counts > 0
+        return cls(lows[keep], values[keep], counts[keep])
+
+    @classmethod
+    def merge(cls, histograms):
+        """
+        Return a single histogram of everything in histograms.
+        """
+        histograms = list(histograms)
+
+        if len(histograms) == 1:
+            return histograms[0]
+
+        return cls(np.concatenate([ h.lows for h in histograms ]),
+                   np.concatenate([ h.highs for h in histograms ]),
+                   np.concatenate([ h.counts for h in histograms ]))
+
+    def total(self):
+        return int(self.counts.sum())
+
+    def cumulative(self):
+        """
+        Return every segment end, in order, with the number of requests at
+        or below it and the number at exactly it. Between two successive
+        ends, the number of requests at or below a latency goes up in a
+        straight line.
+        """
+        points = np.unique(np.concatenate((self.lows, self.highs)))
+        spread = self.highs > self.lows
+
+        # Each segment adds its requests per ms to the slope from its low
+        # end to its high end...
+        density = self.counts[spread] / (self.highs[spread] - self.lows[spread])
+        slope = np.cumsum(np.bincount(np.searchsorted(points, self.lows[spread]),
+                                      weights=density, minlength=len(points))
+                          - np.bincount(np.searchsorted(points, self.highs[spread]),
+                                        weights=density, minlength=len(points)))
+
+        # ...and requests at exactly one latency are a step up there.
+        exactly = np.bincount(np.searchsorted(points, self.highs[~spread]),
+                              weights=self.counts[~spread], minlength=len(points))
+
+        at_or_below = np.cumsum(np.concatenate(([ 0 ], slope[:-1] * np.diff(points))) + exactly)
+
+        return points, at_or_below, exactly
+
+    def percentiles(self, wanted=None):
+        """
+        Return a dictionary of field name to latency for each of wanted (by
+        default, all of percentiles), or to None if the histogram is empty.
+        """
+        if wanted is None:
+            wanted = percentiles
+
+        total = self.total()
+
+        if total == 0:
+            return { name: None for name in wanted }
+
+        points, at_or_below, exactly = self.cumulative()
+        values = {}
+
+        for name, percentile in wanted.items():
+            target = percentile / 100.0 * total
+
+            # The first point with enough requests at or below it...
+            i = min(np.searchsorted(at_or_below, target), len(points) - 1)
+
+            # ...which is where target is, unless we get there on the way
+            # up to it.
+            below = at_or_below[i] - exactly[i]
+
+            if i > 0 and target <= below and below > at_or_below[i - 1]:
+                share = (target - at_or_below[i - 1]) / (below - at_or_below[i - 1])
+                values[name] = float(points[i - 1] + share * (points[i] - points[i - 1]))
+            else:
+                values[name] = float(points[i])
+
+        return values
+
+    def value_at(self, percentile):
+        """
+        Return the latency that percentile% of requests were at or below.
+        """
+        return self.percentiles({ "value": percentile })["value"]
+
+    def __str__(self):
+        return f"LatencyHistogram({len(self.counts)} segments, {self.total()} requests)"
+
+
+def parse_oha_json(text):
+    """
+    Return the result object from oha's --json output in text, ignoring
+    anything before it. oha writes proper JSON, but logs that have been
+    through the Kubernetes Python client can come back as the repr() of the
+    parsed object instead (single quotes, None, and so on), so if it's not
+    JSON, we read it as a Python literal. Either way, nothing in the text
+    gets rewritten, so strings with quotes or "None" in them survive.
+    """
+    start = text.find("{")
+
+    if start < 0:
+        raise ValueError("no result object found")
+
+    try:
+        result, _ = json.JSONDecoder().raw_decode(text, start)
+    except json.JSONDecodeError:
+        result = ast.literal_eval(text[start:text.rfind("}") + 1])
+
+    if not isinstance(result, dict):
+        raise ValueError("result is not an object")
+
+    return result
+
+
+def oha_histogram(result):
+    """
+    Return a LatencyHistogram from an oha result object, or None if it
+    doesn't have enough in it to make one.
+    """
+    summary = result.get("summary") or {}
+    responses = sum((result.get("statusCodeDistribution") or {}).values())
+
+    # Percentile name (e.g. "p99.9") to latency in seconds.
+    points = [ (float(name[1:]), value)
+               for name, value in (result.get("latencyPercentiles") or {}).items()
+               if name.startswith("p") and value is not None ]
+
+    if points and responses:
+        if summary.get("fastest") is not None:
+            points.append((0.0, summary["fastest"]))
+
+        if summary.get("slowest") is not None:
+            points.append((100.0, summary["slowest"]))
+
+        points.sort()
+        percents = np.array([ percent for percent, _ in points ])
+
+        # Percentiles can't go down, but rounding in oha's output could
+        # make it look like they do.
+        values = np.maximum.accumulate(np.array([ value for _, value in points ]) * 1000.0)
+
+        return LatencyHistogram.from_cumulative(values, np.round(percents / 100.0 * responses))
+
+    # Response time (in seconds, as a string) at the top of each bucket to
+    # how many responses were in it.
+    buckets = sorted((float(top), count)
+                     for top, count in (result.get("responseTimeHistogram") or {}).items())
+
+    if buckets:
+        highs = np.array([ top for top, _ in buckets ]) * 1000.0
+        counts = np.array([ count for _, count in buckets ])
+        fastest = summary.get("fastest")
+        lows = np.concatenate(([ highs[0] if fastest is None else min(fastest * 1000.0, highs[0]) ],
+                               highs[:-1]))
+
+        keep = counts > 0
+        return LatencyHistogram(lows[keep], highs[keep], counts[keep])
+
+    return None
+
+
+def parse_wrk2_spectrum(text):
+    """
+    Return the LatencyHistogram from wrk2's output, or None if there's no
+    percentile spectrum in it.
+    """
+    match = wrk2_spectrum_re.search(text)
+
+    if not match:
+        return None
+
+    # Every row is value, percentile, total count, 1/(1-percentile) (which
+    # is "inf" on the last row), so we can convert the whole thing at once.
+    cells = np.array(match.group(1).split(), dtype=np.float64)
+
+    if len(cells) == 0 or len(cells) % 4 != 0:
+        return None
+
+    rows = cells.reshape(-1, 4)
+
+    return LatencyHistogram.from_cumulative(rows[:, 0], rows[:, 2])
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import time
+
+# The manifest is how sequence.py picks up where it left off. It lives in
+# the top-level output directory as "{mesh}-manifest.json", and has
+#
+# - "options": the settings that change what a run measures (duration,
+#   load generator, etc.), so that we don't quietly mix runs done one way
+#   with runs done another
+# - "runs": one entry per planned run, keyed "{loop:02d}/{rps}/{seq}", with
+#   its status ("planned", "started", "complete", or "skipped") and, once
+#   it's complete, the size and SHA-256 of every file it wrote. "skipped"
+#   means an adaptive sequence decided it didn't need the run.
+#
+# A run that's "started" but not "complete" died partway through, so its
+# files get thrown away and it gets run again. A "complete" run whose files
+# are missing or don't match their checksums gets the same treatment.
+
+# Options that have to match for a resumed sequence to make sense.
+# Everything else (--pipeline, --gzip-logs, ...) just changes how we get
+# there.
+option_names = [ "duration", "loadgen", "workers", "connections", "affinity", "collector" ]
+
+
+def checksum(path):
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as infile:
+        for chunk in iter(lambda: infile.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def timestamp():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+class RunManifest:
+    """
+    RunManifest keeps track of which runs in a sequence are done, on disk,
+    so that an interrupted sequence can be resumed.
+    """
+
+    def __init__(self, path, mesh, options):
+        self.path = path
+        self.mesh = mesh
+        self.options = { name: options[name] for name in option_names }
+        self.runs = {}
+
+        if os.path.exists(path):
+            with open(path, "r") as infile:
+                saved = json.load(infile)
+
+            if saved.get("options") != self.options:
+                raise ValueError(f"{path} was written with different options:\n"
+                                 f"  manifest: {saved.get('options')}\n"
+                                 f"  now:      {self.options}\n"
+                                 f"use a different output directory, or remove the manifest to start over")
+
+            self.runs = saved.get("runs", {})
+
+    @staticmethod
+    def key(loop, rps, seq):
+        return f"{loop:02d}/{rps}/{seq}"
+
+    def save(self):
+        # Write to a temporary file and rename it into place, so that dying
+        # halfway through a write can't leave us with a corrupt manifest.
+        partial = f"{self.path}.partial"
+
+        with open(partial, "w") as outfile:
+            json.dump({ "mesh": self.mesh, "options": self.options, "runs": self.runs },
+                      outfile, indent=2, sort_keys=True)
+            outfile.write("\n")
+
+        os.replace(partial, self.path)
+
+    def plan(self, loop, rps, seq, outdir):
+        key = self.key(loop, rps, seq)
+
+        if key not in self.runs:
+            self.runs[key] = {
+                "loop": loop,
+                "rps": rps,
+                "seq": seq,
+                "outdir": outdir,
+                "status": "planned",
+            }
+
+    @staticmethod
+    def run_files(outdir, rps, seq):
+        """
+        Return the names of all the files in outdir that belong to the run
+        at rps and seq.
+        """
+        prefix = f"{rps}-{seq}-"
+
+        try:
+            names = os.listdir(outdir)
+        except FileNotFoundError:
+            return []
+
+        return sorted(name for name in names if name.startswith(prefix))
+
+    def verify(self, key):
+        """
+        Check that a complete run's files are all still there and unchanged.
+        Returns a list of problems, which is empty if everything's fine.
+        """
+        entry = self.runs[key]
+        problems = []
+
+        for name, expected in entry.get("files", {}).items():
+            path = os.path.join(entry["outdir"], name)
+
+            if not os.path.exists(path):
+                problems.append(f"{name} is missing")
+            elif os.path.getsize(path) != expected["size"]:
+                problems.append(f"{name} has changed size")
+            elif checksum(path) != expected["sha256"]:
+                problems.append(f"{name} doesn't match its checksum")
+
+        return problems
+
+    def is_complete(self, loop, rps, seq):
+        """
+        Return whether the run is already done and its files are intact.
+        If not, any files it left behind are discarded, so that it can be
+        run again from scratch.
+        """
+        key = self.key(loop, rps, seq)
+        entry = self.runs[key]
+
+        if entry["status"] == "complete":
+            problems = self.verify(key)
+
+            if not problems:
+                return True
+
+            print(f"Run {key} needs to be redone: {', '.join(problems)}")
+            entry["status"] = "planned"
+            entry.pop("files", None)
+            entry.pop("finished", None)
+            self.save()
+
+        self.discard(entry)
+        return False
+
+    def discard(self, entry):
+        for name in self.run_files(entry["outdir"], entry["rps"], entry["seq"]):
+            print(f"...discarding partial output {os.path.join(entry['outdir'], name)}")
+            os.remove(os.path.join(entry["outdir"], name))
+
+    def start(self, loop, rps, seq, context=None):
+        entry = self.runs[self.key(loop, rps, seq)]
+        entry["status"] = "started"
+        entry["started"] = timestamp()
+
+        if context:
+            entry["context"] = context
+        self.save()
+
+    def complete(self, loop, rps, seq):
+        entry = self.runs[self.key(loop, rps, seq)]
+        files = {}
+
+        for name in self.run_files(entry["outdir"], rps, seq):
+            path = os.path.join(entry["outdir"], name)
+
+            # Leftovers from an abandoned log download don't count.
+            if name.endswith(".partial"):
+                os.remove(path)
+                continue
+
+            files[name] = { "size": os.path.getsize(path), "sha256": checksum(path) }
+
+        entry["status"] = "complete"
+        entry["finished"] = timestamp()
+        entry["files"] = files
+        self.save()
+
+    def skip(self, loop, rps, seq):
+        """
+        Note that we don't need a run after all. A run that's already
+        complete stays complete.
+        """
+        if self.is_complete(loop, rps, seq):
+            return
+
+        entry = self.runs[self.key(loop, rps, seq)]
+
+        if entry["status"] != "skipped":
+            entry["status"] = "skipped"
+            self.save()
+
+    def counts(self):
+        """
+        Return (finished runs, planned runs), where skipped runs count as
+        finished.
+        """
+        complete = sum(1 for entry in self.runs.values() if entry["status"] in ("complete", "skipped"))
+        return complete, len(self.runs)
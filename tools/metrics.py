@@ -2,20 +2,59 @@ import sys
 
 import csv
 import datetime
+import json
 import os
 import time
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import columnar
 import kube_utils
+import overhead
+import recording
+
+from idle import IdleDetector
+from kubelet_summary import KubeletSummaryCollector
 
 from kubernetes import client, config
+from pod_informer import PodInformer
+from sample_store import SampleStore
 
 
 def clear():
     return "\033[H\033[J"
 
 
-def build_field_names(nodes):
-    field_names = [ "timestamp" ]
+# These are the columns that describe when a sample was taken, rather than
+# resource usage. All of them are in seconds (since the epoch, except for the
+# window).
+timing_field_names = [ "request start", "response time",
+                       "scrape oldest", "scrape newest", "scrape window" ]
+
+# "fresh pods" is the number of pods whose metrics changed since the previous
+# sample. If it's zero, metrics-server handed us exactly what we saw last
+# time, and the sample is stale.
+sample_field_names = timing_field_names + [ "fresh pods" ]
+
+# In ramp mode (one load generator Job stepping through several RPS values),
+# every row also says which step of the ramp was running when it was taken,
+# and that step's total target RPS. Both are empty for rows taken outside any
+# step (e.g. while draining).
+step_field_names = [ "step", "step RPS" ]
+
+
+# The synthesized totals, in display order ("" is a blank line).
+synth_keys = [ "mesh", "non-mesh", "business", "", "overhead", "total" ]
+
+
+def build_field_names(nodes, steps=False):
+    field_names = [ "timestamp" ] + sample_field_names
+
+    if steps:
+        field_names += step_field_names
 
     for node in nodes.values():
         field_names.append(f"{node.name} CPU")
@@ -45,21 +84,66 @@ def build_field_names(nodes):
     return field_names
 
 
-def get_pod_metrics(v1, metrics_api):
+def get_pod_metrics(pods, metrics_api, executor, recorder=None, clock=time.time, costs=None):
+    """
+    Fetch current usage for every container in the cluster. pods is a
+    PodInformer, which we use to find the node for each pod without having to
+    list every pod in the cluster again; any pods it doesn't know about yet
+    get looked up concurrently on executor.
+
+    Returns the list of per-container metrics, plus a dictionary of timing
+    information: when we sent the request, when the response came back, and
+    the range of scrape timestamps and the largest window that metrics-server
+    reported.
+
+    If recorder is set, the raw metrics response gets recorded. clock is
+    where we get the time from (which replays override). If costs (an
+    overhead.ApiCosts) is set, the cost of the request gets added to it.
+    """
     metrics = []
 
-    pod_info = v1.list_pod_for_all_namespaces(watch=False).items
+    request_start = clock()
+    response = metrics_api.list_cluster_custom_object('metrics.k8s.io', 'v1beta1', 'pods',
+                                                      _preload_content=False)
+    response_time = clock()
 
-    node_map = {
-        pod_info[i].metadata.name: pod_info[i].spec.node_name
-        for i in range(len(pod_info))
-    }
+    pod_metrics = json.loads(response.data)
+
+    if recorder:
+        recorder.record("metrics", pod_metrics, start=request_start, end=response_time)
+
+    if costs:
+        objects = sum(1 + len(pod["containers"]) for pod in pod_metrics["items"])
+        costs.add(response_time - request_start, len(response.data), objects)
 
-    pod_metrics = metrics_api.list_cluster_custom_object('metrics.k8s.io', 'v1beta1', 'pods')
+    missing = set()
+
+    for pod in pod_metrics["items"]:
+        if pods.get(pod["metadata"]["name"]) is None:
+            missing.add((pod["metadata"]["namespace"], pod["metadata"]["name"]))
+
+    if missing:
+        pods.lookup(missing, executor, costs=costs)
+
+    scrape_oldest = None
+    scrape_newest = None
+    scrape_window = None
 
     for pod in pod_metrics["items"]:
         pod_id, pod_name, pod_namespace = kube_utils.get_pod_id(pod)
 
+        scraped = kube_utils.timestamp(pod["timestamp"])
+        window = kube_utils.seconds(pod["window"])
+
+        if scrape_oldest is None or scraped < scrape_oldest:
+            scrape_oldest = scraped
+
+        if scrape_newest is None or scraped > scrape_newest:
+            scrape_newest = scraped
+
+        if scrape_window is None or window > scrape_window:
+            scrape_window = window
+
         for container in pod["containers"]:
             cpu_usage = container["usage"]["cpu"]
             cpu_nano = kube_utils.nanocores(cpu_usage)
@@ -70,86 +154,67 @@ def get_pod_metrics(v1, metrics_api):
             metrics.append({
                 "pod_id": pod_id,
                 "pod": pod_name,
-                "node": node_map.get(pod_name, "unknown"),
+                "node": pods.node_for(pod_name),
                 "container": container["name"],
                 "namespace": pod_namespace,
+                "timestamp": scraped,
+                "window": window,
                 "usage": {
                     "cpu": cpu_nano,
                     "memory": memory_bytes
                 }
             })
 
-    return metrics
+    timing = {
+        "request start": request_start,
+        "response time": response_time,
+        "scrape oldest": scrape_oldest,
+        "scrape newest": scrape_newest,
+        "scrape window": scrape_window,
+    }
 
+    return metrics, timing
 
-class MinMax:
-    '''MinMax tracks a current value plus its minimum and maximum.'''
-    def __init__(self):
-        self.current = 0.0
-        self.min = None
-        self.max = None
 
-    def zero(self):
-        '''
-        Reset the current value to zero, without touching the min and max.
-        '''
-
-        self.current = 0.0
-
-    def add(self, value):
-        '''
-        Add to the current value, without affecting the min and max. What's going on
-        here is that since we're building up our values piecemeal, we can't know when
-        the buildup is done without an external signal to tell us that it's OK to
-        update the min & max.
-        '''
-        self.current += value
-
-    def update(self):
-        '''
-        Update the min & max. What's going on here is that since we're
-        building up our values piecemeal, we can't know when the buildup is
-        done without an external signal to tell us that it's OK to update the
-        min & max.
-        '''
-        if self.min is None:
-            self.min = self.current
-            self.max = self.current
-            return
+class MetricsServerCollector:
+    """
+    MetricsServerCollector gets per-container usage from the metrics API
+    (metrics.k8s.io), which is what metrics-server serves up.
+    """
+
+    def __init__(self, metrics_api, pods, executor, recorder=None, clock=time.time, costs=None):
+        self.metrics_api = metrics_api
+        self.pods = pods
+        self.executor = executor
+        self.recorder = recorder
+        self.clock = clock
+        self.costs = costs
+
+    def fetch(self):
+        return get_pod_metrics(self.pods, self.metrics_api, self.executor,
+                               recorder=self.recorder, clock=self.clock, costs=self.costs)
+
 
-        self.min = min(self.min, self.current)
-        self.max = max(self.max, self.current)
+# The collectors AggregateUsage knows how to use.
+collector_names = [ "metrics-server", "summary" ]
+
+
+class MinMax:
+    '''MinMax is a current value plus its minimum and maximum.'''
+    def __init__(self, current=0.0, min=None, max=None):
+        self.current = current
+        self.min = min
+        self.max = max
 
     def __str__(self):
         return f"{self.current:7.2f} ({self.min:7.2f} - {self.max:7.2f})"
 
 
 class Usage:
-    '''Usage tracks CPU and memory usage, using a MinMax for each.'''
-    def __init__(self):
-        self.cpu = MinMax()
-        self.memory = MinMax()
-
-    def zero(self):
-        '''
-        Zero both CPU & memory.
-        '''
-        self.cpu.zero()
-        self.memory.zero()
-
-    def add(self, cpu, memory):
-        '''
-        Add CPU & memory usage.
-        '''
-        self.cpu.add(cpu)
-        self.memory.add(memory)
-
-    def update(self):
-        '''
-        Update minimum & maximum CPU & memory.
-        '''
-        self.cpu.update()
-        self.memory.update()
+    '''Usage is CPU and memory usage, using a MinMax for each.'''
+    def __init__(self, cpu=None, memory=None):
+        self.cpu = cpu if cpu is not None else MinMax()
+        self.memory = memory if memory is not None else MinMax()
 
     def __str__(self):
         cpu_cur = (self.cpu.current + 999_999) // 1_000_000
@@ -177,22 +242,20 @@ class Usage:
 
 class Node:
     def __init__(self, node_info):
-        self.name = node_info.metadata.name
-        self.allocatable_cpu = kube_utils.nanocores(node_info.status.allocatable["cpu"])
-        self.allocatable_memory = kube_utils.bytes(node_info.status.allocatable["memory"])
-        self.reinit()
-
-    def reinit(self):
-        self.assigned = Usage()
-
-    def zero(self):
-        self.assigned.zero()
+        # node_info can be a V1Node or the equivalent dictionary (as in a
+        # recording).
+        if hasattr(node_info, "metadata"):
+            self.name = node_info.metadata.name
+            allocatable = node_info.status.allocatable
+        else:
+            self.name = node_info["metadata"]["name"]
+            allocatable = node_info["status"]["allocatable"]
 
-    def add(self, resource):
-        self.assigned.add(resource["cpu"], resource["memory"])
+        self.allocatable_cpu = kube_utils.nanocores(allocatable["cpu"])
+        self.allocatable_memory = kube_utils.bytes(allocatable["memory"])
 
-    def update(self):
-        self.assigned.update()
+        # This gets updated by AggregateUsage after every sample.
+        self.assigned = Usage()
 
     def shortname(self, maxlen=8):
         """
@@ -210,10 +273,20 @@ class Node:
         return f"{cpu_ratio:6.2%} CPU, {memory_ratio:6.2%} mem: {self.assigned}"
 
 
-def get_nodes(v1):
+def get_nodes(v1, recorder=None, node_list=None):
+    """
+    Return a dictionary of node name to Node, from node_list if we're given
+    one (e.g. by a BenchmarkSession), or from the API if not.
+    """
     nodes = {}
 
-    for node_info in v1.list_node().items:
+    if node_list is None:
+        node_list = v1.list_node()
+
+    if recorder:
+        recorder.record("nodes", node_list)
+
+    for node_info in node_list.items:
         node = Node(node_info)
         nodes[node.name] = node
 
@@ -221,18 +294,128 @@ def get_nodes(v1):
 
 
 class AggregateUsage:
-    def __init__(self, client, output_path):
+    # Bounds on how often we'll poll the metrics API, in seconds. We start
+    # out polling every default_poll_period seconds, then follow the scrape
+    # cadence that we actually see from metrics-server.
+    default_poll_period = 10.0
+    min_poll_period = 2.0
+    max_poll_period = 30.0
+
+    def __init__(self, client, output_path, workers=8, keep_stale=False, binary_path=None,
+                 collector="metrics-server", record_path=None, pods=None, clock=time.time,
+                 overhead_path=None, steps=False, idle=None, node_list=None, classifier=None):
         self.metrics_api = client.CustomObjectsApi()
         self.v1 = client.CoreV1Api()
-        self.nodes = get_nodes(self.v1)
+        self.clock = clock
+
+        # If we're recording, every raw API response we get goes into the
+        # recording, starting with the node list.
+        self.recorder = None
+
+        if record_path:
+            self.recorder = recording.Recorder(record_path, collector, steps=steps)
+
+        self.nodes = get_nodes(self.v1, recorder=self.recorder, node_list=node_list)
+
+        # API requests that can go out in parallel for a sample (per-node
+        # Summary requests, lookups of pods the informer hasn't seen yet) get
+        # issued from this pool.
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sampler")
+
+        # We can be handed a pod index to use (for replays, or one shared by
+        # a BenchmarkSession); otherwise we start, and own, a PodInformer.
+        self.owns_pods = pods is None
+
+        if self.owns_pods:
+            pods = PodInformer(self.v1, recorder=self.recorder)
+            pods.start()
+
+        self.pods = pods
+
+        # What each sample costs us in API requests gets added up here, and
+        # written to the overhead CSV (if we have one) along with the time we
+        # spend on everything else.
+        self.costs = overhead.ApiCosts()
+        self.overhead_output = None
+
+        if overhead_path:
+            self.overhead_output = overhead.OverheadWriter(overhead_path)
+
+        if collector == "metrics-server":
+            self.collector = MetricsServerCollector(self.metrics_api, self.pods, self.executor,
+                                                    recorder=self.recorder, clock=self.clock,
+                                                    costs=self.costs)
+        elif collector == "summary":
+            self.collector = KubeletSummaryCollector(self.v1, self.nodes, self.pods, self.executor,
+                                                     recorder=self.recorder, clock=self.clock,
+                                                     costs=self.costs)
+        else:
+            raise ValueError(f"Unknown collector: {collector}")
 
         self.state = "STARTING"
+
+        # We start collecting once the cluster has settled down (see
+        # idle.py), and that's also what tells us a drain can stop early.
+        self.idle_detector = idle or IdleDetector()
         self.idle = False
+        self.idle_reason = "no samples yet"
         self.collecting = False
-        self.field_names = build_field_names(self.nodes)
-        self.field_names_set = set(self.field_names)
 
-        self.classifier = kube_utils.Classifier()
+        # Per-pod scrape timestamps from the most recent sample, plus the
+        # intervals we've seen between scrapes, so that we can tell when
+        # metrics-server is handing us data we've already seen and figure out
+        # how often it actually has something new. Stale samples aren't
+        # written to the CSV unless keep_stale is set.
+        self.keep_stale = keep_stale
+        self.scrape_times = {}
+        self.scrape_intervals = deque(maxlen=64)
+        self.stale = False
+        self.stale_count = 0
+
+        self.field_names = build_field_names(self.nodes, steps=steps)
+        self.store = SampleStore(self.field_names)
+
+        # The ramp step currently running, if we're tagging rows with steps
+        # at all (see set_step).
+        self.steps = steps
+        self.step = None
+        self.step_rps = None
+
+        # Column indices that we need for every sample, worked out once up
+        # front. Nodes are numbered in the order we list them, and the node
+        # columns are indexed by that number.
+        self.sample_columns = { name: self.store.column(name) for name in sample_field_names }
+        self.timing_columns = { self.store.column(name) for name in timing_field_names }
+
+        self.node_index = { name: i for i, name in enumerate(self.nodes.keys()) }
+        self.node_cpu_columns = np.array([ self.store.column(f"{name} CPU") for name in self.nodes ], dtype=np.intp)
+        self.node_mem_columns = np.array([ self.store.column(f"{name} mem") for name in self.nodes ], dtype=np.intp)
+
+        self.allocatable = {}
+
+        for node in self.nodes.values():
+            self.allocatable[self.store.column(f"{node.name} allocatable CPU")] = node.allocatable_cpu
+            self.allocatable[self.store.column(f"{node.name} allocatable mem")] = node.allocatable_memory
+
+        # The synthesized totals always show up in the CSV, even as zeroes.
+        self.synth_columns = np.array([ self.store.column(f"{key} {kind}")
+                                        for key in synth_keys if key
+                                        for kind in ("CPU", "mem") ], dtype=np.intp)
+
+        # Classifications never change, so a Classifier (and its cache) can
+        # be shared between runs.
+        self.classifier = classifier or kube_utils.Classifier()
+
+        # A route is the set of keys that a given (pod ID, container,
+        # namespace) adds its usage into. We number routes as we first see
+        # them, and keep them flattened into parallel arrays (route number,
+        # CPU column, memory column) so that a whole sample can be added up
+        # with a couple of array operations.
+        self.routes = {}
+        self.route_keys = []
+        self.flat_route = np.zeros(0, dtype=np.intp)
+        self.flat_cpu = np.zeros(0, dtype=np.intp)
+        self.flat_mem = np.zeros(0, dtype=np.intp)
 
         self.output_path = output_path
         self.writer = None
@@ -241,21 +424,95 @@ class AggregateUsage:
         if self.output_path:
             self.csv_output = open(self.output_path, mode='w', newline='')
 
-            self.writer = csv.DictWriter(self.csv_output, fieldnames=self.field_names)
-            self.writer.writeheader()
+            self.writer = csv.writer(self.csv_output)
+            self.writer.writerow(self.field_names)
+
+        # Optionally, we also write a binary columnar file alongside the CSV,
+        # which gets compacted into a compressed NPZ when we're done.
+        self.binary_path = binary_path
+        self.binary_output = None
+
+        if self.binary_path:
+            self.binary_output = columnar.ColumnarWriter(self.binary_path, self.field_names)
 
         self.reinit()
 
     def reinit(self):
-        self.usages = {}
-        self.pod_usages = {}
+        # keys[type] is the set of keys of that type that we've seen in the
+        # current window, in the order we saw them (as a dict, to keep the
+        # order).
+        self.keys = {}
+        self.store.restart()
 
     def is_collecting(self):
         return self.collecting
 
     def is_idle(self):
+        """
+        Return whether the cluster looked settled as of the latest sample
+        (see IdleDetector); idle_reason says why or why not.
+        """
         return self.idle
 
+    def is_stale(self):
+        return self.stale
+
+    def scrape_cadence(self):
+        """
+        Return our best guess at how often metrics-server gets new data for a
+        pod (the median of the intervals we've seen), or None if we haven't
+        seen enough to tell yet.
+        """
+        if not self.scrape_intervals:
+            return None
+
+        intervals = sorted(self.scrape_intervals)
+        return intervals[len(intervals) // 2]
+
+    def poll_period(self):
+        """
+        Return how long to wait before the next sample. Polling faster than
+        metrics-server scrapes just gets us stale samples, so we follow the
+        observed scrape cadence; after a stale sample, we check back quickly
+        since fresh data should be along soon (backing off if it isn't).
+        """
+        cadence = self.scrape_cadence()
+
+        if cadence is None:
+            return self.default_poll_period
+
+        period = min(max(cadence, self.min_poll_period), self.max_poll_period)
+
+        if self.stale:
+            backoff = self.min_poll_period * (2 ** (self.stale_count - 1))
+            period = min(backoff, period)
+
+        return period
+
+    def track_scrapes(self, metrics):
+        """
+        Update our per-pod scrape timestamps from a new set of metrics, and
+        return the number of pods that have new data.
+        """
+        scrape_times = {}
+
+        for metric in metrics:
+            scrape_times[(metric["namespace"], metric["pod"])] = metric["timestamp"]
+
+        fresh = 0
+
+        for pod, scraped in scrape_times.items():
+            previous = self.scrape_times.get(pod)
+
+            if previous is None:
+                fresh += 1
+            elif scraped > previous:
+                fresh += 1
+                self.scrape_intervals.append(scraped - previous)
+
+        self.scrape_times = scrape_times
+        return fresh
+
     def start_collecting(self):
         if self.state != "STARTING":
             raise RuntimeError("Cannot start collecting when not in STARTING state")
@@ -263,6 +520,9 @@ class AggregateUsage:
         self.collecting = True
         self.state = "RUNNING"
 
+        if self.recorder:
+            self.recorder.record("state", None, state=self.state)
+
     def stop_collecting(self):
         self.collecting = False
         self.state = "FINISHING"
@@ -274,34 +534,63 @@ class AggregateUsage:
         if self.writer:
             self.writer = None
 
+        if self.binary_output:
+            self.binary_output.close()
+            self.binary_output = None
+            self.binary_path = columnar.compact(self.binary_path)
+
+    def set_step(self, step, rps=None):
+        """
+        Tag samples from now on with ramp step number step, which has a
+        total target of rps RPS. A step of None means no step is running.
+        """
+        if not self.steps:
+            raise RuntimeError("Cannot set a step when not tagging samples with steps")
+
+        if (step, rps) == (self.step, self.step_rps):
+            return
+
+        self.step = step
+        self.step_rps = rps
+
+        if self.recorder:
+            self.recorder.record("step", None, step=step, rps=rps)
+
     def start_draining(self):
         self.state = "DRAINING"
 
-    def zero(self):
-        if not self.collecting:
-            self.reinit()
+        if self.recorder:
+            self.recorder.record("state", None, state=self.state)
 
-            for node in self.nodes.values():
-                node.reinit()
+    def close(self):
+        """
+        Stop collecting, shut down the pod informer, and finish any
+        recording. The AggregateUsage can't be used for sampling after this.
+        """
+        self.stop_collecting()
 
-        for type in self.usages.keys():
-            for usage in self.usages[type].values():
-                usage.zero()
+        if self.overhead_output:
+            self.overhead_output.close()
+            self.overhead_output = None
 
-        # Zero node assignments for a new sample
-        for node in self.nodes.values():
-            node.zero()
+        if self.owns_pods:
+            self.pods.stop()
 
-    def _add(self, type, key, cpu, memory):
-        if type not in self.usages:
-            self.usages[type] = {}
+        self.executor.shutdown(wait=False)
 
-        if key not in self.usages[type]:
-            self.usages[type][key] = Usage()
+        if self.recorder:
+            self.recorder.close()
 
-        self.usages[type][key].add(cpu, memory)
+    def zero(self):
+        if not self.collecting:
+            self.reinit()
 
-    def add(self, pod_id, classification, cpu, memory):
+    def keys_for(self, pod_id, classification):
+        """
+        Return the (type, key) pairs that a container's usage adds into,
+        given its pod ID and classification.
+        """
+        keys = []
         type = "normal"
         include_in_real = True
 
@@ -309,33 +598,63 @@ class AggregateUsage:
             type = "overhead"
             include_in_real = False
         elif classification.mesh:
-            self._add("pod", f"{pod_id} mesh", cpu, memory)
+            keys.append(("pod", f"{pod_id} mesh"))
         else:
-            self._add("pod", f"{pod_id} app", cpu, memory)
+            keys.append(("pod", f"{pod_id} app"))
 
         if not classification.mesh:
-            self._add(type, classification.component, cpu, memory)
+            keys.append((type, classification.component))
 
         if include_in_real:
-            self._add("synth", "business", cpu, memory)
+            keys.append(("synth", "business"))
 
             if classification.mesh:
-                self._add("mesh", classification.component, cpu, memory)
-                self._add("synth", "mesh", cpu, memory)
+                keys.append(("mesh", classification.component))
+                keys.append(("synth", "mesh"))
             else:
-                self._add("synth", "non-mesh", cpu, memory)
+                keys.append(("synth", "non-mesh"))
         else:
-            self._add("synth", "overhead", cpu, memory)
+            keys.append(("synth", "overhead"))
 
-        self._add("synth", "total", cpu, memory)
+        keys.append(("synth", "total"))
 
-    def update(self):
-        for type in self.usages.keys():
-            for usage in self.usages[type].values():
-                usage.update()
+        return keys
 
-        for node in self.nodes.values():
-            node.update()
+    def route(self, pod_id, container, namespace):
+        """
+        Return the route number for a container, creating the route if this
+        is the first time we've seen it.
+        """
+        rkey = (pod_id, container, namespace)
+        route = self.routes.get(rkey)
+
+        if route is not None:
+            return route
+
+        classification = self.classifier.lookup(pod_id, container, namespace)
+        keys = self.keys_for(pod_id, classification)
+
+        route = len(self.route_keys)
+        self.routes[rkey] = route
+        self.route_keys.append(keys)
+
+        cpu_columns = [ self.store.column(f"{key} CPU") for _, key in keys ]
+        mem_columns = [ self.store.column(f"{key} mem") for _, key in keys ]
+
+        self.flat_route = np.concatenate((self.flat_route, np.full(len(keys), route, dtype=np.intp)))
+        self.flat_cpu = np.concatenate((self.flat_cpu, np.array(cpu_columns, dtype=np.intp)))
+        self.flat_mem = np.concatenate((self.flat_mem, np.array(mem_columns, dtype=np.intp)))
+
+        return route
+
+    def usage(self, key):
+        """
+        Return a Usage (with min and max over the current window) for a key.
+        """
+        cpu = self.store.stats(self.store.column(f"{key} CPU"))
+        memory = self.store.stats(self.store.column(f"{key} mem"))
+
+        return Usage(MinMax(*cpu), MinMax(*memory))
 
     def items(self):
         for type in [ "normal", "", "overhead", "", "mesh" ]:
@@ -343,29 +662,27 @@ class AggregateUsage:
                 yield "", "", None
                 continue
 
-            if type in self.usages:
-                for key, value in self.usages[type].items():
-                    yield type, key, value
+            for key in self.keys.get(type, {}):
+                yield type, key, self.usage(key)
 
-        synth_keys = [ "mesh", "non-mesh", "business", "", "overhead", "total" ]
         synth_keys_set = set(synth_keys)
 
-        for key in self.usages["synth"].keys():
+        for key in self.keys.get("synth", {}):
             if key not in synth_keys_set:
-                yield "synth", key, self.usages["synth"][key]
+                yield "synth", key, self.usage(key)
 
         for key in synth_keys:
             usage = Usage()
 
-            if key and key in self.usages["synth"]:
-                usage = self.usages["synth"][key]
+            if key:
+                usage = self.usage(key)
 
             yield "synth", key, usage
 
         yield "", "", None
 
-        for key in sorted(self.usages["pod"].keys()):
-            yield "pod", key, self.usages["pod"][key]
+        for key in sorted(self.keys.get("pod", {})):
+            yield "pod", key, self.usage(key)
 
     def calc_ratio(self, v1, v2, limit):
         if v1 < limit or v2 < limit:
@@ -375,11 +692,11 @@ class AggregateUsage:
         return f"{ratio:7.2f}%"
 
     def ratio(self, type1, key1, type2, key2):
-        e1 = self.usages[type1][key1]
-        e2 = self.usages[type2][key2]
+        if (key1 not in self.keys.get(type1, {})) or (key2 not in self.keys.get(type2, {})):
+            return ("---?--- ", "---?--- ")
 
-        if not e1 or not e2:
-            return "---?--- "
+        e1 = self.usage(key1)
+        e2 = self.usage(key2)
 
         # This constant is 0.01 cores expressed in nanocores
         cpu_str = self.calc_ratio(e1.cpu.current, e2.cpu.current, 10000000)
@@ -394,79 +711,130 @@ class AggregateUsage:
         Grab a sample of current resource usage, and update all our various fields
         from it.
         """
-        now = datetime.datetime.now()
+        sample_start = time.perf_counter()
 
-        metrics = get_pod_metrics(self.v1, self.metrics_api)
+        if self.recorder:
+            self.recorder.record("sample", None)
+
+        # Anything the API costs picked up between samples isn't ours.
+        self.costs.take()
+
+        metrics, timing = self.collector.fetch()
+        costs = self.costs.take()
 
         # This will continuously reinitialize the AggregateUsage object
         # until we explicitly mark it as ready to go.
         self.zero()
 
-        for metric in sorted(metrics, key=lambda x: (x["namespace"], x["pod"], x["container"] == "linkerd-proxy", x["container"])):
+        now = datetime.datetime.fromtimestamp(timing["request start"])
+
+        fresh = self.track_scrapes(metrics)
+        self.stale = (fresh == 0)
+        self.stale_count = self.stale_count + 1 if self.stale else 0
+
+        count = len(metrics)
+        route_ids = np.empty(count, dtype=np.intp)
+        node_ids = np.empty(count, dtype=np.intp)
+        cpu = np.empty(count)
+        memory = np.empty(count)
+
+        # Working out where each container's usage goes is the part that
+        # scales with the size of the cluster, so it gets timed on its own.
+        classify_start = time.thread_time()
+
+        for i, metric in enumerate(sorted(metrics, key=lambda x: (x["namespace"], x["pod"], x["container"] == "linkerd-proxy", x["container"]))):
             pod_id = metric["pod_id"]
             namespace = metric["namespace"]
             container = metric["container"]
             node = metric["node"]
-            node_info = self.nodes.get(node)
+            node_id = self.node_index.get(node)
 
-            if node_info:
-                node_info.add(metric["usage"])
-            else:
+            if node_id is None:
                 raise RuntimeError(f"WARNING: pod {pod_id} in {namespace} on unknown node {node}")
 
-            classification = self.classifier.lookup(pod_id, container, namespace)
+            route_ids[i] = self.route(pod_id, container, namespace)
+            node_ids[i] = node_id
+            cpu[i] = metric["usage"]["cpu"]
+            memory[i] = metric["usage"]["memory"]
+
+        aggregate_start = time.thread_time()
+        classify_cpu = aggregate_start - classify_start
+
+        # Add everything up per route first, then spread each route's total
+        # across all the columns it feeds.
+        route_count = len(self.route_keys)
+        route_cpu = np.bincount(route_ids, weights=cpu, minlength=route_count)
+        route_mem = np.bincount(route_ids, weights=memory, minlength=route_count)
+        route_seen = np.bincount(route_ids, minlength=route_count) > 0
+
+        used = route_seen[self.flat_route]
+        used_routes = self.flat_route[used]
 
-            self.add(pod_id, classification, metric["usage"]["cpu"], metric["usage"]["memory"])
+        columns = np.concatenate((self.flat_cpu[used], self.flat_mem[used],
+                                  self.node_cpu_columns[node_ids], self.node_mem_columns[node_ids],
+                                  self.synth_columns))
+        values = np.concatenate((route_cpu[used_routes], route_mem[used_routes],
+                                 cpu, memory,
+                                 np.zeros(len(self.synth_columns))))
 
-        self.update()
+        # Remember which keys showed up, in the order they first showed up.
+        _, first_seen = np.unique(route_ids, return_index=True)
+
+        for route in route_ids[np.sort(first_seen)]:
+            for type, key in self.route_keys[route]:
+                self.keys.setdefault(type, {})[key] = None
+
+        fixed = dict(self.allocatable)
+        fixed[self.store.columns["timestamp"]] = timing["request start"]
+        fixed[self.sample_columns["fresh pods"]] = fresh
+
+        if self.steps:
+            # Set these even with no step, so they don't read as zero.
+            fixed[self.store.columns["step"]] = np.nan if self.step is None else self.step
+            fixed[self.store.columns["step RPS"]] = np.nan if self.step_rps is None else self.step_rps
+
+        for key, value in timing.items():
+            if value is not None:
+                fixed[self.sample_columns[key]] = value
+
+        row = self.store.append(columns, values, fixed)
+
+        for node_id, node in enumerate(self.nodes.values()):
+            cpu_stats = self.store.stats(self.node_cpu_columns[node_id])
+            mem_stats = self.store.stats(self.node_mem_columns[node_id])
+            node.assigned = Usage(MinMax(*cpu_stats), MinMax(*mem_stats))
+
+        aggregate_cpu = time.thread_time() - aggregate_start
 
         formatted_now = now.strftime("%Y-%m-%d %H:%M:%S")
-        csv_row = { "timestamp": formatted_now }
 
-        for node in self.nodes.values():
-            csv_row[f"{node.name} CPU"] = node.assigned.cpu.current
-            csv_row[f"{node.name} allocatable CPU"] = node.allocatable_cpu
-            csv_row[f"{node.name} mem"] = node.assigned.memory.current
-            csv_row[f"{node.name} allocatable mem"] = node.allocatable_memory
+        # Next, figure out if we need to start collecting. Has the cluster
+        # settled down?
+        if "faces" in self.keys.get("normal", {}):
+            self.idle, self.idle_reason = self.idle_detector.check(self.store)
+
+            if self.idle and not self.collecting:
+                self.start_collecting()
+        else:
+            self.idle, self.idle_reason = False, "no Faces pods"
+
+        display_start = time.perf_counter()
 
         if interactive:
             # Clear the screen and print the header before anything else.
             print(clear(), end="")
-            print(f"{formatted_now} {self.state} {self.output_path}\n--------\n")
+            stale = " (stale)" if self.stale else ""
+            print(f"{formatted_now} {self.state}{stale} {self.output_path}")
+            print(f"{'Idle' if self.idle else 'Not idle'}: {self.idle_reason}\n--------\n")
 
             for node in self.nodes.values():
                 print(f"Node {node.shortname(15):15s} {node}")
 
             print("")
 
-        last_type = None
-
-        for type, key, usage in self.items():
-            # First, save to the CSV row.
-            cpu_key = key + " CPU"
-            mem_key = key + " mem"
-
-            if cpu_key in self.field_names_set:
-                csv_row[cpu_key] = int(usage.cpu.current)
-
-            if mem_key in self.field_names_set:
-                csv_row[mem_key] = int(usage.memory.current)
+            last_type = None
 
-            # Next, figure out if we need to start collecting.
-
-            if key == "faces":
-                # Is the Faces application back down to idle? We want to see it less than
-                # 10 mC and 160 MiB.
-
-                if usage.cpu.current < 100_000_000 and usage.memory.current < (1048576 * 160):
-                    self.idle = True
-                    if not self.collecting:
-                        self.start_collecting()
-                else:
-                    self.idle = False
-
-            # Finally, add more to our interactive display if we're doing that.
-            if interactive:
+            for type, key, usage in self.items():
                 if not key:
                     print("")
                     continue
@@ -474,7 +842,7 @@ class AggregateUsage:
                 if type != last_type:
                     last_type = type
 
-                    if (type == "pod") and "mesh" in self.usages:
+                    if (type == "pod") and "mesh" in self.keys:
                         cpu_ratio, memory_ratio = self.ratio("synth", "mesh", "synth", "non-mesh")
 
                         print(f"Mesh CPU ratio:          {cpu_ratio:8s} (smaller is better)")
@@ -489,11 +857,44 @@ class AggregateUsage:
 
                 print(f"{key:44s} {usage}")
 
-        if self.collecting:
+        write_start = time.perf_counter()
+        display_time = write_start - display_start
+
+        if self.collecting and (self.keep_stale or not self.stale):
             if self.writer:
-                self.writer.writerow(csv_row)
+                self.writer.writerow(self.csv_row(formatted_now, row))
                 self.csv_output.flush()
 
+            if self.binary_output:
+                self.binary_output.append(row[:self.store.width])
+
+        if self.overhead_output:
+            end = time.perf_counter()
+
+            self.overhead_output.write(formatted_now, self.state, self.stale, costs, count,
+                                       classify_cpu, aggregate_cpu, display_time,
+                                       end - write_start, end - sample_start)
+
+    def csv_row(self, formatted_now, row):
+        """
+        Format a row from the store for the CSV: empty cells for missing
+        data, seconds to the millisecond for the timing columns, and integers
+        for everything else.
+        """
+        csv_row = [ formatted_now ]
+
+        for i in range(1, self.store.width):
+            value = row[i]
+
+            if np.isnan(value):
+                csv_row.append("")
+            elif i in self.timing_columns:
+                csv_row.append(f"{value:.3f}")
+            else:
+                csv_row.append(int(value))
+
+        return csv_row
+
 
 def main():
     config.load_kube_config()
@@ -502,7 +903,7 @@ def main():
 
     while True:
         agg.sample(True)
-        time.sleep(10)
+        time.sleep(agg.poll_period())
 
 
 if __name__ == "__main__":
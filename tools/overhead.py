@@ -0,0 +1,112 @@
+import csv
+import threading
+
+# The collector keeps track of what each sample costs it, so that we can
+# check that it's putting the same load on the API server no matter which
+# mesh is running, and notice when sampling itself is what's slowing things
+# down. Every sample gets a row in a sidecar CSV next to the metrics CSV
+# ("{rps}-{seq}-collector.csv"), whether or not the sample itself gets
+# written to the metrics CSV:
+#
+# - "api calls", "api time", "api max time": how many API requests the
+#   sample made, their total round-trip time, and the slowest one
+# - "api bytes": total size of the response bodies
+# - "api objects": pods and containers decoded from the responses
+# - "containers": container metrics the sample ended up with
+# - "classify cpu": CPU time spent working out where each container's usage
+#   goes
+# - "aggregate cpu": CPU time spent adding everything up
+# - "display time", "write time": time spent on the interactive display and
+#   on writing the metrics CSV (and binary file, if any)
+# - "sample time": the whole sample, start to finish
+#
+# Times are in milliseconds.
+
+field_names = [
+    "timestamp",
+    "state",
+    "stale",
+    "api calls",
+    "api time",
+    "api max time",
+    "api bytes",
+    "api objects",
+    "containers",
+    "classify cpu",
+    "aggregate cpu",
+    "display time",
+    "write time",
+    "sample time",
+]
+
+
+class ApiCosts:
+    """
+    ApiCosts adds up the cost of the API requests made for a sample. Requests
+    can come from several threads at once, hence the lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.time = 0.0
+        self.max_time = 0.0
+        self.bytes = 0
+        self.objects = 0
+
+    def add(self, elapsed, size=0, objects=0):
+        with self.lock:
+            self.calls += 1
+            self.time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+            self.bytes += size
+            self.objects += objects
+
+    def take(self):
+        """
+        Return (calls, time, max time, bytes, objects) so far, and start over.
+        """
+        with self.lock:
+            totals = (self.calls, self.time, self.max_time, self.bytes, self.objects)
+            self.reset()
+
+        return totals
+
+
+class OverheadWriter:
+    def __init__(self, path):
+        self.path = path
+        self.output = open(path, mode='w', newline='')
+        self.writer = csv.writer(self.output)
+        self.writer.writerow(field_names)
+
+    def write(self, formatted_now, state, stale, costs, containers,
+              classify_cpu, aggregate_cpu, display_time, write_time, sample_time):
+        calls, api_time, api_max_time, size, objects = costs
+
+        self.writer.writerow([
+            formatted_now,
+            state,
+            1 if stale else 0,
+            calls,
+            f"{api_time * 1000:.3f}",
+            f"{api_max_time * 1000:.3f}",
+            size,
+            objects,
+            containers,
+            f"{classify_cpu * 1000:.3f}",
+            f"{aggregate_cpu * 1000:.3f}",
+            f"{display_time * 1000:.3f}",
+            f"{write_time * 1000:.3f}",
+            f"{sample_time * 1000:.3f}",
+        ])
+
+        self.output.flush()
+
+    def close(self):
+        if self.output:
+            self.output.close()
+            self.output = None
@@ -0,0 +1,312 @@
+import hashlib
+import hmac
+import json
+import os
+import stat
+
+import numpy as np
+
+# Finished run files never change, so there's no point in plot.py parsing
+# them all over again every time it's run. ParseCache keeps what each file
+# parsed to in a cache file in the same directory as the data, keyed by file
+# name and checked against the file's size and modification time and the
+# version of the parser that produced it. If any of those don't match (the
+# file has been rewritten, say, or plot.py's parsing has changed), the entry
+# is ignored and the file gets parsed again.
+#
+# The cache file is an NPZ (read with allow_pickle=False, so loading one
+# can't run any code) holding
+#
+# - "index": the bytes of the JSON for
+#
+#     { "version": cache format, "entries": { name: [ identity, value ] } }
+#
+#   where identity is (size, mtime in ns, parser version) and value is
+#   whatever the caller stored
+# - "a0", "a1", ...: the numpy arrays (and lists of floats) in those values,
+#   which the JSON refers to by name
+# - "mac": an HMAC of all of the above
+#
+# Values can be made of dicts, lists, tuples, strings, numbers, None, and
+# numpy arrays; see encode() for how they fit into JSON.
+#
+# Results directories get passed around, so the cache in one might not be
+# ours, and we don't want to plot whatever someone else's cache says is in
+# a file. The HMAC is keyed with a secret that only this user's plot.py
+# knows (see secret_key()), and a cache file whose HMAC doesn't check out is
+# ignored (and rewritten on save), just like a damaged one.
+
+filename = ".plot-cache.npz"
+
+# What earlier versions called their cache files. We never read them, but
+# they're not something to plot, and clear() removes them too.
+old_filenames = [ ".plot-cache.pickle" ]
+
+# Bump this if the layout of the cache file itself changes.
+cache_format = 2
+
+key_path = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                        "great-sidecar-debate", "parse-cache.key")
+
+
+def cache_path(directory):
+    return os.path.join(directory, filename)
+
+
+def is_cache_file(path):
+    """
+    Is path one of our cache files (or a partly written one)?
+    """
+    return os.path.basename(path).startswith(tuple([ filename ] + old_filenames))
+
+
+def clear(paths):
+    """
+    Remove the cache files for the directories that paths are in, returning
+    the ones that were actually there.
+    """
+    removed = []
+
+    for directory in sorted({ os.path.dirname(os.path.abspath(path)) for path in paths }):
+        for name in [ filename ] + old_filenames:
+            path = os.path.join(directory, name)
+
+            if os.path.exists(path):
+                os.remove(path)
+                removed.append(path)
+
+    return removed
+
+
+def secret_key():
+    """
+    Return the key that this user's cache files are signed with, making it
+    the first time we need it. The key file has to be ours and private: if
+    it isn't (or we can't make one), we use a key just for this run, so we
+    don't trust any existing cache, and the caches we write only last until
+    we exit.
+    """
+    try:
+        os.makedirs(os.path.dirname(key_path), mode=0o700, exist_ok=True)
+
+        try:
+            fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, "wb") as outfile:
+                outfile.write(os.urandom(32))
+
+        with open(key_path, "rb") as infile:
+            info = os.fstat(infile.fileno())
+
+            if info.st_uid != os.getuid() or info.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+                raise ValueError("it's not private to this user")
+
+            key = infile.read()
+
+        if len(key) < 32:
+            raise ValueError("it's too short")
+
+        return key
+    except (OSError, ValueError) as e:
+        print(f"Can't use parse cache key {key_path} ({e}), so caches won't be reused")
+        return os.urandom(32)
+
+
+def encode(value, arrays):
+    """
+    Return value as something json.dumps can write, moving any numpy arrays
+    (and lists of floats, which are usually long) into arrays. Dicts with
+    keys that aren't strings, or that might be mistaken for one of our own
+    markers, get written as lists of pairs.
+    """
+    if isinstance(value, np.ndarray) or (isinstance(value, list) and value
+                                         and all(type(v) is float for v in value)):
+        name = f"a{len(arrays)}"
+        marker = "__array__" if isinstance(value, np.ndarray) else "__floats__"
+        arrays[name] = np.asarray(value, dtype=np.float64 if marker == "__floats__" else None)
+        return { marker: name }
+
+    if isinstance(value, dict):
+        if all(isinstance(k, str) and not k.startswith("__") for k in value):
+            return { k: encode(v, arrays) for k, v in value.items() }
+
+        return { "__dict__": [ [ encode(k, arrays), encode(v, arrays) ] for k, v in value.items() ] }
+
+    if isinstance(value, tuple):
+        return { "__tuple__": [ encode(v, arrays) for v in value ] }
+
+    if isinstance(value, list):
+        return [ encode(v, arrays) for v in value ]
+
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+
+    raise TypeError(f"can't cache {type(value).__name__}")
+
+
+def decode(value, arrays):
+    """
+    Undo encode().
+    """
+    if isinstance(value, list):
+        return [ decode(v, arrays) for v in value ]
+
+    if not isinstance(value, dict):
+        return value
+
+    if "__array__" in value:
+        return arrays[value["__array__"]]
+
+    if "__floats__" in value:
+        return arrays[value["__floats__"]].tolist()
+
+    if "__dict__" in value:
+        return { decode(k, arrays): decode(v, arrays) for k, v in value["__dict__"] }
+
+    if "__tuple__" in value:
+        return tuple(decode(v, arrays) for v in value["__tuple__"])
+
+    return { k: decode(v, arrays) for k, v in value.items() }
+
+
+def signature(key, index, arrays):
+    """
+    Return the HMAC of the JSON index and the arrays it refers to.
+    """
+    mac = hmac.new(key, digestmod=hashlib.sha256)
+    mac.update(index.encode("utf-8"))
+
+    for name in sorted(arrays):
+        array = np.ascontiguousarray(arrays[name])
+        mac.update(json.dumps([ name, array.dtype.str, array.shape ]).encode("utf-8") + b"\n")
+        mac.update(array.tobytes())
+
+    return mac.hexdigest()
+
+
+class ParseCache:
+    """
+    ParseCache hands out cached parse results for paths, and saves new ones
+    when save() is called. Each directory's cache is only read when a path
+    in that directory is first asked about. With rebuild=True, existing
+    entries are ignored (and overwritten on save).
+    """
+
+    def __init__(self, parser_version, rebuild=False):
+        self.parser_version = parser_version
+        self.rebuild = rebuild
+        self.key = None
+
+        # Directory -> entries, and the directories whose entries have
+        # changed since we read them.
+        self.directories = {}
+        self.dirty = set()
+
+        self.hits = 0
+        self.misses = 0
+
+    def secret(self):
+        if self.key is None:
+            self.key = secret_key()
+
+        return self.key
+
+    def identity(self, path):
+        stat = os.stat(path)
+        return (stat.st_size, stat.st_mtime_ns, self.parser_version)
+
+    def read(self, directory):
+        """
+        Return the entries in directory's cache file, or raise if it's not
+        one we can trust.
+        """
+        with np.load(cache_path(directory), allow_pickle=False) as npz:
+            if "index" not in npz.files or "mac" not in npz.files:
+                raise ValueError("not a parse cache")
+
+            index = npz["index"].tobytes().decode("utf-8")
+            mac = str(npz["mac"])
+            arrays = { name: npz[name] for name in npz.files if name not in ("index", "mac") }
+
+        if not hmac.compare_digest(mac, signature(self.secret(), index, arrays)):
+            raise ValueError("it wasn't written by us")
+
+        cached = json.loads(index)
+
+        if cached.get("version") != cache_format:
+            return {}
+
+        return { name: decode(entry, arrays) for name, entry in cached["entries"].items() }
+
+    def entries(self, directory):
+        if directory not in self.directories:
+            entries = {}
+
+            if not self.rebuild:
+                try:
+                    entries = self.read(directory)
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    # A damaged (or someone else's) cache is just an empty
+                    # one; it'll get rewritten on save.
+                    print(f"Ignoring parse cache in {directory}: {e}")
+                    self.dirty.add(directory)
+
+            self.directories[directory] = entries
+
+        return self.directories[directory]
+
+    def get(self, path):
+        """
+        Return (identity, value) for path, where value is None if we don't
+        have an up-to-date cached value. Pass the identity back to put(), so
+        that a file that changes while it's being parsed doesn't get cached
+        as if it hadn't.
+        """
+        directory, name = os.path.split(os.path.abspath(path))
+        identity = self.identity(path)
+        entry = self.entries(directory).get(name)
+
+        if entry is not None and entry[0] == identity:
+            self.hits += 1
+            return identity, entry[1]
+
+        self.misses += 1
+        return identity, None
+
+    def put(self, path, identity, value):
+        directory, name = os.path.split(os.path.abspath(path))
+        self.entries(directory)[name] = (identity, value)
+        self.dirty.add(directory)
+
+    def save(self):
+        """
+        Write out every directory's cache that has changed, dropping entries
+        for files that aren't there any more.
+        """
+        for directory in sorted(self.dirty):
+            entries = { name: entry for name, entry in self.directories[directory].items()
+                        if os.path.exists(os.path.join(directory, name)) }
+
+            path = cache_path(directory)
+            partial = f"{path}.partial"
+
+            try:
+                arrays = {}
+                index = json.dumps({ "version": cache_format, "entries": encode(entries, arrays) })
+                mac = signature(self.secret(), index, arrays)
+
+                # np.savez would add ".npz" to a file name, but not to a file.
+                with open(partial, "wb") as outfile:
+                    np.savez(outfile, index=np.frombuffer(index.encode("utf-8"), dtype=np.uint8),
+                             mac=np.array(mac), **arrays)
+
+                os.replace(partial, path)
+            except (OSError, TypeError) as e:
+                # Read-only data is fine; we just can't cache it.
+                print(f"Couldn't write parse cache {path}: {e}")
+
+        self.dirty = set()
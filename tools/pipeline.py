@@ -0,0 +1,107 @@
+import threading
+import time
+
+
+class Pipeline:
+    """
+    Pipeline runs a sequence of SingleRuns, overlapping each run's teardown
+    (finishing the output files, downloading logs, deleting the Job) with
+    the next run's wait for the cluster to go idle, which it would have to
+    sit through anyway.
+
+    Anything that changes the cluster stays strictly in order: the next run
+    doesn't create its Job until the previous run's teardown is done, so
+    there's never more than one load generator Job around.
+    """
+
+    def __init__(self):
+        self.previous = None
+        self.previous_done = None
+        self.teardown_thread = None
+        self.teardown_time = 0.0
+        self.teardown_error = None
+
+        # Per run: (run name, teardown seconds, seconds spent waiting for it).
+        self.savings = []
+
+    def teardown(self, single_run):
+        start = time.monotonic()
+
+        try:
+            single_run.teardown()
+        except Exception as e:
+            self.teardown_error = e
+        finally:
+            self.teardown_time = time.monotonic() - start
+
+    def wait_for_teardown(self):
+        """
+        Wait for the previous run's teardown, if it's still going, and
+        record how much time overlapping it saved. Raises if the teardown
+        failed; otherwise calls the run's done callback, if it had one.
+        """
+        if not self.teardown_thread:
+            return
+
+        start = time.monotonic()
+        self.teardown_thread.join()
+        waited = time.monotonic() - start
+
+        single_run = self.previous
+        name = f"{single_run.outdir} {single_run.rps}-{single_run.seq}"
+
+        self.savings.append((name, self.teardown_time, waited))
+        print(f"...teardown of {name} took {self.teardown_time:.1f}s, "
+              f"waited {waited:.1f}s for it, saved {self.teardown_time - waited:.1f}s")
+
+        done = self.previous_done
+
+        self.teardown_thread = None
+        self.previous = None
+        self.previous_done = None
+
+        if self.teardown_error:
+            error = self.teardown_error
+            self.teardown_error = None
+            raise error
+
+        if done:
+            done()
+
+    def run(self, single_run, done=None):
+        """
+        Run a single load pass, leaving its teardown going in the background.
+        done, if given, gets called (from this thread) once the teardown has
+        finished successfully.
+        """
+        single_run.setup()
+
+        if not self.teardown_thread:
+            # Nothing to clean up after, so just make sure there's no stale
+            # Job lying around.
+            single_run.job_manager.delete_job()
+
+        single_run.wait_for_idle()
+
+        # This is the point where we need the cluster to ourselves.
+        self.wait_for_teardown()
+
+        single_run.load()
+        single_run.drain()
+
+        self.previous = single_run
+        self.previous_done = done
+        self.teardown_thread = threading.Thread(target=self.teardown, args=(single_run,),
+                                                name="teardown", daemon=True)
+        self.teardown_thread.start()
+
+    def finish(self):
+        """
+        Wait for the last teardown, and print how much time we saved overall.
+        """
+        self.wait_for_teardown()
+
+        if self.savings:
+            saved = sum(teardown - waited for _, teardown, waited in self.savings)
+            print(f"Pipelining saved {saved:.1f}s over {len(self.savings)} runs "
+                  f"({saved / len(self.savings):.1f}s per run)")
@@ -1,17 +1,27 @@
 import sys
 
+import copy
 import csv
-import json
+import functools
+import gzip
+import io
+import operator
+import os
 import re
 
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 import matplotlib.pyplot as plt
 import matplotlib.colors as pltcolors
 import numpy as np
 from numpy.polynomial import Polynomial
 
+import columnar
 import crunch_utils
+import latency
+import parse_cache
+import recording
 import argparse
 
 def reddish(saturation):
@@ -78,23 +88,94 @@ PlotKeys = {
 }
 
 
+# Bump this whenever a change to MetricsFile (or anything it uses) changes
+# what a file parses to, so that cached results from before the change get
+# thrown away.
+parser_version = 4
+
+wrk2_rps_re = re.compile(r"^\s*Requests/sec:\s+(\d+\.\d+)\s*$", re.MULTILINE)
+
+
+def project(header, fields):
+    """
+    Return the resource-usage field names in header, in order, leaving out
+    any that aren't in fields (if given). The timestamp and the other timing
+    columns just describe when the sample was taken.
+    """
+    return [ f for f in header
+             if (f.endswith(" CPU") or f.endswith(" mem")) and (fields is None or f in fields) ]
+
+
+def sample_rows(matrix, stale=None):
+    """
+    Return the indices of the rows of matrix (one column per resource-usage
+    field, NaN for missing values) that are real samples: not marked stale,
+    and not exact copies of the previous row (where NaNs count as matching).
+    """
+    rows = np.arange(len(matrix)) if stale is None else np.flatnonzero(~stale)
+    matrix = matrix[rows]
+
+    if len(matrix) > 1:
+        same = (matrix[1:] == matrix[:-1]) | (np.isnan(matrix[1:]) & np.isnan(matrix[:-1]))
+        rows = rows[np.concatenate(([ True ], ~np.all(same, axis=1)))]
+
+    return rows
+
+
+def cells(indices):
+    """
+    Return a function that picks the cells at indices out of a CSV row, as a
+    tuple (even if there's only one, or none).
+    """
+    if not indices:
+        return lambda row: ()
+
+    getter = operator.itemgetter(*indices)
+
+    if len(indices) == 1:
+        return lambda row: (getter(row),)
+
+    return getter
+
+
+def text_to_float(rows, indices):
+    """
+    Convert the cells at indices in each of rows (lists of CSV cells) to a
+    float matrix, one column per index, with NaN for empty cells. The cells
+    are all numbers, so converting them as bytes rather than as str is safe,
+    and a lot faster.
+    """
+    pick = cells(indices)
+    text = np.array([ pick(row) for row in rows ], dtype="S").reshape(len(rows), len(indices))
+
+    return np.where(text == b"", b"nan", text).astype(np.float64)
+
+
 class MetricsFile:
     """
     Load a file that contains metrics. At present, we have two kinds:
 
     - kind=Usage: parsed from "metrics" CSV files where the columns are
       specific resource-consumption metrics (e.g. "Faces CPU" or "data-plane
-      mem") and the rows are samples in time
+      mem") and the rows are samples in time (or from the binary columnar
+      versions of those files, "metrics.col" or "metrics.npz")
 
-    - kind=Latency: parsed from "wrk2" files that contain a list of latencies
-      for a given percentile (e.g. "P50" or "P95") at a single point in time
+    - kind=Latency: parsed from load generator logs that contain latencies
+      for given percentiles (e.g. "P50" or "P95") over the whole run, and,
+      for wrk2, the latency histogram they came from
 
     In both cases, we parse RPS and mesh from the file path, which always
     looks like "{mesh}(-\d+)?/{rps}-{seq}-metrics.csv" or
     "{mesh}(-\d+)?/{rps}-{seq}-wrk2-{pod}.log".
+
+    Files from a ramp (one load generator Job stepping through several RPS
+    values) hold several runs' worth of data, one per step; split_steps()
+    breaks them up into one MetricsFile per step.
+
+    If fields is given, Usage files only load those fields.
     """
 
-    def __init__(self, name, infile):
+    def __init__(self, name, infile, fields=None):
         self.kind = None
         self.name = name
         self.data = {}  # Keys are field names for metrics, "P50", "P95", etc. for latencies
@@ -103,9 +184,39 @@ class MetricsFile:
         self.rps = None
         self.seq = None
 
-        if "-metrics" in name:
+        # For ramps: the step this MetricsFile is (once split), and, before
+        # splitting, the per-step data for Usage files (step_data and
+        # step_rps, keyed by step) or the per-step MetricsFiles for Latency
+        # files (step_files).
+        self.step = None
+        self.step_data = {}
+        self.step_rps = {}
+        self.step_files = {}
+
+        # For Latency files from load generators that give us one, the
+        # latency histogram (see latency.py); for oha, the count of
+        # responses with each status code and of each kind of error, too.
+        self.histogram = None
+        self.status_codes = {}
+        self.errors = {}
+
+        if "-metrics" not in name:
+            # Load generator logs are small enough to read in one go, which
+            # lets us check whether this is a ramp.
+            text = infile.read()
+
+            if crunch_utils.ramp_marker_re.search(text):
+                self.parse_ramp_latencies(text)
+                return
+
+            infile = io.StringIO(text)
+
+        if "-metrics" in name and columnar.is_columnar(name):
+            # This is a binary Usage file.
+            self.parse_metrics_columnar(infile, fields)
+        elif "-metrics" in name:
             # This is a Usage file.
-            self.parse_metrics(infile)
+            self.parse_metrics(infile, fields)
         elif "-wrk2-" in name:
             # This is a wrk2 Latency file.
             self.parse_wrk2_latencies(infile)
@@ -125,146 +236,323 @@ class MetricsFile:
         self.mesh, self.rps, self.seq = crunch_utils.parse_filename(self.name, pattern)
         self.run_id = f"{self.mesh}-{self.rps}-{self.seq}"
 
-    def parse_metrics(self, infile):
+    def parse_metrics(self, infile, fields=None):
         """
         Parse a Usage file, which is a CSV where each column is a specific
         kind of resource usage and each row is a sample at a given point in
         time. We end up with a dictionary where the keys are CSV field names
         and the values are lists of the data in each column.
+
+        The CSV module splits the text into cells, but we only look at the
+        cells of each row as a whole, to decide whether to keep it. After
+        that, everything is done a whole column at a time, and only for the
+        columns in fields (if given): we never convert a cell we're not going
+        to plot.
         """
 
         self.kind = "Usage"
-        self.parse_filename("metrics.csv")
-
-        reader = csv.DictReader(infile)
-        self.fieldnames = [f for f in reader.fieldnames if f != 'timestamp']
+        self.parse_filename(r"metrics\.csv")
+
+        reader = csv.reader(infile)
+        header = next(reader, [])
+        width = len(header)
+        columns = { fieldname: i for i, fieldname in enumerate(header) }
+
+        self.fieldnames = project(header, fields)
+
+        # metrics-server only has new data every scrape interval, so if we
+        # polled faster than that, we'll have stale samples that are exact
+        # copies of the previous one. Newer files mark those with "fresh pods"
+        # of zero (and usually don't write them at all); for older files, we
+        # have to spot the duplicates ourselves. Either way, they're not
+        # independent samples, so skip them.
+        fresh = columns.get("fresh pods")
+        usage = cells([ columns[f] for f in project(header, None) ])
+        previous = None
+        rows = []
 
         for row in reader:
-            for fieldname in self.fieldnames:
-                if row[fieldname]:
-                    if fieldname not in self.data:
-                        self.data[fieldname] = []
+            if len(row) != width:
+                # A run that died partway through a write can leave a short
+                # last row; its missing cells are just empty.
+                row = (row + [ "" ] * width)[:width]
 
-                    # The values stored are always integers, but we'll be
-                    # converting them to float values.
-                    value = float(row[fieldname])
+            if fresh is not None and row[fresh] == "0":
+                continue
 
-                    if fieldname.endswith(" CPU"):
-                        # Convert CPU usage from nanocores to millicores.
-                        value /= 1_000_000
-                    elif fieldname.endswith(" mem"):
-                        # Convert memory usage from bytes to megabytes.
-                        value /= 1_048_576
+            values = usage(row)
 
-                    self.data[fieldname].append(value)
+            if values == previous:
+                continue
 
-    def parse_wrk2_latencies(self, infile):
+            previous = values
+            rows.append(row)
+
+        matrix = text_to_float(rows, [ columns[f] for f in self.fieldnames ])
+
+        steps = None
+        step_rps = None
+
+        if "step" in columns:
+            steps, step_rps = text_to_float(rows, [ columns["step"], columns["step RPS"] ]).T
+
+        self.parse_usage(matrix, steps, step_rps)
+
+    def parse_metrics_columnar(self, infile, fields=None):
+        """
+        Parse a binary Usage file (see columnar.py). We end up with the same
+        dictionary as parse_metrics, from the same whole-column processing,
+        but without having to parse any text.
         """
-        Parse a wrk2 Latency file, which contains a list of latencies for a
-        given percentile (e.g. "P50" or "P95") at a single point in time. We
-        end up with a dictionary where the keys are percentile names (e.g.
-        "P50", "P95") and the values are single-element lists of the latencies
-        for those percentiles.
 
-        We use a single-element list rather than a scalar just for parallelism
-        between the Usage files and the Latency files.
+        self.kind = "Usage"
+        self.parse_filename(r"metrics\.(col|npz)")
+
+        columns = columnar.load(infile)
+        header = list(columns.keys())
+
+        usage = [ f for f in header if f.endswith(" CPU") or f.endswith(" mem") ]
+        self.fieldnames = project(header, fields)
+
+        if not usage:
+            return
+
+        # NPZ columns get decompressed every time they're accessed, so get
+        # each one just once.
+        usage_matrix = np.column_stack([ columns[f] for f in usage ])
+
+        # Same stale and duplicate filtering as parse_metrics (where NaNs
+        # count as matching).
+        stale = None
+
+        if "fresh pods" in columns:
+            stale = (columns["fresh pods"] == 0)
+
+        rows = sample_rows(usage_matrix, stale)
+        matrix = usage_matrix[np.ix_(rows, [ usage.index(f) for f in self.fieldnames ])]
+
+        steps = None
+        step_rps = None
+
+        if "step" in columns:
+            steps = columns["step"][rows]
+            step_rps = columns["step RPS"][rows]
+
+        self.parse_usage(matrix, steps, step_rps)
+
+    def parse_usage(self, matrix, steps, step_rps):
         """
-        self.kind = "Latency"
-        self.parse_filename("wrk2(-[a-z0-9]{5}?).log")
-        self.fieldnames = [ "P50", "P75", "P90", "P95", "P99" ]
-        state = 0
-
-        for line in infile:
-            # print(f"{state}: {line.rstrip()}")
-            if state == 0:
-                if "Detailed Percentile spectrum" in line:
-                    state = 1
-                    continue
+        Fill in data (and, for ramps, step_data and step_rps) from a matrix
+        of Usage samples, one column per field name with NaN for missing
+        values, and the ramp step and step RPS of each sample (NaN outside
+        any step) if there are steps.
+        """
+        self.data = self.columns_to_data(matrix)
 
-            if state == 1:
-                if line.strip() == "":
-                    state = 2
-                    continue
+        if steps is not None:
+            for step in np.unique(steps[~np.isnan(steps)]):
+                in_step = (steps == step)
+                self.step_data[int(step)] = self.columns_to_data(matrix[in_step])
+                self.step_rps[int(step)] = int(step_rps[in_step][0])
 
-            if state == 2:
-                if line.startswith("#"):
-                    state = 3
-                    continue
+    def columns_to_data(self, matrix):
+        """
+        Turn a matrix of Usage samples (one column per field name) into a
+        dictionary of field name to list of values, in millicores or MiB,
+        leaving out missing values.
+        """
+        data = {}
 
-                match = re.match(r'\s*(\d+\.\d+)\s+(\d+\.\d+)', line)
+        # Convert CPU usage from nanocores to millicores, and memory usage
+        # from bytes to megabytes, all at once.
+        divisors = np.array([ 1_000_000 if fieldname.endswith(" CPU") else 1_048_576
+                              for fieldname in self.fieldnames ])
+        matrix = matrix / divisors
 
-                if match:
-                    latency = float(match.group(1))
-                    bucket = float(match.group(2)) * 100.0
+        for i, fieldname in enumerate(self.fieldnames):
+            values = matrix[:, i]
+            values = values[~np.isnan(values)]
 
-                    # print("Bucket %f latency %f" % (bucket, latency))
+            if len(values) == 0:
+                continue
 
-                    key = None
-                    if bucket <= 50.0:
-                        key = "P50"
-                    elif bucket <= 75.0:
-                        key = "P75"
-                    elif bucket <= 90.0:
-                        key = "P90"
-                    elif bucket <= 95.0:
-                        key = "P95"
-                    elif bucket <= 99.0:
-                        key = "P99"
+            data[fieldname] = values.tolist()
 
-                    if key:
-                        self.data[key] = [latency]
+        return data
 
-            if state == 3:
-                line = line.strip()
-                match = re.match(r'^Requests/sec:\s+(\d+\.\d+)$', line)
+    def project(self, fields):
+        """
+        Drop any Usage fields that aren't in fields (if given), as if we'd
+        never parsed them.
+        """
+        if fields is None or self.kind != "Usage":
+            return
 
-                if match:
-                    self.rps = float(match.group(1))
+        self.fieldnames = [ f for f in self.fieldnames if f in fields ]
+        self.data = { f: values for f, values in self.data.items() if f in fields }
 
-        for bucket, latency in self.data.items():
-            if not latency:
-                raise Exception(f"No {bucket} found in {self.name}")
+    def parse_wrk2_latencies(self, infile):
+        """
+        Parse a wrk2 Latency file. wrk2 gives us its whole latency histogram
+        (the "Detailed Percentile spectrum"), which we keep as a
+        LatencyHistogram so that CorrelatedMetrics can merge it with the
+        other load generator pods' histograms for the same run. We also end
+        up with a dictionary where the keys are percentile names (e.g.
+        "P50", "P99.9") and the values are single-element lists of this
+        pod's latencies for those percentiles.
+
+        We use a single-element list rather than a scalar just for parallelism
+        between the Usage files and the Latency files.
+        """
+        self.kind = "Latency"
+        self.parse_filename("wrk2(-[a-z0-9]{5}?).log")
+        self.fieldnames = list(latency.percentiles.keys())
+
+        text = infile.read()
+        self.histogram = latency.parse_wrk2_spectrum(text)
+
+        if self.histogram is None or self.histogram.total() == 0:
+            raise Exception(f"No latency spectrum found in {self.name}")
+
+        self.data = { bucket: [ value ] for bucket, value in self.histogram.percentiles().items() }
+
+        match = wrk2_rps_re.search(text)
+
+        if match:
+            self.rps = float(match.group(1))
 
     def parse_oha_latencies(self, infile):
         """
-        Parse an oha Latency file, which is JSON (but with single quotes
-        instead of double quotes, sigh). The really interesting bits are in
-        the "latencyPercentiles" section, which a dict with keys of "p50",
-        "p75", etc. and values that are the latencies for those percentiles.
-        We end up with a dictionary where the keys are percentile names,
-        uppercased (e.g. "P50", "P95") and the values are single-element lists
-        of the latencies.
+        Parse an oha Latency file, which is oha's --json result (see
+        latency.parse_oha_json). We end up with a dictionary where the keys
+        are percentile names, uppercased (e.g. "P50", "P99.9") and the
+        values are single-element lists of this pod's latencies, plus the
+        LatencyHistogram for the pod (if oha told us enough to build one),
+        the achieved RPS, and the counts of each status code and error.
 
         We use a single-element list rather than a scalar just for parallelism
         between the Usage files and the Latency files.
         """
         self.kind = "Latency"
         self.parse_filename("oha(-[a-z0-9]{5}?).log")
-        self.fieldnames = [ "P50", "P75", "P90", "P95", "P99" ]
-
-        # Oha's take on JSON is... uh... kinda broken.
-        oha_text = infile.read().replace("'", "\"").replace("None", "null")
+        self.fieldnames = list(latency.percentiles.keys())
 
         try:
-            oha_data = json.loads(oha_text)
-        except json.JSONDecodeError as e:
-            raise Exception(f"Failed to parse JSON in {self.name}: {e}")
+            oha_data = latency.parse_oha_json(infile.read())
+        except (ValueError, SyntaxError) as e:
+            raise Exception(f"Failed to parse oha output in {self.name}: {e}")
 
-        summary = oha_data.get("summary", {})
+        summary = oha_data.get("summary") or {}
         new_rps = summary.get("requestsPerSec", None)
 
         if new_rps:
             self.rps = new_rps
 
-        for bucket, latency in oha_data["latencyPercentiles"].items():
+        self.status_codes = { str(code): count
+                              for code, count in (oha_data.get("statusCodeDistribution") or {}).items() }
+        self.errors = dict(oha_data.get("errorDistribution") or {})
+
+        for bucket, value in (oha_data.get("latencyPercentiles") or {}).items():
             bucket = bucket.upper()
 
-            if bucket in self.fieldnames:
-                self.data[bucket] = [latency * 1000.0]
+            if bucket in self.fieldnames and value is not None:
+                self.data[bucket] = [value * 1000.0]
+
+        self.histogram = latency.oha_histogram(oha_data)
+
+        if not self.data and self.histogram is None:
+            raise Exception(f"No latencies found in {self.name}")
+
+    def parse_ramp_latencies(self, text):
+        """
+        Parse a Latency file from a ramp, which is the load generator's
+        output for each step, one after the other, each preceded by a
+        crunch_utils.ramp_marker line. Each step is parsed as if it were a
+        Latency file of its own, into step_files.
+        """
+        self.kind = "Latency"
+        markers = list(crunch_utils.ramp_marker_re.finditer(text))
+
+        for i, marker in enumerate(markers):
+            end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+            segment = text[marker.end():end].strip("\n")
+
+            if not segment.strip():
+                # The load generator never got to say anything for this
+                # step (the run was cut short).
+                continue
 
-        for bucket, latency in self.data.items():
-            if not latency:
-                raise Exception(f"No {bucket} found in {self.name}")
+            self.step_files[int(marker.group(1))] = MetricsFile(self.name, io.StringIO(segment))
+
+        if not self.step_files:
+            raise Exception(f"No ramp steps found in {self.name}")
+
+        # The whole file gets its mesh, RPS, etc. from the file name, just
+        # like any of its steps.
+        first = next(iter(self.step_files.values()))
+        self.mesh, self.seq, self.run_id = first.mesh, first.seq, first.run_id
+        self.fieldnames = first.fieldnames
+        self.rps = sum(step_file.rps for step_file in self.step_files.values())
+
+    def split_steps(self):
+        """
+        Return a list of MetricsFiles, one per step if this file is from a
+        ramp, or just this one if it isn't. Each step gets its own run_id,
+        so CorrelatedMetrics treats every step as a run of its own; a Usage
+        step's RPS is the step's target RPS, and a Latency step's is the RPS
+        achieved during that step.
+        """
+        if self.kind == "Latency":
+            steps = self.step_files.items()
+        else:
+            steps = []
+
+            for step, data in self.step_data.items():
+                step_file = copy.copy(self)
+                step_file.data = data
+                step_file.rps = self.step_rps[step]
+                steps.append((step, step_file))
+
+        if not steps:
+            return [ self ]
+
+        split = []
+
+        for step, step_file in sorted(steps):
+            step_file.step = step
+            step_file.run_id = f"{self.run_id}-step{step}"
+            step_file.step_data = {}
+            step_file.step_rps = {}
+            step_file.step_files = {}
+            split.append(step_file)
+
+        return split
+
+    def state(self):
+        """
+        Return this MetricsFile as a plain dictionary, which (unlike the
+        MetricsFile itself) can be unpickled no matter which module plot.py
+        was loaded as, and only holds things the parse cache can store: the
+        histogram becomes a dictionary of its arrays.
+        """
+        state = dict(vars(self))
+
+        if self.histogram is not None:
+            state["histogram"] = { "lows": self.histogram.lows,
+                                   "highs": self.histogram.highs,
+                                   "counts": self.histogram.counts }
+
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        metrics_file = cls.__new__(cls)
+        metrics_file.__dict__.update(state)
+
+        if metrics_file.histogram is not None:
+            metrics_file.histogram = latency.LatencyHistogram(**metrics_file.histogram)
+
+        return metrics_file
 
     def __str__(self):
         return f"MetricsFile({self.kind} {self.name}: {self.mesh}, {self.rps}, {self.seq})"
@@ -280,9 +568,13 @@ class CorrelatedMetrics:
 
     We take _all_ the samples across all runs. If we want to filter outliers,
     that'll come later.
+
+    If wanted_fields is given, we only correlate those fields (and it's worth
+    handing the same fields to load_metrics_files, so that the others don't
+    get loaded either).
     """
 
-    def __init__(self, metrics_files):
+    def __init__(self, metrics_files, wanted_fields=None):
         runs = set()
 
         self.meshes = []
@@ -310,17 +602,29 @@ class CorrelatedMetrics:
         # for a given run_id.
         rpses = defaultdict(lambda: 0)
 
+        # histograms[run_id][mesh] is a list of the latency histograms from all
+        # the workers for that run_id and mesh. Percentiles don't average, so
+        # rather than treating each worker's P99 as a sample of the run's P99,
+        # we merge the histograms and take the run's real percentiles.
+        histograms = defaultdict(lambda: defaultdict(list))
+
         for metrics_file in metrics_files:
             # What kind of file is this?
             if metrics_file.kind == "Latency":
                 # Latency. Add its RPS value to the total for this run_id.
                 rpses[metrics_file.run_id] += metrics_file.rps
+
+                if metrics_file.histogram is not None:
+                    histograms[metrics_file.run_id][metrics_file.mesh].append(metrics_file.histogram)
             else:
                 # Metrics. Remember its RPS as the desired RPS for this
                 # run_id.
                 self.wanted_rps[metrics_file.run_id] = metrics_file.rps
 
             for fieldname in metrics_file.fieldnames:
+                if wanted_fields is not None and fieldname not in wanted_fields:
+                    continue
+
                 if fieldname in metrics_file.data:
                     if fieldname in kinds:
                         if kinds[fieldname] != metrics_file.kind:
@@ -333,10 +637,22 @@ class CorrelatedMetrics:
                     meshes.add(metrics_file.mesh)
                     fields.add(fieldname)
 
-                    # Real data that we need to save in our native-format dict.
-                    native_metrics[metrics_file.run_id][metrics_file.mesh][fieldname].extend(
-                        metrics_file.data[fieldname]
-                    )
+                    # Real data that we need to save in our native-format dict
+                    # (unless it's a percentile we'll get from the merged
+                    # histogram).
+                    if metrics_file.histogram is None:
+                        native_metrics[metrics_file.run_id][metrics_file.mesh][fieldname].extend(
+                            metrics_file.data[fieldname]
+                        )
+
+        # Each run's percentiles are one sample per run, from all its workers.
+        for run_id, mesh_histograms in histograms.items():
+            for mesh, run_histograms in mesh_histograms.items():
+                merged = latency.LatencyHistogram.merge(run_histograms)
+
+                for fieldname, value in merged.percentiles().items():
+                    if fieldname in fields and value is not None:
+                        native_metrics[run_id][mesh][fieldname].append(value)
 
         # At this point, we have each run_id mapped to its total RPS, but those RPS
         # values aren't necessarily likely to be exactly the same run to run -- small
@@ -359,48 +675,12 @@ class CorrelatedMetrics:
 
                 for fieldname in self.fields:
                     if fieldname in native_metrics[run_id][mesh]:
-                        field_kind = kinds[fieldname]
                         native_data = native_metrics[run_id][mesh][fieldname]
-                        dataset = np.array(native_data)
-
-                        if field_kind == "Usage":
-                            # The way our usage data are structured, we'll
-                            # always see resource consumption climbing from
-                            # close to zero at the start, then dropping off to
-                            # something probably close to zero at the end.
-                            # This means that the mean will always be _below_
-                            # the steady state value, so we can filter out the
-                            # rising and falling slopes of the data by tossing
-                            # samples that are less than the mean.
-                            d2 = dataset[(dataset - np.mean(dataset)) > 0]
-
-                            # As a safety, if that got rid of more than half our
-                            # samples, just use the original dataset.
-
-                            if len(d2) >= (len(dataset) / 2):
-                                dataset = d2
-
-                        # Next, calculate mean and standard deviation for this data set...
-                        mean = np.mean(dataset)
-                        stddev = np.std(dataset)
-
-                        # ...and filter out outliers.
-                        filtered_dataset = dataset[np.abs(dataset - mean) <= 1 * stddev]
-
-                        # print(f"Run {run_id} mesh {mesh} fieldname {fieldname}: {len(native_data)} raw samples")
-                        # print(native_data)
-                        # print(f"{len(dataset)} after slope filtering")
-                        # print(dataset)
-                        # print(f"{len(filtered_dataset)} after outlier filtering")
-                        # print(filtered_dataset)
 
                         # Store everything in our data dictionary.
-                        self.data[run_id][mesh][fieldname] = {
-                            "mean": mean,
-                            "stddev": stddev,
-                            "data": dataset,
-                            "filtered": filtered_dataset,
-                        }
+                        self.data[run_id][mesh][fieldname] = crunch_utils.steady_state(
+                            np.array(native_data), kinds[fieldname]
+                        )
 
     def __str__(self):
         return f"CorrelatedMetrics({self.rpses}, {self.meshes})"
@@ -518,6 +798,120 @@ class CorrelatedMetrics:
         return fig
 
 
+def plottable_paths(paths):
+    """
+    Return the paths in paths that we know how to plot, skipping the ones we
+    don't (raw recordings, collector overhead, and so on).
+    """
+    plottable = []
+
+    # If we have both a CSV and a binary file for the same run, only read
+    # the binary one: it's the same data, and it's faster to load.
+    binary_runs = { path.rsplit(".", 1)[0] for path in paths
+                    if columnar.is_columnar(path) }
+
+    for path in paths:
+        if "ERROR" in path:
+            print(f"Skipping {path} because it contains ERROR")
+            continue
+
+        if path.endswith(".csv") and path.rsplit(".", 1)[0] in binary_runs:
+            continue
+
+        if path.endswith(recording.extension):
+            # Raw collector recordings are for replay.py, not for us.
+            continue
+
+        if parse_cache.is_cache_file(path):
+            # Our own parse cache.
+            continue
+
+        if path.endswith("-collector.csv") or path.endswith("-job.jsonl"):
+            # The collector's own overhead and the load generator's lifecycle
+            # events aren't things we plot.
+            continue
+
+        plottable.append(path)
+
+    return plottable
+
+
+def load_path(path, fields=None):
+    """
+    Load the MetricsFiles for a single path: usually just one, but ramps
+    turn into one per step.
+    """
+    if columnar.is_columnar(path):
+        opener = lambda: open(path, 'rb')
+    elif path.endswith(".gz"):
+        # Load generator logs may be gzipped.
+        opener = lambda: gzip.open(path, 'rt')
+    else:
+        opener = lambda: open(path, 'r')
+
+    with opener() as infile:
+        return [ metrics_file.state() for metrics_file in MetricsFile(path, infile, fields).split_steps() ]
+
+
+def load_metrics_files(paths, workers=1, cache=None, fields=None):
+    """
+    Load a MetricsFile for each of paths that we know how to plot. With
+    workers > 1, the files get parsed across that many processes; either way,
+    the MetricsFiles come back in the same order as paths, so everything
+    downstream sees exactly the same thing.
+
+    If cache is a parse_cache.ParseCache, files it has up-to-date results
+    for don't get parsed at all, and the results for the ones that do get
+    parsed are saved in it.
+
+    If fields is given, Usage files only load those fields. Cached results
+    are always for every field (so that they're just as useful for the next
+    plot, whatever it plots), and get cut down to fields afterward.
+    """
+    paths = plottable_paths(paths)
+
+    # Parsed results (lists of MetricsFile states), by index into paths.
+    loaded = [ None ] * len(paths)
+    identities = {}
+
+    if cache:
+        for i, path in enumerate(paths):
+            identities[i], loaded[i] = cache.get(path)
+
+    todo = [ i for i in range(len(paths)) if loaded[i] is None ]
+    todo_paths = [ paths[i] for i in todo ]
+    load = functools.partial(load_path, fields=None if cache else fields)
+
+    if workers > 1 and len(todo) > 1:
+        # Parsing is pure CPU work, so threads wouldn't help. Hand out paths
+        # in chunks so that the per-file overhead of talking to the workers
+        # stays small next to the parsing itself.
+        workers = min(workers, len(todo))
+        chunksize = max(1, len(todo) // (workers * 4))
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(load, todo_paths, chunksize=chunksize))
+    else:
+        results = [ load(path) for path in todo_paths ]
+
+    for i, states in zip(todo, results):
+        loaded[i] = states
+
+        if cache:
+            cache.put(paths[i], identities[i], states)
+
+    if cache:
+        cache.save()
+
+    metrics_files = [ MetricsFile.from_state(state) for states in loaded for state in states ]
+
+    if cache:
+        for metrics_file in metrics_files:
+            metrics_file.project(fields)
+
+    return metrics_files
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Plot metrics from input files.")
     parser.add_argument("-i", "--interactive", action="store_true", help="Enable interactive mode (default: off)")
@@ -526,70 +920,88 @@ if __name__ == "__main__":
     parser.add_argument("-f", "--fields", help="Comma-separated list fields to include in the plot (default: two plots of data-plane usage)")
     parser.add_argument("-t", "--title", help="Title (only when --fields is used)")
     parser.add_argument("-u", "--unit", help="Unit (only when --fields is used)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Number of processes to parse files with (default: number of CPUs)")
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the parse cache (default: use it)")
+    parser.add_argument("--rebuild-cache", action="store_true", help="Reparse every file and rewrite the parse cache (default: off)")
+    parser.add_argument("--clear-cache", action="store_true", help="Remove the parse cache next to each path, then exit (default: off)")
     parser.add_argument("paths", nargs="+", help="Paths to metrics files")
 
     args = parser.parse_args()
 
-    metrics_files = []
+    if args.clear_cache:
+        for path in parse_cache.clear(args.paths):
+            print(f"Removed {path}")
 
-    for path in args.paths:
-        if "ERROR" in path:
-            print(f"Skipping {path} because it contains ERROR")
-            continue
+        sys.exit(0)
 
-        with open(path, 'r') as infile:
-            metrics_files.append(MetricsFile(path, infile))
+    cache = None
 
-    if metrics_files:
-        correlated_metrics = CorrelatedMetrics(metrics_files)
+    if not args.no_cache:
+        cache = parse_cache.ParseCache(parser_version, rebuild=args.rebuild_cache)
 
-        if args.fields:
-            title = args.title if args.title else "Custom Plot"
-            unit = args.unit if args.unit else "unknown"
+    fields = []
+    plotkeys = {}
 
-            raw_fields = args.fields.split(",")
+    if args.fields:
+        raw_fields = args.fields.split(",")
 
-            fields = []
-            plotkeys = {}
+        for field in raw_fields:
+            elements = field.split(":")
+            alpha = None
 
-            for field in raw_fields:
-                elements = field.split(":")
-                alpha = None
+            if len(elements) > 1:
+                alpha = float(elements[1])
 
-                if len(elements) > 1:
-                    alpha = float(elements[1])
+                for mesh, color in [
+                    ("linkerd", bluish(alpha) ),
+                    ("ambient", reddish(alpha) ),
+                    ("istio", purplish(alpha)),
+                    ("unmeshed", greenish(alpha)) ]:
+                    key = f"{mesh} {elements[0]}"
+                    plotkeys[key] = (key, color)
 
-                    for mesh, color in [
-                        ("linkerd", bluish(alpha) ),
-                        ("ambient", reddish(alpha) ),
-                        ("istio", purplish(alpha)),
-                        ("unmeshed", greenish(alpha)) ]:
-                        key = f"{mesh} {elements[0]}"
-                        plotkeys[key] = (key, color)
+            fields.append(elements[0])
 
-                fields.append(elements[0])
+    cpu_fields = [ "data-plane CPU", "ztunnel mesh CPU", "waypoint mesh CPU" ]
+    mem_fields = [ "data-plane mem", "ztunnel mesh mem", "waypoint mesh mem" ]
+    latency_fields = [ "P50", "P75", "P90", "P95", "P99" ]
+
+    # Only load the fields we're going to plot.
+    wanted_fields = set(fields if args.fields else cpu_fields + mem_fields)
+
+    if args.latency:
+        wanted_fields.update(latency_fields)
+
+    metrics_files = load_metrics_files(args.paths, workers=args.jobs, cache=cache, fields=wanted_fields)
+
+    if cache and cache.hits:
+        print(f"Parse cache: {cache.hits} files cached, {cache.misses} parsed")
+
+    if metrics_files:
+        correlated_metrics = CorrelatedMetrics(metrics_files, wanted_fields=wanted_fields)
+
+        if args.fields:
+            title = args.title if args.title else "Custom Plot"
+            unit = args.unit if args.unit else "unknown"
 
             fig = correlated_metrics.plot(title, unit, args.degree, *fields, plotkeys=plotkeys)
 
             if not args.interactive:
                 fig.savefig(f"custom.png")
         else:
-            dp_cpu_fig = correlated_metrics.plot("Data Plane CPU", "mC", args.degree,
-                        "data-plane CPU", "ztunnel mesh CPU", "waypoint mesh CPU")
+            dp_cpu_fig = correlated_metrics.plot("Data Plane CPU", "mC", args.degree, *cpu_fields)
 
             if not args.interactive:
                 dp_cpu_fig.savefig(f"data-plane-CPU.png")
 
-            dp_mem_fig = correlated_metrics.plot("Data Plane Memory", "MiB", args.degree,
-                    "data-plane mem", "ztunnel mesh mem", "waypoint mesh mem")
+            dp_mem_fig = correlated_metrics.plot("Data Plane Memory", "MiB", args.degree, *mem_fields)
 
             if not args.interactive:
                 dp_mem_fig.savefig(f"data-plane-mem.png")
 
         if args.latency:
             latency_fig = correlated_metrics.plot(
-                "Latency -- LOW CONFIDENCE", "ms", args.degree,
-                "P50", "P75", "P90", "P95", "P99"
+                "Latency -- LOW CONFIDENCE", "ms", args.degree, *latency_fields
             )
 
             if not args.interactive:
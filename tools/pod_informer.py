@@ -0,0 +1,361 @@
+import json
+import threading
+import time
+
+from kubernetes import client
+from kubernetes.watch.watch import iter_resp_lines
+
+# We ask for pods as a Table: the same thing kubectl gets for "kubectl get
+# pods", which is just each pod's metadata plus the columns kubectl shows
+# (including the node), rather than every pod's entire spec and status. API
+# servers that can't do Tables fall back to plain JSON, thanks to the second
+# entry in the Accept header.
+table_accept = "application/json;as=Table;v=v1;g=meta.k8s.io,application/json"
+plain_accept = "application/json"
+
+
+def pod_record(pod):
+    """
+    Pull the fields we care about out of a pod, which may be either a V1Pod
+    or the equivalent dictionary (as in a recording), and return (name,
+    resourceVersion, node, labels).
+    """
+    if hasattr(pod, "metadata"):
+        return (pod.metadata.name, pod.metadata.resource_version,
+                pod.spec.node_name if pod.spec else None,
+                pod.metadata.labels or {})
+
+    metadata = pod.get("metadata") or {}
+    spec = pod.get("spec") or {}
+
+    return (metadata.get("name"), metadata.get("resourceVersion"),
+            spec.get("nodeName"), metadata.get("labels") or {})
+
+
+class PodInformer:
+    """
+    PodInformer keeps an in-memory index of every pod in the cluster, mapping
+    the pod name to the node it's running on and its labels.
+
+    Listing every pod in the cluster on every sample gets expensive on big
+    clusters, so instead we do one initial list and then follow a watch
+    stream to keep the index current. If the watch drops, we resume it from
+    the last resourceVersion we saw; if the API server tells us that
+    resourceVersion is too old (410 Gone), we relist from scratch.
+
+    Both the list and the watch ask for raw Table responses (see
+    table_accept), and we pull out just the fields we need, instead of having
+    the client build a complete V1Pod for every pod.
+    """
+
+    # How long we keep deleted pods around. The metrics API lags reality, so
+    # it can keep reporting a pod for a little while after the pod is gone,
+    # and we'd still like to know which node it was on.
+    tombstone_seconds = 120
+
+    def __init__(self, v1, watch_timeout=300, recorder=None, clock=time.monotonic):
+        self.v1 = v1
+        self.watch_timeout = watch_timeout
+        self.recorder = recorder
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.index = {}
+        self.deleted = {}
+        self.resource_version = None
+        self.relists = 0
+
+        # Which Table column has the node in it. Watch events don't always
+        # include the column definitions, so we remember them from the list.
+        self.accept = table_accept
+        self.node_column = None
+
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def start(self):
+        """
+        Do the initial list synchronously (so that the index is usable as
+        soon as we return), then start following the watch stream in the
+        background.
+        """
+        if self.thread:
+            return
+
+        self.list()
+
+        self.thread = threading.Thread(target=self.run, name="pod-informer", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # The watch thread notices this at the next event, or when the watch
+        # times out; it's a daemon thread, so it won't hold up exiting.
+        self.stopping.set()
+
+    def get(self, pod_name):
+        """
+        Return (node, labels) for the given pod name, or None if we don't
+        know about it.
+        """
+        with self.lock:
+            entry = self.index.get(pod_name)
+
+            if entry is None:
+                tombstone = self.deleted.get(pod_name)
+
+                if tombstone:
+                    entry = tombstone[0]
+
+            return entry
+
+    def node_for(self, pod_name, default="unknown"):
+        entry = self.get(pod_name)
+
+        if entry is None:
+            return default
+
+        return entry[0]
+
+    def labels_for(self, pod_name):
+        entry = self.get(pod_name)
+
+        if entry is None:
+            return {}
+
+        return entry[1]
+
+    def lookup(self, keys, executor, costs=None):
+        """
+        Directly read the pods named by keys, a collection of (namespace,
+        name) tuples, concurrently on executor, adding whatever we find to the
+        index. This is for pods that show up in the metrics API before their
+        watch event gets to us. If costs (an overhead.ApiCosts) is set, the
+        cost of each read gets added to it.
+        """
+        def read(key):
+            namespace, name = key
+            start = time.monotonic()
+
+            try:
+                response = self.v1.read_namespaced_pod(name=name, namespace=namespace,
+                                                       _preload_content=False,
+                                                       _headers={ "Accept": self.accept })
+            except client.exceptions.ApiException as e:
+                if e.status == 404:
+                    return None
+                raise
+
+            pod = json.loads(response.data)
+
+            if costs:
+                costs.add(time.monotonic() - start, len(response.data), 1)
+
+            return pod
+
+        for pod in executor.map(read, keys):
+            if pod is not None:
+                self.add(pod)
+
+    def add(self, pod):
+        """
+        Add a single pod that we read directly (which might be a Table with
+        one row).
+        """
+        if self.recorder:
+            self.recorder.record("pod", pod)
+
+        for name, _, node, labels in self.records(pod):
+            with self.lock:
+                self.index.setdefault(name, (node, labels))
+
+    def list(self):
+        response = self.v1.list_pod_for_all_namespaces(watch=False, _preload_content=False,
+                                                       _headers={ "Accept": self.accept })
+        pod_list = json.loads(response.data)
+
+        if self.recorder:
+            self.recorder.record("pods", pod_list)
+
+        self.load(pod_list)
+
+        if pod_list.get("kind") == "Table" and self.node_column is None:
+            # A Table without a Node column is no use to us, so switch to
+            # plain pod lists.
+            print("WARNING: pod Table has no Node column, falling back to full pod lists")
+            self.accept = plain_accept
+            self.list()
+
+    def records(self, obj):
+        """
+        Yield (name, resourceVersion, node, labels) for every pod in obj,
+        which can be a pod, a pod list, or a Table of pods, either as raw
+        dictionaries or (for pods and pod lists) as V1 models.
+        """
+        if not isinstance(obj, dict):
+            items = getattr(obj, "items", None)
+
+            if items is None:
+                yield pod_record(obj)
+            else:
+                for pod in items:
+                    yield pod_record(pod)
+
+            return
+
+        if obj.get("kind") == "Table":
+            columns = obj.get("columnDefinitions")
+
+            if columns:
+                self.node_column = None
+
+                for i, column in enumerate(columns):
+                    if column.get("name") == "Node":
+                        self.node_column = i
+
+            for row in obj.get("rows") or []:
+                metadata = (row.get("object") or {}).get("metadata") or {}
+                cells = row.get("cells") or []
+                node = None
+
+                if self.node_column is not None and self.node_column < len(cells):
+                    node = cells[self.node_column]
+
+                    if node in ("", "<none>"):
+                        node = None
+
+                yield (metadata.get("name"), metadata.get("resourceVersion"),
+                       node, metadata.get("labels") or {})
+        elif "items" in obj:
+            for pod in obj["items"]:
+                yield pod_record(pod)
+        else:
+            yield pod_record(obj)
+
+    def load(self, pod_list):
+        """
+        Replace the whole index with the contents of a pod list (a Table, a
+        PodList, or a V1PodList).
+        """
+        if isinstance(pod_list, dict):
+            resource_version = (pod_list.get("metadata") or {}).get("resourceVersion")
+        else:
+            resource_version = pod_list.metadata.resource_version
+
+        index = {}
+
+        for name, _, node, labels in self.records(pod_list):
+            index[name] = (node, labels)
+
+        with self.lock:
+            self.index = index
+            self.deleted = {}
+            self.resource_version = resource_version
+
+    def run(self):
+        backoff = 1
+
+        while not self.stopping.is_set():
+            try:
+                self.follow()
+                backoff = 1
+            except client.exceptions.ApiException as e:
+                if e.status != 410:
+                    print(f"WARNING: pod watch failed: {e.status} {e.reason}")
+                    self.stopping.wait(backoff)
+                    backoff = min(backoff * 2, 30)
+                    continue
+
+                # Our resourceVersion is too old: start over with a fresh
+                # list.
+                try:
+                    self.list()
+                    self.relists += 1
+                except Exception as e:
+                    print(f"WARNING: pod relist failed: {e}")
+                    self.stopping.wait(backoff)
+                    backoff = min(backoff * 2, 30)
+            except Exception as e:
+                # Connection resets and the like. Just resume from where we
+                # were.
+                if not self.stopping.is_set():
+                    print(f"WARNING: pod watch interrupted: {e}")
+                    self.stopping.wait(backoff)
+                    backoff = min(backoff * 2, 30)
+
+    def follow(self):
+        """
+        Follow a single watch stream until it times out, applying each event
+        to the index as we go.
+        """
+        response = self.v1.list_pod_for_all_namespaces(watch=True,
+                                                       resource_version=self.resource_version,
+                                                       allow_watch_bookmarks=True,
+                                                       timeout_seconds=self.watch_timeout,
+                                                       _preload_content=False,
+                                                       _headers={ "Accept": self.accept })
+
+        try:
+            for line in iter_resp_lines(response):
+                if self.stopping.is_set():
+                    break
+
+                if not line:
+                    continue
+
+                event = json.loads(line)
+
+                if event["type"] == "ERROR":
+                    # This is where a 410 Gone shows up.
+                    status = event.get("object") or {}
+                    raise client.exceptions.ApiException(status=status.get("code"),
+                                                         reason=status.get("reason"))
+
+                self.apply(event["type"], event["object"])
+        finally:
+            response.close()
+            response.release_conn()
+
+    def apply(self, event_type, obj):
+        """
+        Apply a watch event. obj is usually a Table with a single row, but
+        can be a pod (or a Table with several rows).
+        """
+        if self.recorder:
+            self.recorder.record("pod-event", obj, type=event_type)
+
+        now = self.clock()
+
+        if event_type == "BOOKMARK":
+            # Bookmarks have nothing in them but a resourceVersion.
+            if isinstance(obj, dict):
+                resource_version = (obj.get("metadata") or {}).get("resourceVersion")
+            else:
+                resource_version = obj.metadata.resource_version
+
+            if resource_version:
+                with self.lock:
+                    self.resource_version = resource_version
+
+            return
+
+        for name, resource_version, node, labels in self.records(obj):
+            with self.lock:
+                if resource_version:
+                    self.resource_version = resource_version
+
+                if event_type == "DELETED":
+                    entry = self.index.pop(name, None)
+
+                    if entry is not None:
+                        self.deleted[name] = (entry, now)
+                else:
+                    self.index[name] = (node, labels)
+                    self.deleted.pop(name, None)
+
+        with self.lock:
+            # Drop tombstones that have been around long enough.
+            expired = [ k for k, (_, when) in self.deleted.items()
+                        if now - when > self.tombstone_seconds ]
+
+            for k in expired:
+                del self.deleted[k]
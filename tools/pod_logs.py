@@ -0,0 +1,171 @@
+import gzip
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class LogCollector:
+    """
+    LogCollector downloads the logs from a set of pods (selected by
+    label_selector) straight to disk, a chunk at a time, instead of reading
+    each whole log into memory first. Logs go to
+    "{prefix}-{pod name}.log", or "{prefix}-{pod name}.log.gz" if compress
+    is set.
+
+    follow() starts streaming logs while the pods are still running, one
+    thread per pod, so that by the time the pods are done their logs are
+    mostly already on disk. finish() waits for those streams to end, then
+    fetches (concurrently) any logs that weren't completely streamed: pods
+    that showed up after follow() was called, streams that broke partway
+    through, streams that are somehow still going, and streams that ended
+    before the pod's container did.
+
+    That last one matters: a follow stream can be closed early, without any
+    error, by an idle timeout in the API server or kubelet (and oha prints
+    nothing at all until it's done), so a stream that ends cleanly only
+    counts as complete if the container has actually terminated.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, core_v1, namespace, label_selector, prefix, compress=False, workers=8):
+        self.core_v1 = core_v1
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.prefix = prefix
+        self.compress = compress
+        self.workers = workers
+
+        self.lock = threading.Lock()
+
+        # Per pod: "streaming", "done", "incomplete", "failed", or
+        # "fetching".
+        self.status = {}
+        self.threads = {}
+
+    def path_for(self, pod_name):
+        suffix = ".log.gz" if self.compress else ".log"
+        return f"{self.prefix}-{pod_name}{suffix}"
+
+    def pod_names(self):
+        pods = self.core_v1.list_namespaced_pod(namespace=self.namespace,
+                                                label_selector=self.label_selector)
+        return [ pod.metadata.name for pod in pods.items ]
+
+    def terminated(self, pod_name):
+        """
+        Return whether all of the pod's containers have terminated (so that
+        its log can't get any longer).
+        """
+        try:
+            pod = self.core_v1.read_namespaced_pod(name=pod_name, namespace=self.namespace)
+        except Exception as e:
+            print(f"WARNING: couldn't check whether {pod_name} is finished: {e}")
+            return False
+
+        statuses = (pod.status and pod.status.container_statuses) or []
+
+        return bool(statuses) and all(status.state and status.state.terminated
+                                      for status in statuses)
+
+    def download(self, pod_name, path, follow=False):
+        """
+        Copy a pod's log to path, a chunk at a time, and return the number
+        of bytes copied. With follow, this doesn't return until the pod's
+        container exits.
+        """
+        response = self.core_v1.read_namespaced_pod_log(name=pod_name, namespace=self.namespace,
+                                                        follow=follow, _preload_content=False)
+        opener = gzip.open if self.compress else open
+        size = 0
+
+        try:
+            with opener(path, "wb") as outfile:
+                for chunk in response.stream(self.chunk_size):
+                    outfile.write(chunk)
+                    size += len(chunk)
+        finally:
+            response.release_conn()
+
+        return size
+
+    def follow(self, pod_names=None):
+        """
+        Start streaming logs for pod_names (default: every pod that matches
+        right now) in the background.
+        """
+        if pod_names is None:
+            pod_names = self.pod_names()
+
+        for pod_name in pod_names:
+            with self.lock:
+                if pod_name in self.status:
+                    continue
+
+                self.status[pod_name] = "streaming"
+
+            thread = threading.Thread(target=self.stream, args=(pod_name,),
+                                      name=f"log-{pod_name}", daemon=True)
+            self.threads[pod_name] = thread
+            thread.start()
+
+    def stream(self, pod_name):
+        try:
+            self.download(pod_name, self.path_for(pod_name), follow=True)
+
+            if self.terminated(pod_name):
+                status = "done"
+            else:
+                print(f"...log stream from {pod_name} ended early, will fetch it again")
+                status = "incomplete"
+        except Exception as e:
+            print(f"WARNING: log stream from {pod_name} failed: {e}")
+            status = "failed"
+
+        with self.lock:
+            # finish() may have given up on us already, in which case it's
+            # fetched the log itself.
+            if self.status.get(pod_name) == "streaming":
+                self.status[pod_name] = status
+
+    def finish(self, timeout=30):
+        """
+        Wait up to timeout seconds for any log streams to end, then fetch
+        whatever we're still missing. Returns the paths of all the logs.
+        """
+        deadline = time.monotonic() + timeout
+
+        for thread in list(self.threads.values()):
+            thread.join(max(0, deadline - time.monotonic()))
+
+        pod_names = self.pod_names()
+        missing = []
+
+        with self.lock:
+            for pod_name in pod_names:
+                if self.status.get(pod_name) != "done":
+                    # If a stream is still going, it's abandoned now; the
+                    # fetch below replaces its file rather than sharing it.
+                    self.status[pod_name] = "fetching"
+                    missing.append(pod_name)
+
+        def fetch(pod_name):
+            path = self.path_for(pod_name)
+            partial = f"{path}.partial"
+
+            print(f"...collecting logs from {pod_name}...")
+
+            self.download(pod_name, partial)
+            os.replace(partial, path)
+
+            with self.lock:
+                self.status[pod_name] = "done"
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="logs") as executor:
+                # list() so that any exception gets raised here.
+                list(executor.map(fetch, missing))
+
+        return [ self.path_for(pod_name) for pod_name in pod_names ]
@@ -0,0 +1,88 @@
+import gzip
+import json
+import threading
+import time
+
+# A recording is a gzipped file of JSON lines, one per raw API response (or
+# pod watch event) that the collector saw, in the order it saw them:
+#
+#   {"t": 1745241155.123, "kind": "metrics", "body": {...}, ...}
+#
+# Kinds are:
+#
+# - "start": the first line, with the collector in use and whether rows
+#   are tagged with ramp "steps"
+# - "nodes": the node list
+# - "pods": a full pod list (the informer's initial list, or a relist)
+# - "pod-event": a pod watch event, with its "type"
+# - "pod": a single pod read directly
+# - "sample": the start of a sample
+# - "metrics": a metrics API response, with its "start" and "end" times
+# - "summary": a kubelet Summary response for the given "node", with its
+#   "start" and "end" times
+# - "state": AggregateUsage moved to the given "state" (e.g. "RUNNING")
+# - "step": in ramp mode, the ramp moved to the given "step" (None for no
+#   step), with total target "rps"
+#
+# Kubernetes model objects get turned back into the same dictionaries the
+# API server sent, so a recording always has raw API data in it.
+
+extension = ".jsonl.gz"
+
+
+def serialize(obj):
+    if isinstance(obj, (dict, list)):
+        return obj
+
+    from kubernetes import client
+    return client.ApiClient().sanitize_for_serialization(obj)
+
+
+class Recorder:
+    def __init__(self, path, collector, steps=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.output = gzip.open(path, "wt", encoding="utf-8")
+
+        self.record("start", None, collector=collector, steps=steps)
+
+    def record(self, kind, body, **extra):
+        entry = { "t": time.time(), "kind": kind }
+        entry.update(extra)
+
+        if body is not None:
+            entry["body"] = serialize(body)
+
+        line = json.dumps(entry, separators=(",", ":"))
+
+        with self.lock:
+            if self.output:
+                self.output.write(line + "\n")
+
+                # Flush at the start of each sample, so that a run that dies
+                # partway through loses at most one sample's worth.
+                if kind == "sample":
+                    self.output.flush()
+
+    def close(self):
+        with self.lock:
+            if self.output:
+                self.output.close()
+                self.output = None
+
+
+def read(path):
+    """
+    Yield every entry in a recording, in order. A recording from a run that
+    died partway through may end with a truncated line (or a truncated gzip
+    stream); we just stop there.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as infile:
+        try:
+            for line in infile:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    return
+        except EOFError:
+            return
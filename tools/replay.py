@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+
+import json
+import os
+import sys
+import time
+
+from types import SimpleNamespace
+
+import recording
+
+from metrics import AggregateUsage
+from pod_informer import PodInformer
+
+
+class ReplayPodIndex(PodInformer):
+    """
+    ReplayPodIndex is a PodInformer that gets fed from a recording instead of
+    from the API server.
+    """
+
+    def __init__(self, cluster):
+        super().__init__(None, clock=cluster.clock)
+        self.cluster = cluster
+
+    def start(self):
+        pass
+
+    def lookup(self, keys, executor, costs=None):
+        # Whatever the original run looked up directly is in the recording,
+        # right after the response that made it go looking.
+        for entry in self.cluster.lookups:
+            self.add(entry["body"])
+
+        self.cluster.lookups = []
+
+
+class ReplayCluster:
+    """
+    ReplayCluster stands in for both the kubernetes client module and the
+    API objects AggregateUsage gets from it, serving up the responses from a
+    recording instead of talking to a cluster. Use samples() to step through
+    the recording one sample at a time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = recording.read(path)
+        self.now = 0.0
+
+        self.node_list = None
+        self.metrics = []
+        self.summaries = {}
+        self.lookups = []
+        self.pods = ReplayPodIndex(self)
+
+        # State (and ramp step) changes get applied to agg once it's set;
+        # until then, they wait in states (and step).
+        self.agg = None
+        self.states = []
+        self.step = None
+
+        start = next(self.entries, None)
+
+        if not start or start["kind"] != "start":
+            raise ValueError(f"{path} is not a collector recording")
+
+        self.collector = start["collector"]
+        self.steps = start.get("steps", False)
+        self.now = start["t"]
+
+        # Everything up to the first sample is setup: the node list, the
+        # informer's initial pod list, and maybe some watch events.
+        self.pending = None
+
+        for entry in self.entries:
+            if entry["kind"] == "sample":
+                self.pending = entry
+                break
+
+            self.replay(entry)
+
+        if self.node_list is None:
+            raise ValueError(f"{path} has no node list")
+
+    def replay(self, entry):
+        """
+        Apply a non-response entry from the recording.
+        """
+        kind = entry["kind"]
+
+        if kind == "nodes":
+            self.node_list = entry["body"]
+        elif kind == "pods":
+            self.pods.load(entry["body"])
+        elif kind == "pod-event":
+            self.pods.apply(entry["type"], entry["body"])
+        elif kind == "pod":
+            self.pods.add(entry["body"])
+        elif kind == "state":
+            self.states.append(entry["state"])
+            self.apply_states()
+        elif kind == "step":
+            self.step = (entry["step"], entry["rps"])
+            self.apply_states()
+
+    def apply_states(self):
+        """
+        Follow the original run's state changes. Usually AggregateUsage gets
+        to the same state by itself while replaying the same sample, in which
+        case this does nothing.
+        """
+        if not self.agg:
+            return
+
+        for state in self.states:
+            if state == "RUNNING" and self.agg.state == "STARTING":
+                self.agg.start_collecting()
+            elif state == "DRAINING":
+                self.agg.start_draining()
+
+        self.states = []
+
+        if self.step:
+            self.agg.set_step(*self.step)
+            self.step = None
+
+    def samples(self):
+        """
+        Step through the recording: each time this yields, the responses for
+        one sample are queued up, ready for AggregateUsage.sample().
+        """
+        while self.pending:
+            marker = self.pending
+            self.pending = None
+
+            self.now = marker["t"]
+            self.metrics = []
+            self.summaries = {}
+            self.lookups = []
+
+            # Watch events that arrived after the response came back get
+            # applied after the sample, just like they were originally.
+            after = []
+
+            for entry in self.entries:
+                kind = entry["kind"]
+
+                if kind == "sample":
+                    self.pending = entry
+                    break
+                elif kind == "metrics":
+                    self.metrics.append(entry)
+                elif kind == "summary":
+                    self.summaries[entry["node"]] = entry
+                elif kind == "pod":
+                    self.lookups.append(entry)
+                elif self.metrics or self.summaries:
+                    after.append(entry)
+                else:
+                    self.replay(entry)
+
+            if not self.metrics and not self.summaries:
+                # The run ended before this sample's response came back.
+                break
+
+            # The collector reads the clock just before it sends its request,
+            # so by then it has to say when the original request went out.
+            self.now = min(entry["start"] for entry in self.metrics + list(self.summaries.values()))
+
+            yield marker
+
+            for entry in after:
+                self.replay(entry)
+
+    def clock(self):
+        return self.now
+
+    def respond(self, entry):
+        # Once the response is in, it's whenever it originally came back.
+        # (Summaries are fetched concurrently, so only the last one back
+        # gets to move the clock.)
+        self.now = max(self.now, entry["end"])
+        return entry["body"]
+
+    # The parts of the kubernetes client module that AggregateUsage uses...
+
+    def CoreV1Api(self):
+        return self
+
+    def CustomObjectsApi(self):
+        return self
+
+    # ...and the parts of the API objects.
+
+    def list_node(self):
+        return SimpleNamespace(items=self.node_list["items"])
+
+    def list_cluster_custom_object(self, group, version, plural, **kwargs):
+        body = self.respond(self.metrics.pop(0))
+        return SimpleNamespace(data=json.dumps(body).encode("utf-8"))
+
+    def connect_get_node_proxy_with_path(self, name, path, **kwargs):
+        body = self.respond(self.summaries.pop(name))
+        return SimpleNamespace(data=json.dumps(body).encode("utf-8"))
+
+
+def replay(path, output_path, interactive=False, binary_path=None):
+    """
+    Feed a recording back through AggregateUsage at full speed, writing a
+    new metrics CSV (if output_path is set). Returns the number of samples
+    and the time spent in AggregateUsage.sample().
+    """
+    cluster = ReplayCluster(path)
+
+    agg = AggregateUsage(cluster, output_path, binary_path=binary_path,
+                         collector=cluster.collector, pods=cluster.pods,
+                         clock=cluster.clock, steps=cluster.steps)
+
+    cluster.agg = agg
+    cluster.apply_states()
+
+    count = 0
+    elapsed = 0.0
+
+    for _ in cluster.samples():
+        start = time.perf_counter()
+        agg.sample(interactive)
+        elapsed += time.perf_counter() - start
+        count += 1
+
+    agg.close()
+
+    return count, elapsed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay a collector recording through AggregateUsage.")
+    parser.add_argument("-i", "--interactive", action="store_true", help="Show the interactive display for each sample (default: off)")
+    parser.add_argument("--binary", action="store_true", help="Also write metrics in binary columnar form (default: off)")
+    parser.add_argument("recording", type=str, help="Recording to replay")
+    parser.add_argument("output", type=str, nargs="?", help="Metrics CSV to write (default: none)")
+
+    args = parser.parse_args()
+
+    binfile = None
+
+    if args.binary:
+        if not args.output:
+            print("--binary needs an output file")
+            sys.exit(1)
+
+        binfile = os.path.splitext(args.output)[0] + ".col"
+
+    count, elapsed = replay(args.recording, args.output, interactive=args.interactive, binary_path=binfile)
+
+    if count:
+        print(f"Replayed {count} samples in {elapsed:.3f}s ({elapsed / count * 1000:.3f} ms per sample)")
+    else:
+        print("No samples to replay")
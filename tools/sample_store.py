@@ -0,0 +1,146 @@
+import numpy as np
+
+
+class SampleStore:
+    """
+    SampleStore keeps every sample of a run in a single NumPy matrix, one row
+    per sample and one column per field. The first columns are the ones from
+    build_field_names, in order, so a row can go straight out to the CSV;
+    anything else we're asked to track (e.g. pods we don't write to the CSV)
+    gets an extra column on the end.
+
+    Cells that have no data for a sample are NaN. Min and max are computed
+    over a window of rows, which starts wherever restart() was last called.
+    """
+
+    def __init__(self, field_names, capacity=256):
+        self.names = list(field_names)
+        self.columns = { name: i for i, name in enumerate(self.names) }
+
+        # Columns before this are the CSV columns.
+        self.width = len(self.names)
+
+        self.data = np.full((capacity, len(self.names)), np.nan)
+        self.count = 0
+        self.first = 0
+
+        # present marks the columns that have had data at any point in the
+        # current window: once a column shows up, it reads as zero rather
+        # than NaN until the window restarts.
+        self.present = np.zeros(len(self.names), dtype=bool)
+
+        self._minimum = None
+        self._maximum = None
+
+    def column(self, name):
+        """
+        Return the column index for name, adding a new column if needed.
+        """
+        index = self.columns.get(name)
+
+        if index is not None:
+            return index
+
+        index = len(self.names)
+        self.names.append(name)
+        self.columns[name] = index
+
+        if index >= self.data.shape[1]:
+            # Grow in chunks, since new columns tend to show up in bunches.
+            extra = np.full((self.data.shape[0], 64), np.nan)
+            self.data = np.hstack((self.data, extra))
+            self.present = np.concatenate((self.present, np.zeros(64, dtype=bool)))
+
+        return index
+
+    def restart(self):
+        """
+        Start a new window with the next sample: min and max will only cover
+        samples from here on, and columns start out absent again.
+        """
+        self.first = self.count
+        self.present[:] = False
+
+    def append(self, columns, values, fixed=None):
+        """
+        Add a sample. columns and values are parallel arrays: each value is
+        added to the total for its column, so a column can appear any number
+        of times. fixed is an optional dict of column index to value for
+        things that are set rather than summed (timestamps and the like).
+        """
+        if self.count == self.data.shape[0]:
+            extra = np.full(self.data.shape, np.nan)
+            self.data = np.vstack((self.data, extra))
+
+        ncols = self.data.shape[1]
+
+        row = np.bincount(columns, weights=values, minlength=ncols)
+        self.present[columns] = True
+
+        if fixed:
+            indices = np.fromiter(fixed.keys(), dtype=np.intp, count=len(fixed))
+            row[indices] = np.fromiter(fixed.values(), dtype=float, count=len(fixed))
+            self.present[indices] = True
+
+        row[~self.present] = np.nan
+
+        self.data[self.count] = row
+        self.count += 1
+
+        self._minimum = None
+        self._maximum = None
+
+        return row
+
+    def window(self):
+        """
+        Return the rows in the current window.
+        """
+        return self.data[self.first:self.count]
+
+    def history(self, index):
+        """
+        Return every value of a single column in the current window.
+        """
+        return self.data[self.first:self.count, index]
+
+    def tail(self, count):
+        """
+        Return up to the last count rows, whether or not they're in the
+        current window.
+        """
+        return self.data[max(0, self.count - count):self.count]
+
+    def latest(self):
+        return self.data[self.count - 1]
+
+    def current(self, index):
+        if self.count == 0:
+            return 0.0
+
+        value = self.data[self.count - 1, index]
+        return 0.0 if np.isnan(value) else value
+
+    def minimum(self):
+        if self._minimum is None:
+            self._minimum = np.fmin.reduce(self.window(), axis=0)
+
+        return self._minimum
+
+    def maximum(self):
+        if self._maximum is None:
+            self._maximum = np.fmax.reduce(self.window(), axis=0)
+
+        return self._maximum
+
+    def stats(self, index):
+        """
+        Return (current, min, max) for a column, with None for min and max
+        if the column has no data in the current window.
+        """
+        low = self.minimum()[index] if self.count > self.first else np.nan
+
+        if np.isnan(low):
+            return self.current(index), None, None
+
+        return self.current(index), low, self.maximum()[index]
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+
+import os
+import csv
+import sys
+import argparse
+
+from adaptive import run_means
+from latency import LatencyHistogram
+from manifest import RunManifest
+from metrics import collector_names
+from plot import load_metrics_files
+from session import BenchmarkSession
+from single import run
+
+# saturate.py looks for the highest RPS a mesh can actually sustain, rather
+# than measuring at fixed RPS points. Starting from --start, it doubles (or
+# halves) the target RPS until it has one target the mesh keeps up with and
+# one it doesn't, then binary-searches between them until they're within
+# --resolution RPS of each other.
+#
+# A run "keeps up" if the achieved RPS (summed across all the load generator
+# pods) is within --tolerance of the target and, if --p99-limit is set, the
+# run's P99 latency is at or below it. That's the P99 of all the load
+# generator pods' latency histograms merged, if the load generator gives us
+# histograms, or the worst pod's P99 if not.
+#
+# Each run is a normal single.py run, written to "${OUTDIR}/${MESH}-saturation"
+# as "${RPS}-0-..." (so plot.py will happily plot the resource curve), and
+# the search itself goes to "${OUTDIR}/${MESH}-saturation.csv": one row per
+# run, in the order they were done. A target that was already tried (by an
+# earlier search in the same OUTDIR, say) has its old files thrown away
+# before it's run again, so they can't get mixed in with the new ones.
+
+field_names = [
+    "target RPS",
+    "achieved RPS",
+    "P99",
+    "data-plane CPU",
+    "data-plane mem",
+    "sustained",
+]
+
+
+def run_latency(outdir, rps, seq):
+    """
+    Return (achieved RPS, P99 in ms) for a run, from its load generator
+    logs. Either is None if no logs had it.
+    """
+    paths = [ os.path.join(outdir, name) for name in RunManifest.run_files(outdir, rps, seq) ]
+    achieved = None
+    p99 = None
+    histograms = []
+
+    # We only need the load generator logs, so don't load any usage.
+    for metrics_file in load_metrics_files(paths, fields=[]):
+        if metrics_file.kind != "Latency":
+            continue
+
+        achieved = (achieved or 0) + metrics_file.rps
+
+        if metrics_file.histogram is not None:
+            histograms.append(metrics_file.histogram)
+        elif metrics_file.data.get("P99"):
+            p99 = max(p99 or 0, metrics_file.data["P99"][0])
+
+    if histograms:
+        p99 = LatencyHistogram.merge(histograms).value_at(99.0)
+
+    return achieved, p99
+
+
+class SaturationSearch:
+    """
+    SaturationSearch does the bracketing and bisection; run_one(target) has
+    to do a run at target RPS and return its row (see field_names). If
+    on_row is given, it gets called with each row, with "sustained" filled
+    in, as soon as it's done.
+    """
+
+    def __init__(self, run_one, start=600, tolerance=0.05, p99_limit=None,
+                 resolution=50, min_rps=10, max_rps=50000, on_row=None):
+        self.run_one = run_one
+        self.on_row = on_row
+        self.start = start
+        self.tolerance = tolerance
+        self.p99_limit = p99_limit
+        self.resolution = resolution
+        self.min_rps = min_rps
+        self.max_rps = max_rps
+
+        self.rows = []
+
+        # Highest target we've kept up with, and lowest one we haven't.
+        self.good = None
+        self.bad = None
+
+    def sustained(self, target, achieved, p99):
+        if achieved is None or achieved < target * (1 - self.tolerance):
+            return False
+
+        if self.p99_limit is not None and (p99 is None or p99 > self.p99_limit):
+            return False
+
+        return True
+
+    def try_rps(self, target):
+        row = self.run_one(target)
+        row["sustained"] = self.sustained(target, row["achieved RPS"], row["P99"])
+        self.rows.append(row)
+
+        if self.on_row:
+            self.on_row(row)
+
+        if row["sustained"]:
+            self.good = target if self.good is None else max(self.good, target)
+        else:
+            self.bad = target if self.bad is None else min(self.bad, target)
+
+        print(f"Saturation search: {target} RPS achieved {row['achieved RPS']}, "
+              f"P99 {row['P99']} ms: {'sustained' if row['sustained'] else 'NOT sustained'}")
+
+        return row["sustained"]
+
+    def search(self):
+        """
+        Run the search, and return the highest sustained RPS (or None if
+        even min_rps wasn't sustainable).
+        """
+        target = self.start
+
+        # Bracket: go up until we fail, or down until we succeed.
+        if self.try_rps(target):
+            while self.bad is None:
+                if target >= self.max_rps:
+                    print(f"Sustained {target} RPS, which is as high as we'll go")
+                    return self.good
+
+                target = min(target * 2, self.max_rps)
+                self.try_rps(target)
+        else:
+            while self.good is None:
+                if target <= self.min_rps:
+                    print(f"Couldn't sustain even {target} RPS")
+                    return None
+
+                target = max(target // 2, self.min_rps)
+                self.try_rps(target)
+
+        # Bisect.
+        while self.bad - self.good > self.resolution:
+            target = (self.good + self.bad) // 2
+
+            # Keep targets on multiples of the resolution, so that they're
+            # easy to read and easy to compare between meshes.
+            target = max(self.good + 1, min(self.bad - 1, round(target / self.resolution) * self.resolution))
+            self.try_rps(target)
+
+        return self.good
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the highest RPS a mesh can sustain.")
+    parser.add_argument("--duration", type=str, default="300s",
+                        help="Duration of each test (default: 300s)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of workers (default: 1)")
+    parser.add_argument("--connections", type=int, default=200,
+                        help="Connections to maintain (default: 200)")
+    parser.add_argument("--loadgen", type=str, default="oha",
+                        help="Load generator (default: oha)")
+    parser.add_argument("--affinity", action="store_true",
+                        help="Enable CPU affinity")
+    parser.add_argument("--binary", action="store_true",
+                        help="Also write metrics in binary columnar form (default: off)")
+    parser.add_argument("--collector", type=str, default="metrics-server", choices=collector_names,
+                        help="Where to get usage from: the metrics API or the kubelet Summary API (default: metrics-server)")
+    parser.add_argument("--gzip-logs", action="store_true",
+                        help="Gzip load generator logs (default: off)")
+    parser.add_argument("--context", type=str, default=None,
+                        help="Kubeconfig context to use (default: current context)")
+    parser.add_argument("--start", type=int, default=600,
+                        help="RPS to start searching from (default: 600)")
+    parser.add_argument("--max-rps", type=int, default=50000,
+                        help="Highest RPS to try (default: 50000)")
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="How far below the target the achieved RPS can be and still count as sustained (default: 0.05)")
+    parser.add_argument("--p99-limit", type=float, default=None,
+                        help="Highest P99 latency, in ms, that counts as sustained (default: no limit)")
+    parser.add_argument("--resolution", type=int, default=50,
+                        help="Stop once the saturation point is known to within this many RPS (default: 50)")
+    parser.add_argument("mesh", type=str,
+                        help="Mesh name")
+    parser.add_argument("outdir", type=str,
+                        help="Top-level output directory")
+
+    args = parser.parse_args()
+
+    outdir = os.path.join(args.outdir, f"{args.mesh}-saturation")
+    os.makedirs(outdir, exist_ok=True)
+
+    csv_path = os.path.join(args.outdir, f"{args.mesh}-saturation.csv")
+    output = open(csv_path, "w", newline="")
+    writer = csv.DictWriter(output, fieldnames=field_names)
+    writer.writeheader()
+
+    session = BenchmarkSession(args.context)
+
+    def run_one(target):
+        # Every target is different, so every run is sequence 0.
+        print(f"Running {args.loadgen} saturation test at {target} RPS, outdir {outdir}...")
+
+        # run_latency and run_means pick up every file for this target, so
+        # anything left from an earlier try has to go first.
+        for name in RunManifest.run_files(outdir, target, 0):
+            print(f"...discarding earlier output {os.path.join(outdir, name)}")
+            os.remove(os.path.join(outdir, name))
+
+        run(outdir, target, 0, args.duration, args.loadgen,
+            args.workers, args.connections, args.affinity,
+            binary=args.binary, collector=args.collector,
+            compress_logs=args.gzip_logs, session=session)
+
+        achieved, p99 = run_latency(outdir, target, 0)
+        means = run_means(outdir, target, 0)
+
+        return {
+            "target RPS": target,
+            "achieved RPS": achieved,
+            "P99": p99,
+            "data-plane CPU": means.get("data-plane CPU"),
+            "data-plane mem": means.get("data-plane mem"),
+        }
+
+    # Write each row as soon as we have it, so that an interrupted search
+    # still leaves something useful behind.
+    def write_row(row):
+        writer.writerow(row)
+        output.flush()
+
+    search = SaturationSearch(run_one, start=args.start, tolerance=args.tolerance,
+                              p99_limit=args.p99_limit, resolution=args.resolution,
+                              max_rps=args.max_rps, on_row=write_row)
+
+    saturation = search.search()
+    output.close()
+    session.close()
+
+    print()
+    print(f"{args.mesh}: {len(search.rows)} runs, results in {csv_path}")
+
+    if saturation is None:
+        print(f"{args.mesh}: couldn't sustain any RPS tried")
+        sys.exit(1)
+
+    print(f"{args.mesh}: saturates between {saturation} RPS (sustained) and "
+          f"{search.bad if search.bad is not None else 'more than ' + str(saturation)} RPS")
+
+    print()
+    print(f"{'target':>8} {'achieved':>10} {'P99 ms':>8} {'DP CPU mC':>10} {'DP mem MiB':>11}")
+
+    for row in sorted(search.rows, key=lambda r: r["target RPS"]):
+        def show(value, fmt):
+            return format(value, fmt) if value is not None else "-"
+
+        print(f"{row['target RPS']:>8} {show(row['achieved RPS'], '10.1f')} {show(row['P99'], '8.2f')} "
+              f"{show(row['data-plane CPU'], '10.1f')} {show(row['data-plane mem'], '11.1f')}"
+              f"{'' if row['sustained'] else '  (not sustained)'}")
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+
+import os
+import re
+import sys
+import argparse
+import multiprocessing
+import queue
+
+from manifest import RunManifest
+from metrics import collector_names
+from pipeline import Pipeline
+from session import BenchmarkSession
+from single import SingleRun, run
+
+# scheduler.py is sequence.py spread across several identical clusters. Each
+# kubeconfig context gets its own process, with its own BenchmarkSession,
+# AggregateUsage, and JobManager, pulling runs off a shared queue until
+# there aren't any left. All the clusters write straight into the usual
+# "${OUTDIR}/${MESH}-${LOOP}" layout (every run has its own file names, so
+# there's nothing to collide), and the parent process keeps the same
+# manifest sequence.py does, so an interrupted sweep can be resumed with
+# either tool.
+#
+# Each cluster's interactive display and progress messages go to
+# "${OUTDIR}/${MESH}-${CONTEXT}.log" instead of the terminal, since several
+# displays fighting over one screen isn't useful to anyone.
+
+
+def log_path(outdir, mesh, context):
+    # Contexts are often things like "arn:aws:eks:...:cluster/foo", which
+    # don't make great filenames.
+    safe = re.sub(r"[^A-Za-z0-9._-]+", "_", context)
+    return os.path.join(outdir, f"{mesh}-{safe}.log")
+
+
+def worker(context, options, runs, results):
+    """
+    Run everything we can get off the runs queue against context, reporting
+    progress on the results queue. Stops at the first failure, on the theory
+    that a cluster that's failed one run is more likely than not to fail the
+    next one too; the failed run is left for a later resume.
+    """
+    logfile = open(log_path(options["outdir"], options["mesh"], context), "a", buffering=1)
+    sys.stdout = logfile
+    sys.stderr = logfile
+
+    current = None
+    pipeline = None
+    session = None
+
+    try:
+        session = BenchmarkSession(context)
+
+        if options["pipeline"]:
+            pipeline = Pipeline()
+
+        while True:
+            item = runs.get()
+
+            if item is None:
+                break
+
+            loop, rps, seq, outdir = item
+            current = (loop, rps, seq)
+
+            results.put(("started", context, current))
+            print(f"Running {options['loadgen']} test {loop:02d} for {rps} RPS, sequence {seq}, outdir {outdir}...")
+
+            def done(key=current):
+                results.put(("complete", context, key))
+
+            if pipeline:
+                pipeline.run(SingleRun(outdir, rps, seq, options["duration"], options["loadgen"],
+                                       options["workers"], options["connections"], options["affinity"],
+                                       binary=options["binary"], collector=options["collector"],
+                                       record=options["record"], follow_logs=not options["no_follow_logs"],
+                                       compress_logs=options["gzip_logs"],
+                                       idle_window=options["idle_window"],
+                                       idle_tolerance=options["idle_tolerance"], session=session),
+                             done=done)
+            else:
+                run(outdir, rps, seq, options["duration"], options["loadgen"],
+                    options["workers"], options["connections"], options["affinity"],
+                    binary=options["binary"], collector=options["collector"], record=options["record"],
+                    follow_logs=not options["no_follow_logs"], compress_logs=options["gzip_logs"],
+                    idle_window=options["idle_window"], idle_tolerance=options["idle_tolerance"],
+                    session=session)
+                done()
+
+        if pipeline:
+            pipeline.finish()
+    except Exception as e:
+        print(f"FAILED: {e}")
+        results.put(("failed", context, current, f"{type(e).__name__}: {e}"))
+    finally:
+        if session:
+            session.close()
+
+        results.put(("exited", context, None))
+        logfile.close()
+
+
+def schedule(contexts, options, manifest, plan):
+    """
+    Run every (loop, rps, seq, outdir) in plan that isn't already complete,
+    spread across contexts. Returns the number of runs that failed.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    runs = ctx.Queue()
+    results = ctx.Queue()
+
+    pending = 0
+
+    for loop, rps, seq, outdir in plan:
+        if manifest.is_complete(loop, rps, seq):
+            continue
+
+        runs.put((loop, rps, seq, outdir))
+        pending += 1
+
+    print(f"{pending} runs to do across {len(contexts)} clusters")
+
+    if not pending:
+        return 0
+
+    # One end marker per worker, so they all stop once the queue is empty.
+    for _ in contexts:
+        runs.put(None)
+
+    workers = {}
+
+    for context in contexts:
+        process = ctx.Process(target=worker, args=(context, options, runs, results),
+                              name=f"cluster-{context}", daemon=True)
+        process.start()
+        workers[context] = process
+
+        print(f"...{context}: logging to {log_path(options['outdir'], options['mesh'], context)}")
+
+    failures = 0
+
+    while workers:
+        try:
+            message = results.get(timeout=5)
+        except queue.Empty:
+            # A worker that died outright (OOM killer, say) never says it
+            # exited, so check for that ourselves.
+            for context, process in list(workers.items()):
+                if not process.is_alive() and process.exitcode != 0:
+                    print(f"{context}: worker died with exit code {process.exitcode}")
+                    failures += 1
+                    del workers[context]
+
+            continue
+
+        kind, context, key = message[:3]
+
+        if kind == "started":
+            loop, rps, seq = key
+            manifest.start(loop, rps, seq, context=context)
+            print(f"{context}: started {loop:02d} {rps}-{seq}")
+        elif kind == "complete":
+            loop, rps, seq = key
+            manifest.complete(loop, rps, seq)
+
+            complete, planned = manifest.counts()
+            print(f"{context}: finished {loop:02d} {rps}-{seq} ({complete} of {planned} complete)")
+        elif kind == "failed":
+            failures += 1
+            print(f"{context}: FAILED at {key}: {message[3]}; no more runs on this cluster")
+        elif kind == "exited":
+            workers.pop(context).join()
+
+    complete, planned = manifest.counts()
+    print(f"Done: {complete} of {planned} runs complete")
+
+    if complete < planned:
+        print("Rerun the same command to retry the rest.")
+
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a sequence of tests across several clusters and collect metrics.")
+    parser.add_argument("--contexts", type=str, required=True,
+                        help="Comma-separated list of kubeconfig contexts, one per cluster")
+    parser.add_argument("--duration", type=str, default="1800s",
+                        help="Duration of test (default: 1800s)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of workers (default: 1)")
+    parser.add_argument("--connections", type=int, default=200,
+                        help="Connections to maintain (default: 200)")
+    parser.add_argument("--loadgen", type=str, default="oha",
+                        help="Load generator (default: oha)")
+    parser.add_argument("--affinity", action="store_true",
+                        help="Enable CPU affinity")
+    parser.add_argument("--binary", action="store_true",
+                        help="Also write metrics in binary columnar form (default: off)")
+    parser.add_argument("--collector", type=str, default="metrics-server", choices=collector_names,
+                        help="Where to get usage from: the metrics API or the kubelet Summary API (default: metrics-server)")
+    parser.add_argument("--record", action="store_true",
+                        help="Record raw API responses for replay (default: off)")
+    parser.add_argument("--no-follow-logs", action="store_true",
+                        help="Only download load generator logs after each run, rather than streaming them during it (default: stream)")
+    parser.add_argument("--gzip-logs", action="store_true",
+                        help="Gzip load generator logs (default: off)")
+    parser.add_argument("--idle-window", type=int, default=4,
+                        help="Fresh samples that have to be steady before the cluster counts as idle (default: 4)")
+    parser.add_argument("--idle-tolerance", type=float, default=0.05,
+                        help="How steady the cluster has to be to count as idle, as a fraction of usage (default: 0.05)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="On each cluster, overlap each run's log collection and cleanup with the next run's wait for idle (default: off)")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="Number of tests to run at each RPS (default: 5)")
+    parser.add_argument("--loops", type=int, default=1,
+                        help="Number of loops over all RPSes (default: 1)")
+    parser.add_argument("--rps", type=str, default="60,120,240,600,1200",
+                        help="Comma-separated RPS list (default: 60,120,240,600,1200)")
+    parser.add_argument("mesh", type=str,
+                        help="Mesh name")
+    parser.add_argument("outdir", type=str,
+                        help="Top-level output directory")
+
+    args = parser.parse_args()
+
+    contexts = [ context for context in args.contexts.split(",") if context ]
+
+    if len(set(contexts)) != len(contexts):
+        print("Each context can only be listed once")
+        sys.exit(1)
+
+    rps_list = [int(rps) for rps in args.rps.split(",")]
+
+    os.makedirs(args.outdir, exist_ok=True)
+
+    try:
+        manifest = RunManifest(os.path.join(args.outdir, f"{args.mesh}-manifest.json"),
+                               args.mesh, vars(args))
+    except ValueError as e:
+        print(f"Can't resume: {e}")
+        sys.exit(1)
+
+    plan = []
+
+    for loop in range(args.loops):
+        for rps in rps_list:
+            for seq in range(args.runs):
+                outdir = os.path.join(args.outdir, f"{args.mesh}-{loop:02d}")
+                manifest.plan(loop, rps, seq, outdir)
+                plan.append((loop, rps, seq, outdir))
+
+    manifest.save()
+
+    if schedule(contexts, vars(args), manifest, plan):
+        sys.exit(1)
@@ -1,9 +1,15 @@
 #!/usr/bin/env python
 
 import os
+import sys
 import argparse
 
-from single import run
+from adaptive import AdaptiveRuns
+from manifest import RunManifest
+from metrics import collector_names
+from pipeline import Pipeline
+from session import BenchmarkSession
+from single import SingleRun, run
 
 parser = argparse.ArgumentParser(description="Run a sequence of tests and collect metrics.")
 parser.add_argument("--duration", type=str, default="1800s",
@@ -16,8 +22,32 @@ parser.add_argument("--loadgen", type=str, default="oha",
                     help="Load generator (default: oha)")
 parser.add_argument("--affinity", action="store_true",
                     help="Enable CPU affinity")
+parser.add_argument("--binary", action="store_true",
+                    help="Also write metrics in binary columnar form (default: off)")
+parser.add_argument("--collector", type=str, default="metrics-server", choices=collector_names,
+                    help="Where to get usage from: the metrics API or the kubelet Summary API (default: metrics-server)")
+parser.add_argument("--record", action="store_true",
+                    help="Record raw API responses for replay (default: off)")
+parser.add_argument("--no-follow-logs", action="store_true",
+                    help="Only download load generator logs after each run, rather than streaming them during it (default: stream)")
+parser.add_argument("--gzip-logs", action="store_true",
+                    help="Gzip load generator logs (default: off)")
+parser.add_argument("--context", type=str, default=None,
+                    help="Kubeconfig context to use (default: current context)")
+parser.add_argument("--idle-window", type=int, default=4,
+                    help="Fresh samples that have to be steady before the cluster counts as idle (default: 4)")
+parser.add_argument("--idle-tolerance", type=float, default=0.05,
+                    help="How steady the cluster has to be to count as idle, as a fraction of usage (default: 0.05)")
+parser.add_argument("--pipeline", action="store_true",
+                    help="Overlap each run's log collection and cleanup with the next run's wait for idle (default: off)")
 parser.add_argument("--runs", type=int, default=5,
-                    help="Number of tests to run at each RPS (default: 5)")
+                    help="Number of tests to run at each RPS, or the maximum with --adaptive (default: 5)")
+parser.add_argument("--adaptive", action="store_true",
+                    help="Stop repeating an RPS once its results are precise enough (default: off)")
+parser.add_argument("--min-runs", type=int, default=2,
+                    help="Minimum number of tests at each RPS with --adaptive (default: 2)")
+parser.add_argument("--ci-target", type=float, default=0.05,
+                    help="With --adaptive, stop once every key field's 95%% CI half-width is within this fraction of its mean (default: 0.05)")
 parser.add_argument("--loops", type=int, default=1,
                     help="Number of loops over all RPSes (default: 1)")
 parser.add_argument("--rps", type=str, default="60,120,240,600,1200",
@@ -32,15 +62,101 @@ args = parser.parse_args()
 # Parse the RPS list
 rps_list = [int(rps) for rps in args.rps.split(",")]
 
+# The manifest records which runs are done, so that rerunning the same
+# command after an interruption picks up where it left off.
+os.makedirs(args.outdir, exist_ok=True)
+
+try:
+    manifest = RunManifest(os.path.join(args.outdir, f"{args.mesh}-manifest.json"),
+                           args.mesh, vars(args))
+except ValueError as e:
+    print(f"Can't resume: {e}")
+    sys.exit(1)
+
+for loop in range(args.loops):
+    for rps in rps_list:
+        for seq in range(args.runs):
+            manifest.plan(loop, rps, seq, os.path.join(args.outdir, f"{args.mesh}-{loop:02d}"))
+
+manifest.save()
+
+complete, planned = manifest.counts()
+
+if complete:
+    print(f"Resuming: {complete} of {planned} runs already complete")
+
+# One session for the whole sequence, so that every run shares the same API
+# connections, node list, classifier, templates and pod informer.
+session = BenchmarkSession(args.context)
+pipeline = None
+
+if args.pipeline:
+    pipeline = Pipeline()
+
+adaptive = None
+
+if args.adaptive:
+    adaptive = AdaptiveRuns(target=args.ci_target, min_runs=args.min_runs, max_runs=args.runs)
+
+
+def start_run(loop, rps, seq, outdir):
+    """
+    Start a single run. Without --pipeline, it's finished when this returns;
+    with --pipeline, its teardown is still going.
+    """
+    print(f"Running {args.loadgen} test {loop:02d} for {rps} RPS, sequence {seq}, outdir {outdir}...")
+
+    manifest.start(loop, rps, seq)
+
+    def done(loop=loop, rps=rps, seq=seq):
+        manifest.complete(loop, rps, seq)
+
+    if pipeline:
+        pipeline.run(SingleRun(outdir, rps, seq, args.duration, args.loadgen,
+                               args.workers, args.connections, args.affinity,
+                               binary=args.binary, collector=args.collector, record=args.record,
+                               follow_logs=not args.no_follow_logs, compress_logs=args.gzip_logs,
+                               idle_window=args.idle_window, idle_tolerance=args.idle_tolerance,
+                               session=session),
+                     done=done)
+    else:
+        run(outdir, rps, seq, args.duration, args.loadgen,
+            args.workers, args.connections, args.affinity,
+            binary=args.binary, collector=args.collector, record=args.record,
+            follow_logs=not args.no_follow_logs, compress_logs=args.gzip_logs,
+            idle_window=args.idle_window, idle_tolerance=args.idle_tolerance, session=session)
+        done()
+
+
 # Loop over the RPS list and run the tests
 for loop in range(args.loops):
     for rps in rps_list:
+        enough = False
+
         for seq in range(args.runs):
             outdir = os.path.join(args.outdir, f"{args.mesh}-{loop:02d}")
 
-            print(f"Running {args.loadgen} test {loop:02d} for {rps} RPS, sequence {seq}, outdir {outdir}...")
-            run(outdir, rps, seq, args.duration, args.loadgen,
-                args.workers, args.connections, args.affinity)
+            if enough:
+                manifest.skip(loop, rps, seq)
+                continue
+
+            if manifest.is_complete(loop, rps, seq):
+                print(f"Skipping {args.loadgen} test {loop:02d} for {rps} RPS, sequence {seq}: already complete")
+            else:
+                start_run(loop, rps, seq, outdir)
+
+            if adaptive:
+                # We need this run's logs to know its achieved RPS, so this
+                # is one place pipelining can't help.
+                if pipeline:
+                    pipeline.wait_for_teardown()
+
+                adaptive.add(outdir, rps, seq)
+                enough, why = adaptive.done(outdir, rps)
 
+                print(f"...{rps} RPS: {why}{'; moving on' if enough else ''}")
 
+if pipeline:
+    pipeline.finish()
 
+session.close()
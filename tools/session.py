@@ -0,0 +1,86 @@
+import os
+import yaml
+
+from kubernetes import client, config
+
+import kube_utils
+
+from pod_informer import PodInformer
+
+
+class BenchmarkSession:
+    """
+    BenchmarkSession holds everything that can be shared by all the runs in
+    a sequence, rather than being rebuilt for every run: the kubeconfig, one
+    ApiClient (and so one HTTP connection pool, with its TLS connections
+    kept alive) behind all the API objects, the node list, a warm
+    Classifier, the parsed load generator Job templates, and a pod informer
+    that stays in sync between runs instead of relisting every pod.
+
+    Like ReplayCluster, it can stand in for the kubernetes client module when
+    handed to AggregateUsage, which then gets the shared API objects.
+    """
+
+    def __init__(self, context=None):
+        config.load_kube_config(context=context)
+
+        self.context = context
+        self.api_client = client.ApiClient()
+
+        self.core_v1 = client.CoreV1Api(self.api_client)
+        self.batch_v1 = client.BatchV1Api(self.api_client)
+        self.custom_objects = client.CustomObjectsApi(self.api_client)
+
+        self.classifier = kube_utils.Classifier()
+        self.templates = {}
+        self.node_list = None
+        self.pods = None
+
+    def CoreV1Api(self):
+        return self.core_v1
+
+    def BatchV1Api(self):
+        return self.batch_v1
+
+    def CustomObjectsApi(self):
+        return self.custom_objects
+
+    def job_template(self, name):
+        """
+        Return the parsed Job template for the load generator called name.
+        Callers get the shared copy, so they mustn't change it.
+        """
+        if name not in self.templates:
+            path = os.path.join(os.path.dirname(__file__), f"{name}.yaml")
+
+            with open(path) as infile:
+                self.templates[name] = yaml.safe_load(infile.read())
+
+        return self.templates[name]
+
+    def nodes(self):
+        """
+        Return the node list, fetching it the first time. The benchmark
+        clusters don't change shape during a sequence.
+        """
+        if self.node_list is None:
+            self.node_list = self.core_v1.list_node()
+
+        return self.node_list
+
+    def pod_informer(self):
+        """
+        Return the shared PodInformer, starting it the first time.
+        """
+        if self.pods is None:
+            self.pods = PodInformer(self.core_v1)
+            self.pods.start()
+
+        return self.pods
+
+    def close(self):
+        if self.pods:
+            self.pods.stop()
+            self.pods = None
+
+        self.api_client.close()
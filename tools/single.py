@@ -1,14 +1,24 @@
 #!/usr/bin/env python
 
+import copy
+import json
 import os
+import shlex
 import sys
+import threading
 import time
 import yaml
 
-from kubernetes import client, config
+from kubernetes import client, watch
 from kubernetes.utils import create_from_yaml
 
-from metrics import AggregateUsage
+import crunch_utils
+import kube_utils
+
+from idle import IdleDetector
+from pod_logs import LogCollector
+from metrics import AggregateUsage, collector_names
+from session import BenchmarkSession
 
 node_affinity_stanza = """
 requiredDuringSchedulingIgnoredDuringExecution:
@@ -33,62 +43,234 @@ preferredDuringSchedulingIgnoredDuringExecution:
     topologyKey: kubernetes.io/hostname
 """
 
+# Container waiting reasons that mean a load generator pod isn't going to
+# start without somebody stepping in.
+stuck_reasons = {
+    "CrashLoopBackOff",
+    "CreateContainerConfigError",
+    "CreateContainerError",
+    "ErrImagePull",
+    "ImagePullBackOff",
+    "InvalidImageName",
+}
+
+
+def pod_is_ready(pod):
+    for condition in (pod.status and pod.status.conditions) or []:
+        if condition.type == "Ready":
+            return condition.status == "True"
+
+    return False
+
+
+def pod_problem(pod):
+    """
+    Return why a pod is stuck, or None if it isn't (as far as we can tell).
+    """
+    for status in (pod.status and pod.status.container_statuses) or []:
+        waiting = status.state and status.state.waiting
+
+        if waiting and waiting.reason in stuck_reasons:
+            return f"{waiting.reason}: {waiting.message or ''}".strip()
+
+    return None
+
+
+def job_failure(job):
+    """
+    Return why a job failed, or None if it hasn't.
+    """
+    for condition in (job.status and job.status.conditions) or []:
+        if condition.type == "Failed" and condition.status == "True":
+            return f"{condition.reason}: {condition.message or ''}".strip()
+
+    return None
+
+
 class JobManager:
-    def __init__(self, core_v1, batch_v1, name, namespace):
-        base_job_path = os.path.join(os.path.dirname(__file__), f"{name}.yaml")
-        self.base_job = yaml.safe_load(open(base_job_path).read())
+    """
+    JobManager runs the load generator Job. Rather than polling, it follows
+    watches on the Job and its pods, so it notices the moment the Job is
+    gone, its pods are ready, or it's finished. Every change it sees is kept
+    as a structured event in events (and printed), so it's easy to tell
+    afterward where the time went.
+    """
+
+    # How long (in seconds) to wait for an old Job to be deleted, and for a
+    # new Job's pods to be ready.
+    delete_timeout = 120
+    start_timeout = 120
+
+    # How long past the requested duration to wait for the Job to finish.
+    finish_margin = 300
+
+    # Individual watches get restarted at least this often (in seconds), to
+    # keep intermediate proxies from timing them out.
+    watch_timeout = 60
+
+    def __init__(self, core_v1, batch_v1, name, namespace, follow_logs=True, compress_logs=False,
+                 base_job=None):
+        # base_job is the parsed Job template, if we're given one (e.g. by a
+        # BenchmarkSession); we never change it.
+        if base_job is None:
+            base_job_path = os.path.join(os.path.dirname(__file__), f"{name}.yaml")
+            base_job = yaml.safe_load(open(base_job_path).read())
+
+        self.base_job = base_job
 
         self.core_v1 = core_v1
         self.batch_v1 = batch_v1
         self.name = name
         self.namespace = namespace
 
+        # With follow_logs, we start streaming the load generators' logs to
+        # disk as soon as they're running.
+        self.follow_logs = follow_logs
+        self.compress_logs = compress_logs
+        self.logs = None
+
+        self.events = []
+        self.last_status = {}
+
+        # Set once the Job has finished (or failed; see watch_completion).
+        self.finished = threading.Event()
+        self.failure = None
+
+    def event(self, kind, **fields):
+        """
+        Record (and print) a lifecycle event.
+        """
+        entry = { "time": time.time(), "job": self.name, "event": kind }
+        entry.update(fields)
+        self.events.append(entry)
+
+        details = " ".join(f"{k}={v}" for k, v in fields.items())
+        print(f"...{self.name} {kind} {details}".rstrip())
+
+    def status(self, kind, **fields):
+        """
+        Record a status event, but only if it's changed since the last one of
+        the same kind.
+        """
+        if self.last_status.get(kind) != fields:
+            self.last_status[kind] = fields
+            self.event(kind, **fields)
+
+    def write_events(self, path):
+        with open(path, "w") as outfile:
+            for entry in self.events:
+                outfile.write(json.dumps(entry) + "\n")
+
+    def wait_for(self, list_func, done, timeout, what, **selector):
+        """
+        List whatever list_func (a namespaced list call) returns for
+        selector, then follow it with a watch until done(objects) is true,
+        where objects maps names to the current objects. Returns objects.
+        Raises RuntimeError if that takes longer than timeout seconds (None
+        for no timeout); done can also raise to give up early.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+
+        while True:
+            listed = list_func(namespace=self.namespace, **selector)
+            objects = { obj.metadata.name: obj for obj in listed.items }
+
+            if done(objects):
+                return objects
+
+            resource_version = listed.metadata.resource_version
+
+            try:
+                while True:
+                    watch_seconds = self.watch_timeout
+
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+
+                        if remaining <= 0:
+                            self.event("timeout", waiting_for=what, seconds=timeout)
+                            raise RuntimeError(f"{self.name} did not {what} within {timeout}s")
+
+                        watch_seconds = max(1, min(watch_seconds, int(remaining)))
+
+                    watcher = watch.Watch()
+
+                    for event in watcher.stream(list_func, namespace=self.namespace,
+                                                resource_version=resource_version,
+                                                timeout_seconds=watch_seconds, **selector):
+                        obj = event["object"]
+                        resource_version = obj.metadata.resource_version
+
+                        if event["type"] == "DELETED":
+                            objects.pop(obj.metadata.name, None)
+                        else:
+                            objects[obj.metadata.name] = obj
+
+                        if done(objects):
+                            watcher.stop()
+                            return objects
+            except client.exceptions.ApiException as e:
+                if e.status != 410:
+                    raise
+
+                # Our resourceVersion is too old, so start over with a fresh
+                # list.
+
+    def wait_for_job(self, done, timeout, what):
+        return self.wait_for(self.batch_v1.list_namespaced_job, done, timeout, what,
+                             field_selector=f"metadata.name={self.name}")
+
+    def wait_for_pods(self, done, timeout, what):
+        return self.wait_for(self.core_v1.list_namespaced_pod, done, timeout, what,
+                             label_selector=f"batch.kubernetes.io/job-name={self.name}")
+
     def delete_job(self):
         # Delete existing job
         try:
             self.batch_v1.delete_namespaced_job(name=self.name, namespace=self.namespace, propagation_policy="Foreground")
-            print("Deleted existing job")
-
-            # Wait for job to vanish
-            left = 10
-            while left > 0:
-                print(f"...waiting for {self.name} to be deleted... ({left})")
-                time.sleep(10)
-                left -= 1
-
-                some = True
-
-                try:
-                    self.batch_v1.read_namespaced_job(name=self.name, namespace=self.namespace)
-                except client.exceptions.ApiException as e:
-                    if e.status == 404:
-                        some = False
-                        break
-                    raise
-
-                if not some:
-                    break
-
-            if left == 0:
-                raise RuntimeError(f"{self.name} did not delete")
         except client.exceptions.ApiException as e:
             if e.status != 404:
                 raise
             print("No existing job to delete")
+            return
+
+        self.event("deleting")
 
-    def create_job(self, rps, duration, workers, connections, affinity):
+        # With foreground propagation, the Job itself only goes away once its
+        # pods are gone too.
+        self.wait_for_job(lambda jobs: not jobs, self.delete_timeout, "delete")
+        self.event("deleted")
+
+    def create_job(self, rps, duration, workers, connections, affinity, ramp=None):
+        """
+        Start the load generator at rps total RPS for duration. With ramp (a
+        list of total RPS values), each pod instead runs the load generator
+        once per step of the ramp, for duration each, back to back.
+        """
         podrps = int(rps) // workers
-        print(f"...starting {self.name} ({rps} RPS, {duration}, {workers} workers, {podrps} per pod)")
 
-        job = None
+        if ramp:
+            print(f"...starting {self.name} ramp ({', '.join(str(r) for r in ramp)} RPS, "
+                  f"{duration} per step, {workers} workers)")
+        else:
+            print(f"...starting {self.name} ({rps} RPS, {duration}, {workers} workers, {podrps} per pod)")
 
         if self.name == "wrk2":
-            job = self.prep_wrk2_job(podrps, duration, connections)
+            command_for = self.wrk2_command
         elif self.name == "oha":
-            job = self.prep_oha_job(podrps, duration, connections)
+            command_for = self.oha_command
         else:
             raise ValueError(f"Unknown job name: {self.name}")
 
+        if ramp:
+            command = self.ramp_command(command_for, ramp, duration, workers, connections)
+        else:
+            command = command_for(podrps, duration, connections)
+
+        # Customize the Job spec as needed
+        job = copy.deepcopy(self.base_job)
+        job["spec"]["template"]["spec"]["containers"][0]["command"] = command
+
         affinity_stanza = {}
 
         job_spec = job["spec"]
@@ -107,30 +289,36 @@ class JobManager:
         if affinity_stanza:
             job_template_spec["affinity"] = affinity_stanza
 
-        create_from_yaml(client.ApiClient(), yaml_objects=[ job ], namespace=self.namespace)
+        create_from_yaml(self.batch_v1.api_client, yaml_objects=[ job ], namespace=self.namespace)
 
-        # Wait for job to start
-        left = 10
-        while left > 0:
-            print(f"...waiting for {self.name} to start... ({left})")
-            time.sleep(10)
-            left -= 1
+        self.finished.clear()
+        self.failure = None
+        self.last_status = {}
+        self.event("created", rps=rps, duration=duration, workers=workers, ramp=ramp)
 
-            job = self.batch_v1.read_namespaced_job(name=self.name, namespace=self.namespace)
-            if job.status.ready == workers:
-                break
+        # Wait for all the job's pods to be ready, giving up right away if any
+        # of them get stuck.
+        def all_ready(pods):
+            ready = 0
 
-        if left == 0:
-            raise RuntimeError(f"{self.name} did not start")
+            for pod in pods.values():
+                problem = pod_problem(pod)
 
-        print(f"...{self.name} running")
+                if problem:
+                    self.event("stuck", pod=pod.metadata.name, problem=problem)
+                    raise RuntimeError(f"{self.name} pod {pod.metadata.name} is stuck: {problem}")
 
-    def prep_wrk2_job(self, podrps, duration, connections):
-        # Customize the Job spec as needed
-        job = self.base_job.copy()
-        job_template_spec = job["spec"]["template"]["spec"]
+                if pod_is_ready(pod):
+                    ready += 1
+
+            self.status("pods", pods=len(pods), ready=ready)
+            return ready >= workers
+
+        self.wait_for_pods(all_ready, self.start_timeout, "start")
+        self.event("running")
 
-        job_template_spec["containers"][0]["command"] = [
+    def wrk2_command(self, podrps, duration, connections):
+        return [
             "/wrk",
             "-t", "8",
             "-c", str(connections),
@@ -140,14 +328,8 @@ class JobManager:
             "http://face/",
         ]
 
-        return job
-
-    def prep_oha_job(self, podrps, duration, connections):
-        # Customize the Job spec as needed
-        job = self.base_job.copy()
-        job_template_spec = job["spec"]["template"]["spec"]
-
-        job_template_spec["containers"][0]["command"] = [
+    def oha_command(self, podrps, duration, connections):
+        return [
             "/bin/oha",
             "-c", str(connections),
             "-z", str(duration),
@@ -158,7 +340,21 @@ class JobManager:
             "http://face/",
         ]
 
-        return job
+    def ramp_command(self, command_for, ramp, duration, workers, connections):
+        """
+        Return a shell command that runs command_for once per step of ramp,
+        printing a marker line (see crunch_utils.ramp_marker) before each
+        step's output so that the log can be split up by step afterward.
+        """
+        lines = [ "set -e" ]
+
+        for step, rps in enumerate(ramp):
+            marker = crunch_utils.ramp_marker.format(step=step, rps=rps)
+
+            lines.append(f"echo {shlex.quote(marker)}")
+            lines.append(shlex.join(command_for(int(rps) // workers, duration, connections)))
+
+        return [ "/bin/sh", "-c", "\n".join(lines) ]
 
     def check_job(self, workers):
         job = self.batch_v1.read_namespaced_job(name=self.name, namespace=self.namespace)
@@ -168,91 +364,319 @@ class JobManager:
 
         return False
 
+    def watch_completion(self, workers, duration):
+        """
+        Follow the job in the background until all workers have succeeded,
+        then set finished. If the job fails, or doesn't finish within
+        finish_margin seconds past duration, finished gets set with failure
+        set to the reason.
+        """
+        try:
+            timeout = kube_utils.seconds(duration) + self.finish_margin
+        except ValueError:
+            timeout = None
+
+        def complete(jobs):
+            job = jobs.get(self.name)
+
+            if job is None:
+                raise RuntimeError(f"{self.name} disappeared while running")
+
+            job_status = job.status
+
+            self.status("status", active=job_status.active or 0,
+                        succeeded=job_status.succeeded or 0,
+                        failed=job_status.failed or 0)
+
+            failure = job_failure(job)
+
+            if failure:
+                raise RuntimeError(f"{self.name} failed: {failure}")
+
+            return (job_status.succeeded or 0) >= workers
+
+        def follow():
+            try:
+                self.wait_for_job(complete, timeout, "finish")
+                self.event("finished")
+            except Exception as e:
+                self.failure = e
+                self.event("failed", error=str(e))
+            finally:
+                self.finished.set()
+
+        threading.Thread(target=follow, name=f"{self.name}-watch", daemon=True).start()
+
+    def wait_finished(self, timeout):
+        """
+        Wait up to timeout seconds for the job to finish, returning whether
+        it has. Raises whatever went wrong if the job failed.
+        """
+        if not self.finished.wait(timeout):
+            return False
+
+        if self.failure:
+            raise self.failure
+
+        return True
+
+    def log_collector(self, outdir, rps, seq):
+        if self.logs is None:
+            self.logs = LogCollector(self.core_v1, self.namespace,
+                                     f"batch.kubernetes.io/job-name={self.name}",
+                                     os.path.join(outdir, f"{rps}-{seq}"),
+                                     compress=self.compress_logs)
+
+        return self.logs
+
+    def stream_logs(self, outdir, rps, seq):
+        """
+        Start streaming logs from the job's pods to disk (if we're following
+        logs at all).
+        """
+        if self.follow_logs:
+            self.log_collector(outdir, rps, seq).follow()
+            self.event("streaming logs")
+
     def collect_logs(self, outdir, rps, seq):
         print("...collecting logs...")
 
-        # Collect logs
-        pods = self.core_v1.list_namespaced_pod(namespace=self.namespace,
-                                        label_selector=f"batch.kubernetes.io/job-name={self.name}")
+        paths = self.log_collector(outdir, rps, seq).finish()
+        self.logs = None
+
+        self.event("logs collected", pods=len(paths))
+
+
+class SingleRun:
+    """
+    SingleRun is one load pass, broken up into its phases so that a sequence
+    runner can overlap them (see pipeline.py):
+
+    - setup(): create the output directory, AggregateUsage, and JobManager
+    - wait_for_idle(): sample until Faces is idle and we start collecting
+    - load(): run the load generator Job, sampling until it finishes (with
+      ramp, stepping through each RPS in ramp for step_duration each, and
+      tagging every sample with the step it came from)
+    - drain(): keep sampling for a bit, since metrics lag realtime
+    - teardown(): finish the output files, collect logs, and delete the Job
+
+    Everything through drain() needs the cluster to itself; teardown() only
+    touches the cluster to read logs and delete the Job, so it can run in the
+    background while the next run waits for idle, as long as the next run
+    doesn't create its Job until teardown() is done.
+    """
+
+    # In ramp mode, samples from the first step_settle seconds of each step
+    # aren't tagged with the step.
+    step_settle = 30
+
+    def __init__(self, outdir, rps, seq, duration, loadgen, workers, connections, affinity,
+                 binary=False, collector="metrics-server", record=False, follow_logs=True,
+                 compress_logs=False, ramp=None, step_duration="300s", idle_window=4,
+                 idle_tolerance=0.05, session=None, context=None):
+        self.outdir = outdir
+        self.rps = rps
+        self.seq = seq
+        self.duration = duration
+        self.loadgen = loadgen
+        self.workers = workers
+        self.connections = connections
+        self.affinity = affinity
+        self.binary = binary
+        self.collector = collector
+        self.record = record
+        self.follow_logs = follow_logs
+        self.compress_logs = compress_logs
+        self.ramp = ramp
+        self.step_duration = step_duration
+        self.idle_window = idle_window
+        self.idle_tolerance = idle_tolerance
+
+        # Shared API clients, node list, etc. (see session.py). Without one,
+        # setup() makes a session for context just for this run.
+        self.session = session
+        self.context = context
+        self.owns_session = False
+
+        self.agg = None
+        self.job_manager = None
+
+    def setup(self):
+        self.owns_session = self.session is None
+
+        if self.owns_session:
+            self.session = BenchmarkSession(self.context)
+
+        session = self.session
+
+        # Create job manager
+        self.job_manager = JobManager(session.core_v1, session.batch_v1, self.loadgen, "faces",
+                                      follow_logs=self.follow_logs,
+                                      compress_logs=self.compress_logs,
+                                      base_job=session.job_template(self.loadgen))
+
+        try:
+            os.makedirs(self.outdir, exist_ok=True)
+        except OSError as e:
+            print(f"Error creating output directory {self.outdir}: {e}")
+            sys.exit(1)
 
-        for _, pod in enumerate(pods.items, start=1):
-            pod_name = pod.metadata.name
-            print(f"...collecting logs from {pod_name}...")
-            log = self.core_v1.read_namespaced_pod_log(name=pod_name, namespace=self.namespace)
+        outfile = os.path.join(self.outdir, f"{self.rps}-{self.seq}-metrics.csv")
 
-            with open(f"{outdir}/{rps}-{seq}-{pod_name}.log", "w") as f:
-                f.write(log)
+        # What the collector itself costs, per sample.
+        overheadfile = os.path.join(self.outdir, f"{self.rps}-{self.seq}-collector.csv")
 
+        binfile = None
 
-def run(outdir, rps, seq, duration, loadgen, workers, connections, affinity):
-    config.load_kube_config()
-    core_v1 = client.CoreV1Api()
-    batch_v1 = client.BatchV1Api()
+        if self.binary:
+            binfile = os.path.join(self.outdir, f"{self.rps}-{self.seq}-metrics.col")
 
-    # Create job manager
-    job_manager = JobManager(core_v1, batch_v1, loadgen, "faces")
+        recfile = None
 
-    try:
-        os.makedirs(outdir, exist_ok=True)
-    except OSError as e:
-        print(f"Error creating output directory {outdir}: {e}")
-        sys.exit(1)
+        if self.record:
+            recfile = os.path.join(self.outdir, f"{self.rps}-{self.seq}-raw.jsonl.gz")
 
-    outfile = os.path.join(outdir, f"{rps}-{seq}-metrics.csv")
+        # A recording needs every pod list and event the collector sees, so
+        # recorded runs get an informer of their own rather than the shared
+        # one.
+        pods = None if self.record else session.pod_informer()
 
-    agg = AggregateUsage(client, outfile)
+        self.agg = AggregateUsage(session, outfile, binary_path=binfile, collector=self.collector,
+                                  record_path=recfile, overhead_path=overheadfile,
+                                  steps=bool(self.ramp),
+                                  idle=IdleDetector(window=self.idle_window,
+                                                    tolerance=self.idle_tolerance),
+                                  pods=pods, node_list=session.nodes(),
+                                  classifier=session.classifier)
 
-    # Delete existing job
-    job_manager.delete_job()
+    def wait_for_idle(self):
+        agg = self.agg
+
+        print(f"Starting {self.outdir} {self.rps}-{self.seq}... ({self.duration}, worker count {self.workers})")
+
+        # Grab samples until we see that the application has idled...
+
+        while True:
+            agg.sample(True)
 
-    print(f"Starting {outdir} {rps}-{seq}... ({duration}, worker count {workers})")
+            # Check if the aggregator has started collecting...
+            if agg.is_collecting():
+                print("...started collecting")
+                break
+
+            time.sleep(agg.poll_period())
+
+    def load(self):
+        agg = self.agg
+        job_manager = self.job_manager
 
-    # Grab samples until we see that the application has idled...
+        # Create job
+        if self.ramp:
+            step_seconds = kube_utils.seconds(self.step_duration)
+            duration = f"{int(round(step_seconds * len(self.ramp)))}s"
 
-    while True:
-        agg.sample(True)
+            job_manager.create_job(self.rps, self.step_duration, self.workers, self.connections,
+                                   self.affinity, ramp=self.ramp)
+        else:
+            duration = self.duration
+            job_manager.create_job(self.rps, self.duration, self.workers, self.connections, self.affinity)
 
-        # Check if the aggregator has started collecting...
-        if agg.is_collecting():
-            print("...started collecting")
-            break
+        job_manager.watch_completion(self.workers, duration)
+        job_manager.stream_logs(self.outdir, self.rps, self.seq)
 
-        time.sleep(10)
+        started = time.monotonic()
 
-    # Create job
-    job_manager.create_job(rps, duration, workers, connections, affinity)
+        # Grab samples until our job is finished (which we'll hear about the
+        # moment it happens, rather than at the next sample)...
+        while True:
+            if self.ramp:
+                self.track_step(time.monotonic() - started, step_seconds)
 
-    # Grab samples until our job is finished...
-    while True:
-        agg.sample(True)
-        time.sleep(10)
+            agg.sample(True)
 
-        if job_manager.check_job(workers):
-            print("...run finished")
-            break
+            if job_manager.wait_finished(agg.poll_period()):
+                print("...run finished")
+                break
 
-    # Collect 6 more samples, since they can lag realtime. Stop
-    # early if Faces goes idle again.
-    print("...collecting tail metrics")
-    agg.start_draining()
+        if self.ramp:
+            agg.set_step(None)
+
+    def track_step(self, elapsed, step_seconds):
+        """
+        Tell the aggregator which step of the ramp is running, elapsed
+        seconds into the run. We work that out from the clock rather than
+        from the logs; each step's load generator takes a moment to start,
+        so the steps drift later by a fraction of a second each, which
+        step_settle more than covers.
+        """
+        step = int(elapsed // step_seconds)
+
+        if step >= len(self.ramp):
+            self.agg.set_step(None)
+        elif elapsed - step * step_seconds < self.step_settle:
+            # Usage lags the load by up to a metrics window, so the first
+            # samples of a step still show some of the previous step.
+            self.agg.set_step(None)
+        else:
+            self.agg.set_step(step, self.ramp[step])
 
-    for _ in range(6):
-        agg.sample(True)
+    def drain(self):
+        agg = self.agg
 
-        if agg.is_idle():
-            print("...idle again, stopping")
-            break
+        # Collect another 60 seconds of samples, since they can lag realtime.
+        # Stop early if Faces goes idle again.
+        print("...collecting tail metrics")
+        agg.start_draining()
 
-        time.sleep(10)
+        drain_until = time.monotonic() + 60
 
-    # Stop collecting metrics...
-    agg.stop_collecting()
+        while time.monotonic() < drain_until:
+            agg.sample(True)
 
-    # Collect logs
-    job_manager.collect_logs(outdir, rps, seq)
+            if agg.is_idle():
+                print("...idle again, stopping")
+                break
+
+            time.sleep(agg.poll_period())
+
+    def teardown(self):
+        # Stop collecting metrics...
+        self.agg.close()
+
+        # Collect logs
+        self.job_manager.collect_logs(self.outdir, self.rps, self.seq)
 
-    # Delete job
-    job_manager.delete_job()
+        # Delete job
+        self.job_manager.delete_job()
+
+        self.job_manager.write_events(os.path.join(self.outdir, f"{self.rps}-{self.seq}-job.jsonl"))
+
+        # If we made our own session, nobody else is going to clean it up.
+        if self.owns_session:
+            self.session.close()
+            self.session = None
+
+
+def run(outdir, rps, seq, duration, loadgen, workers, connections, affinity, binary=False,
+        collector="metrics-server", record=False, follow_logs=True, compress_logs=False,
+        context=None, ramp=None, step_duration="300s", idle_window=4, idle_tolerance=0.05,
+        session=None):
+    single_run = SingleRun(outdir, rps, seq, duration, loadgen, workers, connections, affinity,
+                           binary=binary, collector=collector, record=record,
+                           follow_logs=follow_logs, compress_logs=compress_logs,
+                           ramp=ramp, step_duration=step_duration,
+                           idle_window=idle_window, idle_tolerance=idle_tolerance,
+                           session=session, context=context)
+
+    single_run.setup()
+
+    # Delete existing job
+    single_run.job_manager.delete_job()
+
+    single_run.wait_for_idle()
+    single_run.load()
+    single_run.drain()
+    single_run.teardown()
 
 
 if __name__ == "__main__":
@@ -265,10 +689,30 @@ if __name__ == "__main__":
     parser.add_argument("--outdir", type=str, default=".", help="Output directory (default: current directory)")
     parser.add_argument("--loadgen", type=str, default="oha", help="Load generator (default: oha)")
     parser.add_argument("--connections", type=int, default=200, help="Connections to maintain (default: 200)")
+    parser.add_argument("--binary", action="store_true", help="Also write metrics in binary columnar form (default: off)")
+    parser.add_argument("--collector", type=str, default="metrics-server", choices=collector_names,
+                        help="Where to get usage from: the metrics API or the kubelet Summary API (default: metrics-server)")
+    parser.add_argument("--record", action="store_true", help="Record raw API responses for replay (default: off)")
+    parser.add_argument("--no-follow-logs", action="store_true", help="Only download load generator logs after the run, rather than streaming them during it (default: stream)")
+    parser.add_argument("--gzip-logs", action="store_true", help="Gzip load generator logs (default: off)")
+    parser.add_argument("--context", type=str, default=None, help="Kubeconfig context to use (default: current context)")
+    parser.add_argument("--ramp", type=str, default=None, help="Comma-separated RPS list to step through in one Job, instead of a single RPS (default: off)")
+    parser.add_argument("--step-duration", type=str, default="300s", help="Duration of each --ramp step (default: 300s)")
+    parser.add_argument("--idle-window", type=int, default=4, help="Fresh samples that have to be steady before the cluster counts as idle (default: 4)")
+    parser.add_argument("--idle-tolerance", type=float, default=0.05, help="How steady the cluster has to be to count as idle, as a fraction of usage (default: 0.05)")
     parser.add_argument("rps", type=int, help="Requests per second")
     parser.add_argument("seq", type=int, help="Sequence number")
 
     args = parser.parse_args()
 
+    ramp = None
+
+    if args.ramp:
+        ramp = [int(rps) for rps in args.ramp.split(",")]
+
     run(args.outdir, args.rps, args.seq, args.duration,
-        args.loadgen, args.workers, args.connections, args.affinity)
+        args.loadgen, args.workers, args.connections, args.affinity,
+        binary=args.binary, collector=args.collector, record=args.record,
+        follow_logs=not args.no_follow_logs, compress_logs=args.gzip_logs,
+        context=args.context, ramp=ramp, step_duration=args.step_duration,
+        idle_window=args.idle_window, idle_tolerance=args.idle_tolerance)
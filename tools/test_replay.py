@@ -0,0 +1,47 @@
+import filecmp
+import itertools
+
+from kubernetes import client
+
+import fake_cluster
+import replay
+
+from metrics import AggregateUsage
+
+
+def test_replay_matches_recording(tmp_path):
+    # Record a few samples from a fake cluster, then replay them: the
+    # replayed CSV should be the recorded one exactly, timestamps and all.
+    # The clock moves on a quarter of a second every time it's read, so that
+    # request and response times that are off by one read show up even
+    # after they've been rounded to the millisecond.
+    ticks = itertools.count(1700000000.0, 0.25)
+
+    server = fake_cluster.FakeAPIServer(fake_cluster.FakeCluster(nodes=2, pods_per_node=3,
+                                                                 scrape_interval=0))
+    server.start()
+
+    recorded = tmp_path / "recorded.csv"
+    replayed = tmp_path / "replayed.csv"
+    recording = tmp_path / "recording.jsonl.gz"
+
+    try:
+        configuration = client.Configuration()
+        configuration.host = server.url
+        client.Configuration.set_default(configuration)
+
+        agg = AggregateUsage(client, str(recorded), record_path=str(recording),
+                             clock=lambda: next(ticks))
+        agg.start_collecting()
+
+        for _ in range(5):
+            agg.sample()
+
+        agg.close()
+    finally:
+        server.stop()
+
+    count, _ = replay.replay(str(recording), str(replayed))
+
+    assert count == 5
+    assert filecmp.cmp(recorded, replayed, shallow=False)